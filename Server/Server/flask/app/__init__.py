@@ -15,7 +15,7 @@ from datetime import timedelta
 
 
 # --- Flask and Extensions ---
-from flask import Flask, jsonify, current_app, g, request# g can be used for request context storage
+from flask import Flask, jsonify, current_app, g, request, has_request_context # g can be used for request context storage
 from dotenv import load_dotenv
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
@@ -24,9 +24,12 @@ from flask_jwt_extended import JWTManager
 import gevent # For scopefunc with scoped_session
 
 # --- Database ---
+from sqlalchemy import event
 from sqlalchemy.orm import scoped_session
-from app.db_man.pqsql.database import SessionLocal, engine as db_engine, create_db_and_tables
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.db_man.pqsql.database import SessionLocal, engine as db_engine, create_db_and_tables, get_pool_status, record_pool_timeout
 from app.db_man.pqsql.models import Base, JwtBlocklist
+from app.cache.jwt_revocation import is_token_revoked
 
 # --- Redis ---
 import redis
@@ -39,6 +42,26 @@ from .dep_lib import limiter
 DbRequestSession = scoped_session(SessionLocal, scopefunc=gevent.getcurrent)
 logging.debug("DbRequestSession (scoped) configured with gevent scopefunc.")
 
+
+# Marks requests whose session committed changes (used for cache invalidation)
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_flushed_changes(session, flush_context):
+    session.info['has_changes'] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_changes'] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _flag_committed_changes(session):
+    if session.info.pop('has_changes', False) and has_request_context():
+        g.db_changes_committed = True
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _clear_changes(session):
+    session.info.pop('has_changes', None)
+
 def create_app(test_config: str = None) -> object:
     """
     Creates App object
@@ -114,23 +137,16 @@ def create_app(test_config: str = None) -> object:
     @jwt.token_in_blocklist_loader
     def check_if_token_is_revoked(jwt_header, jwt_payload):
         """
-        Callback function to check if a JWT exists in the database blocklist.
+        Callback function to check if a JWT is revoked.
         Returns True if the token is revoked (blocklisted), False otherwise.
-        - Short description
+        - Revocation cache (app/cache/jwt_revocation.py) answers without DB when it can
         """
         jti = jwt_payload['jti']
         logging.debug(f"Checking blocklist for jti: {jti}")
-        db = None # Initialize db to None
         try:
-            db = DbRequestSession() # Get request-scoped session
-            # Query the blocklist table using the jti
-            token_in_db = db.query(JwtBlocklist.id).filter_by(jti=jti).scalar() is not None
-            if token_in_db:
-                logging.debug(f"Token {jti} IS in blocklist.")
-                return True # Token is blocklisted
-            else:
-                logging.debug(f"Token {jti} is NOT in blocklist.")
-                return False # Token is not blocklisted
+            revoked = is_token_revoked(app.redis_client, DbRequestSession(), jti)
+            logging.debug(f"Token {jti} {'IS' if revoked else 'is NOT'} in blocklist.")
+            return revoked
         except Exception as e:
             # --- CRITICAL: Error Handling ---
             logging.error(f"Blocklist check failed for jti {jti} due to DB error: {e}", exc_info=True)
@@ -153,6 +169,17 @@ def create_app(test_config: str = None) -> object:
         app.redis_pool = None
         app.redis_client = None # Ensure it's None if connection failed
 
+    # Public /sapi/beehives snapshot is rebuilt after any change of groups, sensors or tags
+    from app.cache.database_caching import invalidate_beehives_snapshot
+    SNAPSHOT_BLUEPRINTS = {'groups', 'sensorhubs', 'tags', 'hub_management'}
+
+    @app.after_request
+    def invalidate_public_snapshot(response):
+        # Most reads of these blueprints are POST, so only requests which committed changes count
+        if g.pop('db_changes_committed', False) and request.blueprint in SNAPSHOT_BLUEPRINTS and response.status_code < 400:
+            invalidate_beehives_snapshot(app.redis_client)
+        return response
+
     # === 3. Configure Database Session Scope (as before) ===
     @app.teardown_appcontext
     def shutdown_session(exception=None):
@@ -170,6 +197,7 @@ def create_app(test_config: str = None) -> object:
     from app.access.groups import groups_bp
     from app.access.rules import rules_bp
     from app.access.schedules import schedules_bp
+    from app.access.export import export_bp
     from app.sapi import bp
     from app.sse import sse_bp
 
@@ -183,6 +211,7 @@ def create_app(test_config: str = None) -> object:
     app.register_blueprint(groups_bp, url_prefix='/access/groups') 
     app.register_blueprint(rules_bp, url_prefix='/access/rules') #
     app.register_blueprint(schedules_bp)
+    app.register_blueprint(export_bp, url_prefix='/access/export')
     app.register_blueprint(bp, url_prefix='/sapi')
     
     app.register_blueprint(sse_bp)
@@ -193,8 +222,24 @@ def create_app(test_config: str = None) -> object:
         logging.warning(f"404 Not Found: {request.url}")
         return jsonify({"error": "Not Found", "message": error.description}), 404
 
+    def _pool_exhausted_response():
+        DbRequestSession.remove()
+        record_pool_timeout()
+        logging.error(f"Database connection pool exhausted on {request.path}: {get_pool_status()}")
+        return jsonify({"error": "Service Unavailable", "message": "Database is busy, try again later."}), 503
+
+    @app.errorhandler(PoolTimeoutError)
+    def pool_timeout_error(error):
+        return _pool_exhausted_response()
+
     @app.errorhandler(500)
     def internal_error(error):
+        # Routes catch SQLAlchemyError and abort(500), pool timeout stays in exception context
+        cause = getattr(error, "original_exception", None) or error.__context__
+        while cause is not None:
+            if isinstance(cause, PoolTimeoutError):
+                return _pool_exhausted_response()
+            cause = cause.__context__
         DbRequestSession.remove()
         logging.error(f"500 Internal Server Error: {error}", exc_info=True)
         return jsonify({"error": "Internal Server Error", "message": "An unexpected error occurred."}), 500
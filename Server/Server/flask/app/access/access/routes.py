@@ -5,9 +5,10 @@
 ########################################################
 
 import logging
+from datetime import datetime, timezone
 
 
-from flask import Flask, render_template, request, json, jsonify, Response, flash, request, redirect, abort
+from flask import Flask, render_template, request, json, jsonify, Response, flash, request, redirect, abort, current_app
 from sqlalchemy.exc import SQLAlchemyError
 
 from flask_jwt_extended import create_access_token
@@ -21,6 +22,7 @@ from flask_jwt_extended import create_refresh_token
 from app.access.access import access_bp
 
 from app.db_man.pqsql.models import JwtBlocklist
+from app.cache.jwt_revocation import revoke_token
 from app.helpers.api import _validate_user_credentials
 from app import DbRequestSession
 
@@ -79,6 +81,7 @@ def logout():
     try:
         jwt_data = get_jwt()
         jti = jwt_data["jti"]
+        exp = jwt_data["exp"]
         token_type = jwt_data["type"] # 'access' or 'refresh'
         identity = get_jwt_identity() # Get user identity from token
         logging.debug(f"Attempting to revoke token: Type='{token_type}', JTI='{jti}', Identity='{identity}'")
@@ -99,9 +102,11 @@ def logout():
 
         # Add JTI to blocklist database table
         # created_at is handled by default in the model/DB
-        new_blocked_token = JwtBlocklist(jti=jti)
+        new_blocked_token = JwtBlocklist(jti=jti, expires_at=datetime.fromtimestamp(exp, tz=timezone.utc))
         db.add(new_blocked_token)
         db.commit()
+        # Revocation cache of all workers (checked by token_in_blocklist_loader)
+        revoke_token(current_app.redis_client, jti, exp)
         logging.info(f"Successfully added token to blocklist: JTI='{jti}'")
 
         response = jsonify({"msg": f"{token_type.capitalize()} token successfully revoked"})
@@ -27,6 +27,10 @@ from app import DbRequestSession # Assuming DbRequestSession is in app's root __
 
 # --- IMPORT CACHE INVALIDATION FUNCTION ---
 from app.cache.database_caching import invalidate_server_config_cache # Adjust path if needed
+from app.db_man.pqsql.database import get_pool_status, replica_engine
+from app.db_man.pqsql.replica import get_replica_status
+from app.cache.jwt_revocation import get_revocation_status
+from app.cache.local_cache import get_local_cache_stats
 # ----------------------------------------
 
 
@@ -232,6 +236,23 @@ def get_config():
         abort(500, description="An unexpected error occurred retrieving server configuration.")
 
 
+@server_config_bp.route('/diagnostics', methods=['GET'])
+@jwt_required()
+def get_diagnostics():
+    """Returns connection pool usage, flux query timings, JWT revocation and local cache state of the worker process serving the request."""
+    logging.info(f"Request received for GET {server_config_bp.url_prefix}/diagnostics")
+    response: Dict[str, Any] = {"pid": os.getpid(), "postgresPool": get_pool_status(), "replica": None, "fluxQueries": None,
+                                "jwtRevocation": get_revocation_status(), "localCaches": get_local_cache_stats()}
+    if replica_engine is not None:
+        response["replica"] = get_replica_status()
+    try:
+        from app.db_man.influxdb.query_builder import get_query_timings
+        response["fluxQueries"] = get_query_timings()
+    except ImportError as e:
+        logging.warning(f"Flux query timings unavailable: {e}")
+    return jsonify(response), 200
+
+
 # Corrected route path relative to blueprint prefix '/access/config'
 @server_config_bp.route('/update_config', methods=['POST'])
 @jwt_required()
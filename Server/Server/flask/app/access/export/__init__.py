@@ -0,0 +1,8 @@
+# app/access/export/__init__.py
+from flask import Blueprint
+
+# Define the blueprint object
+export_bp = Blueprint('export', __name__)
+
+# Import routes after blueprint definition to avoid circular imports
+from . import routes
@@ -0,0 +1,147 @@
+# app/access/export/routes.py
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+
+from flask import jsonify, abort, request, current_app, send_file, url_for
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from flask_jwt_extended import jwt_required
+import redis
+
+from . import export_bp
+
+from app.db_man.pqsql.models import Group
+from app import DbRequestSession
+from app.services.export_service import (
+    EXPORT_FORMATS,
+    EXPORT_MAX_RANGE_DAYS,
+    export_available,
+    create_export_job,
+    get_export_job,
+    export_file_path,
+)
+
+
+def _parse_datetime(value: str, field: str) -> datetime:
+    """Parses ISO datetime from request, naive values are treated as UTC."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        abort(400, description=f"Invalid '{field}' format, expected ISO 8601 datetime.")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _format_job(job: dict) -> dict:
+    response = {
+        "id": job.get("id"),
+        "status": job.get("status"),
+        "format": job.get("format"),
+        "groupId": job.get("group_id") or None,
+        "start": job.get("start"),
+        "end": job.get("stop"),
+        "progress": int(job.get("progress", 0)),
+        "rows": int(job.get("rows", 0)),
+        "error": job.get("error"),
+        "downloadUrl": None,
+    }
+    if job.get("status") == "finished":
+        response["downloadUrl"] = url_for('export.download_export', job_id=job.get("id"))
+    return response
+
+
+@export_bp.route('/create', methods=['POST'])
+@jwt_required()
+def create_export():
+    """
+    Creates export job of sensor data, export runs in celery.
+    Body: {"start": ISO, "end": ISO (optional, default now), "format": "parquet"|"arrow", "groupId": optional}
+    """
+    logging.info(f"Request received for POST {export_bp.name}.create")
+    if not export_available():
+        abort(503, description="Data export is unavailable (pyarrow is not installed).")
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Data export is unavailable (redis is not connected).")
+
+    data = request.get_json() or {}
+    if not data.get('start'):
+        abort(400, description="Missing required field: 'start'.")
+    start = _parse_datetime(data['start'], 'start')
+    stop = _parse_datetime(data['end'], 'end') if data.get('end') else datetime.now(timezone.utc)
+    if stop <= start:
+        abort(400, description="'end' must be after 'start'.")
+    if stop - start > timedelta(days=EXPORT_MAX_RANGE_DAYS):
+        abort(400, description=f"Export range is limited to {EXPORT_MAX_RANGE_DAYS} days.")
+
+    export_format = str(data.get('format', 'parquet')).lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=f"Invalid format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}.")
+
+    group_id = data.get('groupId')
+    if group_id:
+        db: Session = DbRequestSession()
+        try:
+            if db.query(Group.id).filter(Group.id == group_id).scalar() is None:
+                abort(404, description=f"Group '{group_id}' not found.")
+        except SQLAlchemyError as e:
+            logging.error(f"Database error checking group '{group_id}' for export: {e}", exc_info=True)
+            abort(500, description="Failed to create export job.")
+
+    try:
+        job_id = create_export_job(rc, start, stop, export_format, group_id)
+        # Imported here, so web workers load celery app only when export is used
+        from app.background_worker.tasks import run_data_export
+        run_data_export.delay(job_id)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error creating export job: {e}", exc_info=True)
+        abort(500, description="Failed to create export job.")
+    except Exception as e:
+        logging.error(f"Unexpected error creating export job: {e}", exc_info=True)
+        abort(500, description="An unexpected error occurred while creating export job.")
+
+    logging.info(f"Export job {job_id} queued ({export_format}, {start} - {stop}, group: {group_id})")
+    return jsonify(_format_job(get_export_job(rc, job_id) or {"id": job_id, "status": "queued"})), 202
+
+
+@export_bp.route('/status/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_export_status(job_id: str):
+    """Returns state of export job, downloadUrl is set when the job is finished."""
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Data export is unavailable (redis is not connected).")
+    try:
+        job = get_export_job(rc, job_id)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading export job {job_id}: {e}", exc_info=True)
+        abort(500, description="Failed to read export job.")
+    if not job:
+        abort(404, description=f"Export job '{job_id}' not found.")
+    return jsonify(_format_job(job)), 200
+
+
+@export_bp.route('/download/<string:job_id>', methods=['GET'])
+@jwt_required()
+def download_export(job_id: str):
+    """Sends file of finished export job."""
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Data export is unavailable (redis is not connected).")
+    try:
+        job = get_export_job(rc, job_id)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading export job {job_id}: {e}", exc_info=True)
+        abort(500, description="Failed to read export job.")
+    if not job:
+        abort(404, description=f"Export job '{job_id}' not found.")
+    if job.get("status") != "finished":
+        abort(409, description=f"Export job '{job_id}' is not finished (status: {job.get('status')}).")
+
+    path = export_file_path(job["id"], job["format"])
+    if not os.path.isfile(path):
+        abort(410, description=f"Export file of job '{job_id}' is no longer available.")
+    mimetype = "application/vnd.apache.parquet" if job["format"] == "parquet" else "application/vnd.apache.arrow.file"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=os.path.basename(path))
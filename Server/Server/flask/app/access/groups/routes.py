@@ -1,14 +1,13 @@
 # app/groups/routes.py
 import logging
-import re
 import uuid
 from collections import defaultdict # Import defaultdict
 from datetime import date, datetime, timezone
 from decimal import Decimal
 from flask import jsonify, abort, request, current_app
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.orm import selectinload, joinedload, Session, raiseload # Import Session for type hint
-from sqlalchemy import desc, or_, Column # Import Column for checking
+from sqlalchemy.orm import selectinload, joinedload, Session, raiseload, load_only # Import Session for type hint
+from sqlalchemy import desc, or_, Column, func # Import Column for checking
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 # Import the blueprint object
@@ -21,10 +20,13 @@ from app.db_man.pqsql.models import Group, Sensor, Rule, RuleSet, Tag, GroupEven
 
 # Import the request-scoped session factory
 from app import DbRequestSession
+from app.db_man.pqsql.replica import read_replica
 
 # Import cache invalidation & services
-from app.cache.database_caching import invalidate_group_rules_cache
+from app.cache.database_caching import invalidate_group_rules_cache, invalidate_group_tags_cache
+from app.cache.group_state import invalidate_group_state
 from app.services.inventory_service import invalidate_inventory_cache
+from app.engines.event_engine.event_tracker import flush_events
 
 
 # --- InfluxDB Client (Conditional Import) ---
@@ -39,6 +41,7 @@ try:
     INFLUX_CONFIGURED = all([INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET])
     if not INFLUX_CONFIGURED:
         logging.warning("InfluxDB environment variables not fully configured. Sensor history route will be unavailable.")
+    from app.db_man.influxdb.query_builder import run_query, range_start, validate_identifier, is_relative_range
 except ImportError:
     logging.warning("influxdb-client library not installed. Sensor history route will be unavailable.")
     InfluxDBClient = None # type: ignore
@@ -50,6 +53,44 @@ except ImportError:
 from app.helpers.formatters import _generate_group_id, _format_group_response, _format_sensor_response, _format_action
 from app.helpers.formatters import _format_initiator, _format_rule_response, _format_event_response, _format_group_list_item
 from app.helpers.formatters import _format_group_detail_response
+from app.helpers.pagination import parse_page_params, paginate_query, pick_fields, PageParams
+
+
+# --- Pagination / field selection of list routes ---
+# API field -> column needed to build it (relationship fields are loaded separately)
+GROUP_LIST_COLUMNS = {
+    "id": Group.id, "name": Group.name, "type": Group.type, "description": Group.description,
+    "parentId": Group.parent_id, "inspectionDate": Group.last_inspection, "location": Group.location,
+    "automatic_mode": Group.automatic_mode, "mode": Group.mode, "health": Group.health,
+    "beehive_type": Group.beehive_type, "is_main": Group.is_main,
+}
+GROUP_LIST_RELATIONSHIPS = {
+    "sensors": (Group.sensors, Sensor.id), "rules": (Group.rules, Rule.id),
+    "ruleSets": (Group.rule_sets, RuleSet.id), "tags": (Group.tags, Tag.id),
+}
+GROUP_LIST_FIELDS = set(GROUP_LIST_COLUMNS) | set(GROUP_LIST_RELATIONSHIPS) | {"subgroups"}
+SENSOR_LIST_FIELDS = {"id", "name", "type", "location", "status", "assignedGroupId"}
+RULE_LIST_FIELDS = {"id", "name", "description", "initiators", "logicalOperator", "actions", "action",
+                    "actionParams", "isActive", "ruleSet", "priority"}
+EVENT_FIELDS = {"id", "event_date", "event_type", "description", "event_ref_id", "group_id"}
+
+
+def _page_params(data: dict, allowed_fields, cursor_parsers=None) -> PageParams:
+    """Reads pagination params of request, invalid params are 400."""
+    try:
+        return parse_page_params(data or {}, allowed_fields, cursor_parsers)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+
+def _page_response(key: str, items: list, page: PageParams, next_cursor, total_query=None) -> dict:
+    """Wraps list, pagination keys are added only for paginated requests."""
+    response = {key: items}
+    if page.paginated:
+        response["nextCursor"] = next_cursor
+        # Count only when asked and on first page, it doesn't change while client pages
+        response["total"] = total_query.scalar() if total_query is not None and page.with_total and page.cursor is None else None
+    return response
 
 
 
@@ -60,38 +101,47 @@ def log_request():
 
 @groups_bp.route('/list', methods=['POST'])
 @jwt_required()
+@read_replica
 def list_groups():
-    """Lists all groups, including their subgroup IDs."""
+    """Lists all groups, including their subgroup IDs. Supports limit/cursor/fields (app/helpers/pagination.py)."""
     logging.info(f"Request received for POST {groups_bp.name}.list")
     db: Session = DbRequestSession()
+    page = _page_params(request.get_json(silent=True), GROUP_LIST_FIELDS)
+    fields = page.fields or GROUP_LIST_FIELDS
     try:
         # Load only necessary scalar fields + FKs for relationships
         # Avoid loading full related objects for the list view
-        groups_orm = db.query(Group).options(
+        columns = {Group.id, Group.name} | {column for field, column in GROUP_LIST_COLUMNS.items() if field in fields}
+        options = [
             # Use raiseload('*') to prevent accidental loading of full relationships
             # This ensures only explicitly loaded columns/relationships are accessed
             raiseload('*', sql_only=True),
-            # Selectively load only attributes needed by _format_group_list_item
-            selectinload(Group.sensors).load_only(Sensor.id),
-            selectinload(Group.rules).load_only(Rule.id),
-            selectinload(Group.rule_sets).load_only(RuleSet.id),
-            selectinload(Group.tags).load_only(Tag.id),
-        ).order_by(Group.name).all()
-
-        if not groups_orm: return jsonify({"groups": []}), 200
+            load_only(*columns),
+        ]
+        # Selectively load only relationships needed by _format_group_list_item
+        for field, (relationship, related_id) in GROUP_LIST_RELATIONSHIPS.items():
+            if field in fields:
+                options.append(selectinload(relationship).load_only(related_id))
+
+        groups_orm, next_cursor = paginate_query(
+            db.query(Group).options(*options), (Group.name, Group.id), page,
+            key=lambda group: (group.name, group.id),
+        )
 
-        group_ids = [group.id for group in groups_orm]
-        subgroup_links = db.query(Group.id, Group.parent_id).filter(Group.parent_id.in_(group_ids)).all()
+        if not groups_orm: return jsonify(_page_response("groups", [], page, None, db.query(func.count(Group.id)))), 200
 
         subgroup_map = defaultdict(list)
-        for child_id, parent_id in subgroup_links:
-            if parent_id: subgroup_map[parent_id].append(child_id)
+        if "subgroups" in fields:
+            group_ids = [group.id for group in groups_orm]
+            subgroup_links = db.query(Group.id, Group.parent_id).filter(Group.parent_id.in_(group_ids)).all()
+            for child_id, parent_id in subgroup_links:
+                if parent_id: subgroup_map[parent_id].append(child_id)
 
         # Use the LIST formatter here
-        groups_list = [_format_group_list_item(group, subgroup_map) for group in groups_orm]
+        groups_list = [_format_group_list_item(group, subgroup_map, page.fields) for group in groups_orm]
 
         logging.info(f"Returning {len(groups_list)} groups.")
-        return jsonify({"groups": groups_list}), 200
+        return jsonify(_page_response("groups", groups_list, page, next_cursor, db.query(func.count(Group.id)))), 200
     except SQLAlchemyError as e:
         logging.error(f"Database error listing groups: {e}", exc_info=True)
         abort(500, description="Failed to retrieve groups.")
@@ -105,29 +155,33 @@ def list_groups():
 
 @groups_bp.route('/sensors', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def list_sensors_for_groups():
     # ... (no changes needed here) ...
     logging.info(f"Request received for POST {groups_bp.name}.sensors")
     db: Session = DbRequestSession()
+    page = _page_params(request.get_json(silent=True), SENSOR_LIST_FIELDS)
     try:
-        sensors_orm = db.query(
-            Sensor.id,
-            Sensor.measurement,
-            Sensor.client_id,
-            Sensor.group_id
-        ).order_by(Sensor.id).all()
+        sensors_orm, next_cursor = paginate_query(
+            db.query(
+                Sensor.id,
+                Sensor.measurement,
+                Sensor.client_id,
+                Sensor.group_id
+            ), (Sensor.id,), page, key=lambda s: (s.id,),
+        )
         sensors_list = [
-             {
+             pick_fields({
                 "id": s.id,
                 "name": f"{s.measurement.capitalize()} ({s.id}) Hub: {s.client_id or 'N/A'}",
                 "type": s.measurement,
                 "location": None,
                 "status": None,
                 "assignedGroupId": s.group_id
-             } for s in sensors_orm
+             }, page.fields) for s in sensors_orm
         ]
         logging.info(f"Returning {len(sensors_list)} sensors for group context.")
-        return jsonify({"sensors": sensors_list}), 200
+        return jsonify(_page_response("sensors", sensors_list, page, next_cursor, db.query(func.count(Sensor.id)))), 200
     except SQLAlchemyError as e:
         logging.error(f"Database error listing sensors for groups: {e}", exc_info=True)
         abort(500, description="Failed to retrieve sensors.")
@@ -137,15 +191,26 @@ def list_sensors_for_groups():
 
 @groups_bp.route('/rules', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def list_rules_for_groups():
 
     logging.info(f"Request received for POST {groups_bp.name}.rules")
     db: Session = DbRequestSession()
+    page = _page_params(request.get_json(silent=True), RULE_LIST_FIELDS)
+    fields = page.fields or RULE_LIST_FIELDS
     try:
-        rules_orm = db.query(Rule).order_by(Rule.name).all()
-        rules_list = [_format_rule_response(rule) for rule in rules_orm]
+        options = []
+        if fields & {"actions", "action", "actionParams"}:
+            options.append(selectinload(Rule.actions))
+        if "initiators" in fields:
+            options.append(selectinload(Rule.initiators))
+        rules_orm, next_cursor = paginate_query(
+            db.query(Rule).options(*options), (Rule.name, Rule.id), page,
+            key=lambda rule: (rule.name, rule.id),
+        )
+        rules_list = [_format_rule_response(rule, page.fields) for rule in rules_orm]
         logging.info(f"Returning {len(rules_list)} rules for group context.")
-        return jsonify({"rules": rules_list}), 200
+        return jsonify(_page_response("rules", rules_list, page, next_cursor, db.query(func.count(Rule.id)))), 200
     except SQLAlchemyError as e:
         logging.error(f"Database error listing rules for groups: {e}", exc_info=True)
         abort(500, description="Failed to retrieve rules.")
@@ -155,6 +220,7 @@ def list_rules_for_groups():
 
 @groups_bp.route('/rulesets', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def list_rulesets_for_groups():
     # ... (no changes needed here) ...
     logging.info(f"Request received for POST {groups_bp.name}.rulesets")
@@ -184,6 +250,7 @@ def list_rulesets_for_groups():
 
 @groups_bp.route('/tags', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def list_tags_for_groups():
     # ... (no changes needed here) ...
     logging.info(f"Request received for POST {groups_bp.name}.tags")
@@ -378,6 +445,8 @@ def update_group():
              existing_group.tags = tags
 
         db.commit()
+        if 'tags' in data:
+             invalidate_group_tags_cache(rc, group_id)
         db.refresh(existing_group)
 
         updated_group_orm = db.query(Group).options(
@@ -424,6 +493,8 @@ def delete_group():
         invalidate_group_rules_cache(rc, group_id) # Invalidate rules before deletion
         db.delete(existing_group)
         db.commit()
+        invalidate_group_state(rc, group_id)
+        invalidate_group_tags_cache(rc, group_id)
         invalidate_inventory_cache(rc) # Invalidate inventory after deletion
 
         logging.info(f"Successfully deleted group: ID='{group_id}'")
@@ -477,6 +548,7 @@ def assign_sensor_to_group():
         sensor.group_id = group_id
         db.commit()
 
+        invalidate_group_state(rc, group_id)
         invalidate_inventory_cache(rc)
         if sensor.client_id: # Invalidate specific hub map only if sensor has a client
              invalidate_inventory_cache(rc, client_id=sensor.client_id)
@@ -522,6 +594,7 @@ def unassign_sensor_from_group():
         sensor.group_id = None # Set FK to NULL
         db.commit()
 
+        invalidate_group_state(rc, group_id)
         invalidate_inventory_cache(rc)
         if sensor_client_id:
             invalidate_inventory_cache(rc, client_id=sensor_client_id)
@@ -733,7 +806,7 @@ def assign_tag_to_group():
 
         group.tags.append(tag)
         db.commit()
-        # No cache invalidation needed currently for tags
+        invalidate_group_tags_cache(current_app.redis_client, group_id)
 
         logging.info(f"Successfully assigned Tag '{tag_id}' to group '{group_id}'.")
         return jsonify({"success": True}), 200
@@ -774,7 +847,7 @@ def unassign_tag_from_group():
 
         group.tags.remove(tag)
         db.commit()
-        # No cache invalidation needed currently for tags
+        invalidate_group_tags_cache(current_app.redis_client, group_id)
 
         logging.info(f"Successfully unassigned Tag '{tag_id}' from group '{group_id}'.")
         return jsonify({"success": True}), 200
@@ -835,6 +908,7 @@ def set_group_inspection_date():
 
 @groups_bp.route('/detail', methods=['POST'])
 @jwt_required()
+@read_replica
 def get_group_detail():
     """Fetches details for a specific group by ID, including subgroup IDs."""
     # ... (This function correctly calculates and passes subgroup_map for the specific group) ...
@@ -872,6 +946,7 @@ def get_group_detail():
 
 @groups_bp.route('/group-sensors', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def get_group_sensors():
     # ... (no changes needed here) ...
     logging.info(f"Request received for POST {groups_bp.name}.group-sensors")
@@ -903,6 +978,7 @@ def get_group_sensors():
 
 @groups_bp.route('/subgroups', methods=['POST'])
 @jwt_required()
+@read_replica
 def get_subgroups():
     """Fetches direct subgroups (children) of a given parent group."""
     logging.info(f"Request received for POST {groups_bp.name}.subgroups")
@@ -961,19 +1037,28 @@ def get_group_events():
     if not data or not data.get('groupId'):
         abort(400, description="Missing required field: 'groupId'.")
     group_id = data['groupId']
+    page = _page_params(data, EVENT_FIELDS, cursor_parsers=(date.fromisoformat, int))
 
+    # Read-your-writes, buffered rule events are written first
+    flush_events(db, current_app.redis_client)
     try:
-        events_orm = db.query(GroupEvent)\
-                       .filter(GroupEvent.group_id == group_id)\
-                       .order_by(desc(GroupEvent.event_date), desc(GroupEvent.event_table_id))\
-                       .limit(100)\
-                       .all()
+        # Newest first, (event_date, event_table_id) is covered by idx_group_events_group_id_date
+        query = db.query(GroupEvent).filter(GroupEvent.group_id == group_id)
+        if page.paginated:
+            events_orm, next_cursor = paginate_query(
+                query, (GroupEvent.event_date, GroupEvent.event_table_id), page,
+                key=lambda event: (event.event_date, event.event_table_id), descending=True,
+            )
+        else:
+            # Without pagination params the route keeps its previous response: newest 100 events
+            events_orm, next_cursor = query.order_by(desc(GroupEvent.event_date), desc(GroupEvent.event_table_id)).limit(100).all(), None
 
-        events_list = [_format_event_response(event) for event in events_orm]
+        events_list = [pick_fields(_format_event_response(event), page.fields) for event in events_orm]
 
         logging.info(f"Returning {len(events_list)} events for group '{group_id}'.")
         logging.debug(f"event_list: {events_list}")
-        return jsonify({"events": events_list}), 200
+        total_query = db.query(func.count(GroupEvent.event_table_id)).filter(GroupEvent.group_id == group_id)
+        return jsonify(_page_response("events", events_list, page, next_cursor, total_query)), 200
 
     except SQLAlchemyError as e:
         logging.error(f"DB error fetching events for group '{group_id}': {e}", exc_info=True)
@@ -985,6 +1070,7 @@ def get_group_events():
 
 @groups_bp.route('/group-rules', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def get_group_rules():
     """Fetches rules applicable to a specific group (direct & via rulesets)."""
     logging.info(f"Request received for POST {groups_bp.name}.group-rules")
@@ -1036,7 +1122,10 @@ def get_sensor_history():
     if not data or not data.get('sensorId') or not data.get('timeRange'):
         abort(400, description="Missing required fields: 'sensorId', 'timeRange'.")
 
-    sensor_id = data['sensorId']
+    try:
+        sensor_id = validate_identifier(data['sensorId'], "sensorId")
+    except ValueError:
+        abort(400, description="Invalid field: 'sensorId'.")
     time_range_input = data['timeRange'].lower().strip() # Normalize input
 
     # --- Convert User-Friendly Time Range to InfluxDB Format ---
@@ -1051,7 +1140,7 @@ def get_sensor_history():
         # Approximate month as 30 days for Influx range query
         # More precise handling might involve calculating start/end timestamps
         influx_time_range = "-30d"
-    elif re.match(r'^-\d+[mhdw]$', time_range_input):
+    elif is_relative_range(time_range_input):
         # Allow direct InfluxDB format as well
         influx_time_range = time_range_input
     else:
@@ -1064,34 +1153,20 @@ def get_sensor_history():
     # --- Proceed with InfluxDB query using the converted range ---
     history_data = []
     try:
-        with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, timeout=20_000) as client:
-            query_api = client.query_api()
-
-            # Construct Flux query
-            flux_query = f'''
-                from(bucket: "{INFLUX_BUCKET}")
-                |> range(start: {influx_time_range})
-                |> filter(fn: (r) => r._measurement == "sensor_measurement" and r.sensor_id == "{sensor_id}" and r._field == "value")
-                |> keep(columns: ["_time", "_value"])
-                |> sort(columns: ["_time"], desc: false)
-            '''
-            # Optional: Add aggregation based on the *InfluxDB* time range for performance
-            # if influx_time_range in ["-7d", "-30d"]: # Example
-            #     aggregate_interval = "1h" if influx_time_range == "-7d" else "6h" # Adjust aggregation
-            #     flux_query += f'|> aggregateWindow(every: {aggregate_interval}, fn: mean, createEmpty: false)\n'
-
-            logging.debug(f"Executing InfluxDB query:\n{flux_query}")
-            tables = query_api.query(query=flux_query, org=INFLUX_ORG)
-
-            for table in tables:
-                for record in table.records:
-                    timestamp = record.get_time()
-                    value = record.get_value()
-                    if timestamp is not None and isinstance(value, (int, float, Decimal)):
-                         history_data.append({
-                            "timestamp": timestamp.isoformat(),
-                            "value": float(value)
-                         })
+        tables = run_query("sensor_history", {
+            "sensor_id": sensor_id,
+            "start": range_start(influx_time_range),
+        })
+
+        for table in tables:
+            for record in table.records:
+                timestamp = record.get_time()
+                value = record.get_value()
+                if timestamp is not None and isinstance(value, (int, float, Decimal)):
+                     history_data.append({
+                        "timestamp": timestamp.isoformat(),
+                        "value": float(value)
+                     })
 
         logging.info(f"Returning {len(history_data)} history points for sensor '{sensor_id}'.")
         return jsonify({"history": history_data}), 200
@@ -1111,6 +1186,7 @@ def get_sensor_history():
 
 @groups_bp.route('/connected-groups', methods=['POST'])
 @jwt_required() # Uncomment when JWT is fully integrated
+@read_replica
 def get_connected_groups():
     """Fetches parent and direct children of a specific group."""
     logging.info(f"Request received for POST {groups_bp.name}.connected-groups")
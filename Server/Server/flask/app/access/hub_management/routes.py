@@ -12,7 +12,7 @@ from flask_jwt_extended import jwt_required
 from . import hub_management_bp
 
 # Import necessary model
-from app.db_man.pqsql.models import AvailableSensorsDatabase
+from app.db_man.pqsql.models import AvailableSensorsDatabase, Sensor
 
 # Import the request-scoped session factory
 from app import DbRequestSession
@@ -22,6 +22,9 @@ from app import DbRequestSession
 from app.services.inventory_service import get_hubs, invalidate_inventory_cache
 # Import cache invalidation for config (when hub is deleted)
 from app.cache.database_caching import invalidate_hub_config_cache
+from app.cache.hub_sessions import invalidate_hub_sessions
+from app.cache.last_value_index import remove_hub_last_values
+from app.cache.group_state import invalidate_group_state
 # -----------------------------------------
 from app.helpers.formatters import _format_hub_details_basic
 
@@ -173,12 +176,18 @@ def delete_hub():
             logging.warning(f"Attempted to delete non-existent hub: {hub_uuid}")
             abort(404, description=f"Hub with UUID '{hub_uuid}' not found.")
 
+        # Groups of the hub's sensors, their measurement state loses the sensors
+        group_ids = {group_id for (group_id,) in db.query(Sensor.group_id).filter(
+            Sensor.client_id == hub_uuid, Sensor.group_id.isnot(None)).distinct()}
         db.delete(existing_hub)
         db.commit()
         # --- INVALIDATE CACHES ---
         # Use the actual client_id (hub_uuid) for invalidation
         invalidate_inventory_cache(rc, client_id=hub_uuid)
         invalidate_hub_config_cache(rc, hub_uuid)
+        invalidate_hub_sessions(rc, hub_uuid) # Sessions were deleted by cascade
+        remove_hub_last_values(rc, hub_uuid)
+        invalidate_group_state(rc, *group_ids)
         # -------------------------
         logging.info(f"Successfully deleted hub: UUID='{hub_uuid}'")
         return jsonify({"msg": "Hub deleted successfully."}), 200
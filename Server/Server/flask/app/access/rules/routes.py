@@ -1,7 +1,9 @@
 # app/rules/routes.py
 import logging
 import uuid
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+import redis
 from flask import Blueprint, jsonify, request, abort, current_app
 from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
@@ -36,6 +38,20 @@ from jsonschema import validate, ValidationError
 
 
 from app.helpers.formatters import _generate_id, _format_rule_detail, _format_ruleset_detail, _format_tag_for_rule_frontend, _format_group_for_rule_frontend
+from app.services.backtest_service import (
+    backtest_available, create_backtest_job, get_backtest_job, BACKTEST_MAX_RANGE_DAYS
+)
+from app.engines.rules_engine.rule_stats import get_top_rules, get_stats_since, reset_rule_stats
+
+
+def _trigger_seconds(data: dict, key: str) -> int:
+    """Reads holdSeconds/cooldownSeconds of rule payload, aborts on invalid value."""
+    value = data.get(key)
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        abort(400, description=f"'{key}' must be a non-negative integer.")
+    return value
 
 
 # --- Rule CRUD Routes ---
@@ -111,6 +127,8 @@ def create_rule():
         abort(400, desciption="Action Validation Failed")
 
     new_rule_id = _generate_id("rule")
+    hold_seconds = _trigger_seconds(data, 'holdSeconds')
+    cooldown_seconds = _trigger_seconds(data, 'cooldownSeconds')
 
     try:
         # --- Create Initiators ---
@@ -135,6 +153,7 @@ def create_rule():
                 # Use Decimal for precision in DB if needed, convert here
                 value=Decimal(str(init_data['value'])) if init_data.get('value') is not None else None,
                 value2=Decimal(str(init_data['value2'])) if init_data.get('value2') is not None else None,
+                hysteresis=Decimal(str(init_data['hysteresis'])) if init_data.get('hysteresis') is not None else None,
                 schedule_type=init_data.get('scheduleType'),
                 schedule_value=init_data.get('scheduleValue'),
                 tags=initiator_tags
@@ -170,6 +189,8 @@ def create_rule():
             is_active=data.get('isActive', True),
             rule_set_id=rule_set_id,
             priority=data.get('priority', 5),
+            hold_seconds=hold_seconds,
+            cooldown_seconds=cooldown_seconds,
             initiators=initiators_orm,
             actions=actions_orm
         )
@@ -230,6 +251,8 @@ def update_rule(rule_id: str):
     except ValidationError as e:
         logging.warning(f"Validation of the actions was NOT succesfull: {e}")
         abort(400, description="Action Validation Failed") # Corrected 'desciption' to 'description'
+    hold_seconds = _trigger_seconds(data, 'holdSeconds')
+    cooldown_seconds = _trigger_seconds(data, 'cooldownSeconds')
         
     try:
         # Fetch the rule as it exists BEFORE any updates
@@ -260,6 +283,8 @@ def update_rule(rule_id: str):
         if 'logicalOperator' in data: rule.logical_operator = data['logicalOperator']
         if 'isActive' in data: rule.is_active = data['isActive']
         if 'priority' in data: rule.priority = data['priority']
+        if 'holdSeconds' in data: rule.hold_seconds = hold_seconds
+        if 'cooldownSeconds' in data: rule.cooldown_seconds = cooldown_seconds
        
         # --- Update Initiators (Replace Strategy) --- 
         logging.debug("Updating Initiators") # Corrected "Intitiators"
@@ -286,6 +311,7 @@ def update_rule(rule_id: str):
                     operator=init_data.get('operator'),
                     value=Decimal(str(init_data['value'])) if init_data.get('value') is not None else None,
                     value2=Decimal(str(init_data['value2'])) if init_data.get('value2') is not None else None,
+                    hysteresis=Decimal(str(init_data['hysteresis'])) if init_data.get('hysteresis') is not None else None,
                     schedule_type=init_data.get('scheduleType'),
                     schedule_value=init_data.get('scheduleValue'),
                     tags=initiator_tags_orm # Use the fetched Tag objects
@@ -755,4 +781,195 @@ def list_groups_for_rules():
         abort(500, description="Failed to retrieve groups.")
     except Exception as e:
         logging.error(f"Unexpected error listing groups for rules: {e}", exc_info=True)
-        abort(500, description="An unexpected error occurred while listing groups.")
\ No newline at end of file
+        abort(500, description="An unexpected error occurred while listing groups.")
+
+# --- Rule Backtest Routes ---
+
+def _parse_backtest_time(value, field: str) -> datetime:
+    """Parses ISO datetime of backtest request, naive values are treated as UTC."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        abort(400, description=f"Invalid '{field}' format, expected ISO 8601 datetime.")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _format_backtest_job(job: dict) -> dict:
+    return {
+        "id": job.get("id"),
+        "status": job.get("status"),
+        "groupIds": job.get("group_ids") or [],
+        "ruleIds": job.get("rule_ids") or [],
+        "ruleSetId": job.get("rule_set_id") or None,
+        "start": job.get("start"),
+        "end": job.get("stop"),
+        "progress": int(job.get("progress", 0)),
+        "readings": int(job.get("readings", 0)),
+        "error": job.get("error"),
+        "result": job.get("result"),
+    }
+
+
+@rules_bp.route('/rules/backtest', methods=['POST'])
+@jwt_required()
+def create_rule_backtest():
+    """
+    Creates backtest job replaying sensor history of groups through rules (actions are not run).
+    Body: {"start": ISO, "end": ISO (optional, default now), "groupIds": [...],
+           "ruleIds": [...] (optional), "ruleSetId": optional} - without rules the groups' own rules are used.
+    """
+    logging.info("POST /rules/backtest requested")
+    if not backtest_available():
+        abort(503, description="Rule backtest is unavailable (numpy/pyarrow is not installed).")
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Rule backtest is unavailable (redis is not connected).")
+
+    data = request.get_json() or {}
+    if not data.get('start'):
+        abort(400, description="Missing required field: 'start'.")
+    start = _parse_backtest_time(data['start'], 'start')
+    stop = _parse_backtest_time(data['end'], 'end') if data.get('end') else datetime.now(timezone.utc)
+    if stop <= start:
+        abort(400, description="'end' must be after 'start'.")
+    if stop - start > timedelta(days=BACKTEST_MAX_RANGE_DAYS):
+        abort(400, description=f"Backtest range is limited to {BACKTEST_MAX_RANGE_DAYS} days.")
+
+    group_ids = data.get('groupIds')
+    rule_ids = data.get('ruleIds') or []
+    rule_set_id = data.get('ruleSetId')
+    if not isinstance(group_ids, list) or not group_ids:
+        abort(400, description="Missing required field: 'groupIds'.")
+    if not isinstance(rule_ids, list):
+        abort(400, description="'ruleIds' must be a list.")
+    group_ids = list(dict.fromkeys(str(group_id) for group_id in group_ids))
+    rule_ids = list(dict.fromkeys(str(rule_id) for rule_id in rule_ids))
+
+    db: Session = DbRequestSession()
+    try:
+        found_groups = {group_id for (group_id,) in db.query(Group.id).filter(Group.id.in_(group_ids)).all()}
+        missing_groups = [group_id for group_id in group_ids if group_id not in found_groups]
+        if missing_groups:
+            abort(404, description=f"Groups not found: {', '.join(missing_groups)}")
+        if rule_ids:
+            found_rules = {rule_id for (rule_id,) in db.query(Rule.id).filter(Rule.id.in_(rule_ids)).all()}
+            missing_rules = [rule_id for rule_id in rule_ids if rule_id not in found_rules]
+            if missing_rules:
+                abort(404, description=f"Rules not found: {', '.join(missing_rules)}")
+        if rule_set_id and db.query(RuleSet.id).filter(RuleSet.id == rule_set_id).scalar() is None:
+            abort(404, description=f"RuleSet with ID '{rule_set_id}' not found.")
+    except SQLAlchemyError as e:
+        logging.error(f"Database error checking backtest request: {e}", exc_info=True)
+        abort(500, description="Failed to create backtest job.")
+
+    try:
+        job_id = create_backtest_job(rc, group_ids, start, stop, rule_ids, rule_set_id)
+        # Imported here, so web workers load celery app only when backtest is used
+        from app.background_worker.tasks import run_rule_backtest
+        run_rule_backtest.delay(job_id)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error creating backtest job: {e}", exc_info=True)
+        abort(500, description="Failed to create backtest job.")
+    except Exception as e:
+        logging.error(f"Unexpected error creating backtest job: {e}", exc_info=True)
+        abort(500, description="An unexpected error occurred while creating backtest job.")
+
+    logging.info(f"Backtest job {job_id} queued ({len(group_ids)} groups, {start} - {stop})")
+    return jsonify(_format_backtest_job(get_backtest_job(rc, job_id) or {"id": job_id, "status": "queued"})), 202
+
+
+@rules_bp.route('/rules/backtest/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_rule_backtest(job_id: str):
+    """Returns state of backtest job, result (trigger counts and times per group and rule) when finished."""
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Rule backtest is unavailable (redis is not connected).")
+    try:
+        job = get_backtest_job(rc, job_id)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading backtest job {job_id}: {e}", exc_info=True)
+        abort(500, description="Failed to read backtest job.")
+    if not job:
+        abort(404, description=f"Backtest job '{job_id}' not found.")
+    return jsonify(_format_backtest_job(job)), 200
+
+
+# --- Rule Statistics Routes ---
+
+_STATS_SORT_FIELDS = {
+    "evalMs": "eval_ms", "evaluations": "evaluations", "triggers": "triggers", "dbQueries": "db_queries",
+    "actionMs": "action_ms", "actions": "actions", "actionFailures": "action_failures",
+}
+
+
+@rules_bp.route('/rules/stats', methods=['GET'])
+@jwt_required()
+def get_rule_stats():
+    """
+    Returns the most expensive rules (summed over all workers since the last reset).
+    Query: sort=evalMs|evaluations|triggers|dbQueries|actionMs|actions|actionFailures (default evalMs), limit (default 20)
+    """
+    logging.info("GET /rules/stats requested")
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Rule statistics are unavailable (redis is not connected).")
+    sort = request.args.get('sort', 'evalMs')
+    if sort not in _STATS_SORT_FIELDS:
+        abort(400, description=f"Invalid sort '{sort}'. Use one of: {', '.join(_STATS_SORT_FIELDS)}.")
+    limit = request.args.get('limit', 20, type=int)
+    if limit is None or not 1 <= limit <= 500:
+        abort(400, description="'limit' must be between 1 and 500.")
+
+    try:
+        top = get_top_rules(rc, _STATS_SORT_FIELDS[sort], limit)
+        since = get_stats_since(rc)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading rule statistics: {e}", exc_info=True)
+        abort(500, description="Failed to read rule statistics.")
+
+    names = {}
+    if top:
+        db: Session = DbRequestSession()
+        try:
+            names = dict(db.query(Rule.id, Rule.name).filter(Rule.id.in_([entry["rule_id"] for entry in top])).all())
+        except SQLAlchemyError as e:
+            logging.error(f"Database error reading rule names for statistics: {e}", exc_info=True)
+
+    rules_list = []
+    for entry in top:
+        evaluations = int(entry["evaluations"])
+        actions = int(entry["actions"])
+        rules_list.append({
+            "ruleId": entry["rule_id"],
+            "name": names.get(entry["rule_id"]),
+            "evaluations": evaluations,
+            "triggers": int(entry["triggers"]),
+            "evalMs": round(entry["eval_ms"], 3),
+            "avgEvalMs": round(entry["eval_ms"] / evaluations, 3) if evaluations else None,
+            "dbQueries": int(entry["db_queries"]),
+            "avgDbQueries": round(entry["db_queries"] / evaluations, 2) if evaluations else None,
+            "actions": actions,
+            "actionMs": round(entry["action_ms"], 3),
+            "avgActionMs": round(entry["action_ms"] / actions, 3) if actions else None,
+            "actionFailures": int(entry["action_failures"]),
+        })
+    return jsonify({"since": since, "sort": sort, "rules": rules_list}), 200
+
+
+@rules_bp.route('/rules/stats', methods=['DELETE'])
+@jwt_required()
+def delete_rule_stats():
+    """Resets statistics of all rules."""
+    logging.info("DELETE /rules/stats requested")
+    rc = current_app.redis_client
+    if rc is None:
+        abort(503, description="Rule statistics are unavailable (redis is not connected).")
+    try:
+        reset_rule_stats(rc)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error resetting rule statistics: {e}", exc_info=True)
+        abort(500, description="Failed to reset rule statistics.")
+    return jsonify({"message": "Rule statistics reset."}), 200
@@ -13,17 +13,23 @@ from . import sensorhubs_bp # Make sure this matches your __init__.py
 
 # Import shared components
 from app import DbRequestSession # Scoped session from main app factory
+from app.db_man.pqsql.replica import read_replica
+from app.helpers.pagination import parse_page_params, pick_fields
+
+SENSOR_INVENTORY_FIELDS = {"id", "name", "type", "hubId", "hubName", "lastReading", "lastUpdate"}
+
 try:
     # Assuming inventory_service is moved to app.services
-    from app.services.inventory_service import get_sensors, get_hubs
+    from app.services.inventory_service import get_sensors, get_hubs, get_sensors_page
 except ImportError:
     # Fallback if inventory_service is at the top level
-    from inventory_service import get_sensors, get_hubs
+    from inventory_service import get_sensors, get_hubs, get_sensors_page
 
 # --- Route to List Sensors ---
 # Path changed to match frontend API call: /access/sensors_hubs/get_info_sensors
 @sensorhubs_bp.route('/get_info_sensors', methods=['GET']) # ROUTE PATH CHANGED
 @jwt_required()
+@read_replica
 def list_sensors_endpoint():
     logging.debug(f"Request received for GET {sensorhubs_bp.url_prefix}/get_info_sensors") # Log correct path
     rc = current_app.redis_client
@@ -34,13 +40,26 @@ def list_sensors_endpoint():
         if force_refresh:
             logging.info(f"Cache refresh forced for {sensorhubs_bp.url_prefix}/get_info_sensors")
 
+        # Optional keyset pagination (limit, cursor) and fields, see app/helpers/pagination.py
+        try:
+            page = parse_page_params(request.args, SENSOR_INVENTORY_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if page.paginated:
+            sensors_page, next_cursor, total = get_sensors_page(db=db, rc=rc, page=page, force_refresh=force_refresh)
+            return jsonify({
+                "sensors": [pick_fields(sensor, page.fields) for sensor in sensors_page],
+                "nextCursor": next_cursor,
+                "total": total,
+            }), 200
+
         # Call the service function (which includes caching logic)
         sensors_list = get_sensors(db=db, rc=rc, force_refresh=force_refresh)
 
         logging.info(f"Returning {len(sensors_list)} sensors via {sensorhubs_bp.name} blueprint.")
-        logging.info(sensors_list)
+        logging.debug(sensors_list)
         # Frontend expects a direct list
-        return jsonify(sensors_list), 200
+        return jsonify([pick_fields(sensor, page.fields) for sensor in sensors_list]), 200
     except Exception as e:
         # Avoid leaking detailed errors in production if possible
         logging.error(f"Error fetching sensor list via {sensorhubs_bp.name}: {e}", exc_info=True)
@@ -53,6 +72,7 @@ def list_sensors_endpoint():
 # Path changed to match frontend API call: /access/sensors_hubs/get_hub_info
 @sensorhubs_bp.route('/get_hub_info', methods=['GET']) # ROUTE PATH CHANGED
 @jwt_required()
+@read_replica
 def list_hubs_endpoint():
     logging.debug(f"Request received for GET {sensorhubs_bp.url_prefix}/get_hub_info") # Log correct path
     rc = current_app.redis_client
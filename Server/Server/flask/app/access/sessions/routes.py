@@ -2,7 +2,7 @@
 import logging
 from datetime import datetime, timezone
 
-from flask import jsonify, abort, request # Import request
+from flask import jsonify, abort, request, current_app # Import request
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import joinedload, Session # Import Session for type hint
 from flask_jwt_extended import jwt_required
@@ -17,6 +17,7 @@ from app.db_man.pqsql.models import SessionAuth, AvailableSensorsDatabase # Adju
 
 # Import the request-scoped session factory from the main app
 from app import DbRequestSession # Assuming DbRequestSession is in app's root __init__
+from app.cache.hub_sessions import invalidate_session
 
 # --- Hub Session Management Routes ---
 
@@ -106,6 +107,7 @@ def terminate_hub_session():
         # Delete the session object
         db.delete(session_to_delete)
         db.commit()
+        invalidate_session(current_app.redis_client, session_id, hub_id_log)
         logging.info(f"Successfully terminated session: {session_id} for hub {hub_id_log} via {hub_sessions_bp.name}")
 
         # Return 200 OK with a confirmation message (frontend seems to expect a successful response)
@@ -2,7 +2,7 @@
 import logging
 import re # For generating IDs if needed, although frontend sends it
 
-from flask import jsonify, abort, request
+from flask import jsonify, abort, request, current_app
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from flask_jwt_extended import jwt_required
 from sqlalchemy import select
@@ -15,6 +15,7 @@ from app.db_man.pqsql.models import Tag
 
 # Import the request-scoped session factory
 from app import DbRequestSession
+from app.cache.database_caching import invalidate_group_tags_cache
 
 from werkzeug.exceptions import HTTPException, BadRequest, NotFound, Conflict 
 
@@ -270,8 +271,11 @@ def delete_tag():
             logging.warning(f"System allocated tag '{tag_id}' is not allowed to be deleted")
             abort(401, description=f"System allocated tag '{tag_id}' is not allowed to be deleted" )
 
+        tagged_group_ids = [group.id for group in existing_tag.groups]
         db.delete(existing_tag)
         db.commit()
+        for group_id in tagged_group_ids:
+            invalidate_group_tags_cache(current_app.redis_client, group_id)
         logging.info(f"Successfully deleted tag: ID='{tag_id}'")
 
         # Return success confirmation as expected by frontend
@@ -1,9 +1,10 @@
 import logging
 import os
-from datetime import datetime, timezone # Ensure timezone is imported
+from datetime import datetime, timezone, timedelta # Ensure timezone is imported
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_ready, beat_init, worker_process_shutdown, worker_shutdown
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import redis
@@ -11,16 +12,30 @@ import redis
 # Import your application's modules
 from app.engines.rules_engine.evaluator import check_and_trigger_rules_for_event
 # Assuming Schedule model is here
-from app.db_man.pqsql.models import Group, Schedule
+from app.db_man.pqsql.models import Schedule
 # Assuming your check_and_update_schedule_progress function is in this path
 # You might need to adjust this import based on your project structure
 from app.engines.rules_engine.schedule_evaluator import check_and_update_schedule_progress
+from app.services.export_service import run_export
+from app.services.backtest_service import run_backtest, BACKTEST_QUEUE
+from app.db_man.pqsql.partitions import ensure_group_event_partitions, archive_old_group_event_partitions
+from app.engines.event_engine.event_tracker import flush_events, EVENT_FLUSH_INTERVAL_SECONDS
+from app.cache.jwt_revocation import prune_revoked_tokens
+from app.db_man.pqsql.delete import delete_expired_sessions
+from app.engines.rules_engine.schedule_index import pop_due_schedules
+from app.engines.rules_engine.action_queue import (
+    run_rule_actions, RULE_ACTIONS_QUEUE, RULE_ACTION_MAX_RETRIES, RULE_ACTION_RETRY_SECONDS
+)
+from app.engines.rules_engine.rule_stats import flush_rule_stats
 
 # --- Configuration ---
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
 SQLALCHEMY_DATABASE_URL = f"postgresql+psycopg://client_modifier:{os.getenv('POSTGRES_USERS_ACCESS_PASS')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/clients_system"
 REDIS_URL = os.environ.get('REDIS_URL_FOR_APP', 'redis://redis:6379/0')
+# Partition maintenance of group_events (DDL) connects as partition_maintainer, owner of the partitions
+POSTGRES_MAINTENANCE_PASS = os.getenv('POSTGRES_MAINTENANCE_PASS')
+MAINTENANCE_DATABASE_URL = f"postgresql+psycopg://partition_maintainer:{POSTGRES_MAINTENANCE_PASS}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/clients_system"
 
 # --- Celery Application Setup ---
 # Ensure the tasks module is correctly specified if it's not tasks.py directly under background_worker
@@ -42,7 +57,15 @@ def get_engine():
         if not isinstance(SQLALCHEMY_DATABASE_URL, str):
             logging.error(f"SQLALCHEMY_DATABASE_URL is not a string: {SQLALCHEMY_DATABASE_URL} (type: {type(SQLALCHEMY_DATABASE_URL)})")
             raise ValueError("SQLALCHEMY_DATABASE_URL misconfigured")
-        engine = create_engine(SQLALCHEMY_DATABASE_URL)
+        # Same pool settings as app.db_man.pqsql.database, every greenlet of a gevent worker holds one session
+        engine = create_engine(
+            SQLALCHEMY_DATABASE_URL,
+            pool_pre_ping=True,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "10")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        )
     return engine
 
 def get_db_session():
@@ -57,6 +80,24 @@ def get_db_session():
     finally:
         db.close()
 
+MaintenanceSessionLocal = None
+
+def get_maintenance_db_session():
+    """Session of partition_maintainer, None when POSTGRES_MAINTENANCE_PASS is not set (app role has no DDL rights)."""
+    global MaintenanceSessionLocal
+    if not POSTGRES_MAINTENANCE_PASS:
+        logging.warning("POSTGRES_MAINTENANCE_PASS is not set, group_events partitions are not maintained by this process.")
+        yield None
+        return
+    if MaintenanceSessionLocal is None:
+        MaintenanceSessionLocal = sessionmaker(autocommit=False, autoflush=False,
+                                               bind=create_engine(MAINTENANCE_DATABASE_URL, pool_size=1, max_overflow=1))
+    db = MaintenanceSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # --- Redis Client for Application Logic (rc) ---
 def get_redis_client_for_app():
     return redis.Redis.from_url(REDIS_URL)
@@ -64,7 +105,11 @@ def get_redis_client_for_app():
 # --- Celery Tasks ---
 
 @celery_app.task(name='app.background_worker.tasks.run_scheduled_rule_check_for_group')
-def run_scheduled_rule_check_for_group(group_id: str):
+def run_scheduled_rule_check_for_group(group_id: str, rule_ids: list = None, scheduled_at: str = None):
+    """
+    Evaluates schedule rules of group. With rule_ids/scheduled_at (dispatch_due_schedule_rules)
+    only those rules are checked, at the time they were due.
+    """
     logging.info(f"Running scheduled rule check for group_id: {group_id}")
     
     db_session_generator = get_db_session()
@@ -72,13 +117,18 @@ def run_scheduled_rule_check_for_group(group_id: str):
     rc = get_redis_client_for_app()
 
     try:
+        trigger_context = {'group_id': group_id,
+                           'trigger_type': 'schedule'}
+        if rule_ids:
+            trigger_context['rule_ids'] = rule_ids
+        if scheduled_at:
+            trigger_context['scheduled_at'] = datetime.fromisoformat(scheduled_at)
         check_and_trigger_rules_for_event(
             db=db,
             rc=rc,
             group_id=group_id,
             trigger_type="schedule", 
-            trigger_context={'group_id': group_id,
-                             'trigger_type': 'schedule'} 
+            trigger_context=trigger_context
         )
         logging.info(f"Successfully completed scheduled rule check for group_id: {group_id}")
     except Exception as e:
@@ -90,29 +140,25 @@ def run_scheduled_rule_check_for_group(group_id: str):
             pass
 
 
-@celery_app.task(name='app.background_worker.tasks.dispatch_scheduled_rule_checks')
-def dispatch_scheduled_rule_checks():
-    logging.info("Dispatching scheduled rule checks for groups...")
-    
+@celery_app.task(name='app.background_worker.tasks.dispatch_due_schedule_rules')
+def dispatch_due_schedule_rules():
+    """
+    Celery task taking due (group, rule) entries out of the schedule index
+    and dispatching one rule check per group and due time.
+    """
     db_session_generator = get_db_session()
     db = next(db_session_generator)
+    rc = get_redis_client_for_app()
 
     try:
-        groups_query = db.query(Group.id).all()
-        group_ids = [g.id for g in groups_query]
-
-        if not group_ids:
-            logging.info("No groups found to check for scheduled rules.")
-            return
-
-        logging.info(f"Found {len(group_ids)} groups. Dispatching rule check tasks...")
-        for group_id in group_ids:
-            # Make sure the task name here matches the actual task name for clarity if it's different
-            run_scheduled_rule_check_for_group.delay(str(group_id))
-        
-        logging.info(f"Dispatched rule check tasks for {len(group_ids)} groups.")
+        due = pop_due_schedules(db, rc)
+        for group_id, rule_ids, due_at in due:
+            run_scheduled_rule_check_for_group.delay(str(group_id), rule_ids, due_at.isoformat())
+        if due:
+            logging.info(f"Dispatched {len(due)} scheduled rule checks.")
     except Exception as e:
-        logging.error(f"Error in dispatch_scheduled_rule_checks: {e}", exc_info=True)
+        db.rollback()
+        logging.error(f"Error in dispatch_due_schedule_rules: {e}", exc_info=True)
     finally:
         try:
             next(db_session_generator, None)
@@ -129,8 +175,9 @@ def process_single_schedule_progress(schedule_id: str):
     logging.info(f"Processing schedule progress for schedule_id: {schedule_id}")
     db_session_generator = get_db_session()
     db = next(db_session_generator)
+    rc = get_redis_client_for_app()
     try:
-        check_and_update_schedule_progress(db=db, schedule_id=schedule_id)
+        check_and_update_schedule_progress(db=db, schedule_id=schedule_id, rc=rc)
         logging.info(f"Successfully processed schedule progress for schedule_id: {schedule_id}")
     except Exception as e:
         logging.error(f"Error processing schedule progress for schedule_id {schedule_id}: {e}", exc_info=True)
@@ -170,18 +217,232 @@ def dispatch_all_schedule_progress_checks():
         except StopIteration:
             pass
 
+# --- DATA EXPORT ---
+
+@celery_app.task(name='app.background_worker.tasks.run_data_export')
+def run_data_export(job_id: str):
+    """
+    Celery task exporting sensor data of export job into Parquet/Arrow IPC file.
+    """
+    logging.info(f"Running data export job: {job_id}")
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    rc = get_redis_client_for_app()
+    try:
+        job = run_export(db=db, rc=rc, job_id=job_id)
+        logging.info(f"Data export job {job_id} ended with status: {job.get('status')}")
+    except Exception as e:
+        logging.error(f"Error in data export job {job_id}: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- RULE BACKTEST ---
+
+@celery_app.task(name='app.background_worker.tasks.run_rule_backtest')
+def run_rule_backtest(job_id: str):
+    """
+    Celery task replaying sensor history of backtest job through rules (no actions run).
+    """
+    logging.info(f"Running rule backtest job: {job_id}")
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    rc = get_redis_client_for_app()
+    try:
+        job = run_backtest(db=db, rc=rc, job_id=job_id)
+        logging.info(f"Rule backtest job {job_id} ended with status: {job.get('status')}")
+    except Exception as e:
+        logging.error(f"Error in rule backtest job {job_id}: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- GROUP EVENTS BUFFER ---
+
+@celery_app.task(name='app.background_worker.tasks.flush_group_events')
+def flush_group_events():
+    """
+    Celery task writing buffered rule events into group_events.
+    """
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    rc = get_redis_client_for_app()
+    try:
+        written = flush_events(db, rc)
+        if written:
+            logging.info(f"Flushed {written} buffered group events.")
+    except Exception as e:
+        logging.error(f"Error in flush_group_events: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- GROUP EVENTS PARTITIONS ---
+
+@celery_app.task(name='app.background_worker.tasks.maintain_group_event_partitions')
+def maintain_group_event_partitions():
+    """
+    Celery task creating upcoming monthly partitions of group_events
+    and archiving partitions older than retention.
+    """
+    logging.info("Maintaining group_events partitions...")
+    db_session_generator = get_maintenance_db_session()
+    db = next(db_session_generator)
+    if db is None:
+        return
+    try:
+        created = ensure_group_event_partitions(db)
+        archived = archive_old_group_event_partitions(db)
+        logging.info(f"group_events partitions maintained. Created: {created}, archived: {[a['name'] for a in archived]}")
+    except Exception as e:
+        logging.error(f"Error in maintain_group_event_partitions: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+@worker_ready.connect
+@beat_init.connect
+def ensure_group_event_partitions_on_startup(sender=None, **kwargs):
+    """
+    Creates partitions of current and upcoming months when worker or beat starts,
+    so events don't wait in the default partition for the first daily maintenance run.
+    """
+    db_session_generator = get_maintenance_db_session()
+    db = next(db_session_generator)
+    if db is None:
+        return
+    try:
+        created = ensure_group_event_partitions(db)
+        logging.info(f"group_events partitions checked at startup. Created: {created}")
+    except Exception as e:
+        logging.error(f"Error creating group_events partitions at startup: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- JWT BLOCKLIST ---
+
+@celery_app.task(name='app.background_worker.tasks.prune_jwt_blocklist')
+def prune_jwt_blocklist():
+    """
+    Celery task deleting blocklist entries of expired tokens.
+    """
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    rc = get_redis_client_for_app()
+    try:
+        deleted = prune_revoked_tokens(db, rc)
+        logging.info(f"Pruned {deleted} expired jwt_blocklist rows.")
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error in prune_jwt_blocklist: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- HUB SESSIONS ---
+
+@celery_app.task(name='app.background_worker.tasks.reap_expired_hub_sessions')
+def reap_expired_hub_sessions():
+    """
+    Celery task deleting expired hub sessions from session_auth in batches.
+    Live sessions in redis expire by TTL.
+    """
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    try:
+        deleted = delete_expired_sessions(db)
+        if deleted:
+            logging.info(f"Reaped {deleted} expired hub sessions.")
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error in reap_expired_hub_sessions: {e}", exc_info=True)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+
+# --- RULE ACTIONS ---
+
+@celery_app.task(bind=True, name='app.background_worker.tasks.execute_rule_actions',
+                 acks_late=True, max_retries=RULE_ACTION_MAX_RETRIES)
+def execute_rule_actions(self, job: dict, start: int = 0):
+    """
+    Celery task executing actions of a triggered rule (job of action_queue.build_action_job)
+    in execution_order. Failed action is retried with backoff, the job resumes from it.
+    """
+    db_session_generator = get_db_session()
+    db = next(db_session_generator)
+    rc = get_redis_client_for_app()
+    try:
+        failed = run_rule_actions(job, db, rc, start)
+    finally:
+        try:
+            next(db_session_generator, None)
+        except StopIteration:
+            pass
+    if failed is None:
+        return
+    action_type = job['actions'][failed].get('action_type')
+    if self.request.retries >= self.max_retries:
+        logging.error(f"Giving up action '{action_type}' of rule {job.get('rule_id')} after {self.request.retries} retries, "
+                      f"{len(job['actions']) - failed - 1} following actions skipped.")
+        return
+    logging.warning(f"Action '{action_type}' of rule {job.get('rule_id')} failed, retry {self.request.retries + 1}.")
+    raise self.retry(kwargs={'job': job, 'start': failed}, args=(),
+                     countdown=RULE_ACTION_RETRY_SECONDS * 2 ** self.request.retries)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_rule_stats_on_shutdown(**kwargs):
+    """Writes rule statistics counters not flushed yet (prefork children exit without atexit)."""
+    flush_rule_stats(get_redis_client_for_app())
+
 # --- Celery Beat Schedule ---
 celery_app.conf.beat_schedule = {
-    'dispatch-group-rule-checks-every-minute': { # Renamed for clarity
-        'task': 'app.background_worker.tasks.dispatch_scheduled_rule_checks',
-        'schedule': crontab(minute='*'), # Every minute
+    'dispatch-due-schedule-rules': {
+        'task': 'app.background_worker.tasks.dispatch_due_schedule_rules',
+        'schedule': crontab(minute='*'), # Every minute, schedules have minute resolution
     },
     'dispatch-schedule-progress-checks-hourly': {
         'task': 'app.background_worker.tasks.dispatch_all_schedule_progress_checks',
         'schedule': crontab(minute='0', hour='*'), # Every hour at minute 0
     },
+    'flush-group-events': {
+        'task': 'app.background_worker.tasks.flush_group_events',
+        'schedule': timedelta(seconds=EVENT_FLUSH_INTERVAL_SECONDS),
+    },
+    'maintain-group-event-partitions-daily': {
+        'task': 'app.background_worker.tasks.maintain_group_event_partitions',
+        'schedule': crontab(minute='30', hour='3'), # Every day at 03:30
+    },
+    'prune-jwt-blocklist-hourly': {
+        'task': 'app.background_worker.tasks.prune_jwt_blocklist',
+        'schedule': crontab(minute='15', hour='*'), # Every hour at minute 15
+    },
+    'reap-expired-hub-sessions': {
+        'task': 'app.background_worker.tasks.reap_expired_hub_sessions',
+        'schedule': crontab(minute='*/10'), # Every 10 minutes
+    },
 }
 celery_app.conf.timezone = 'UTC'
+celery_app.conf.task_routes = {
+    'app.background_worker.tasks.execute_rule_actions': {'queue': RULE_ACTIONS_QUEUE},
+    'app.background_worker.tasks.run_rule_backtest': {'queue': BACKTEST_QUEUE},
+}
 
 # It's good practice to ensure logging is configured, especially for background workers.
 # If not configured elsewhere, a basic config here can be useful for debugging.
@@ -10,22 +10,36 @@ import json
 from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import SQLAlchemyError
 import redis 
-from typing import Dict, Any, Optional, List, TypedDict, Set
+from typing import Dict, Any, Optional, List, TypedDict, Set, FrozenSet
+
+from app.cache.local_cache import LocalLRUCache, MISSING, ensure_invalidation_listener, publish_invalidation
 
 try:
     from app.db_man.pqsql.models import ( Rule, RuleInitiator, RuleAction, Group, RuleSet,
-                                          Config as HubConfig, ServerConfig )
+                                          Config as HubConfig, ServerConfig, group_tags )
 except ImportError:
     # Fallback if models.py is in a different relative location
     logging.warning("Could not import models from app.db_man.pqsql, falling back to top-level import.")
     from models import ( Rule, RuleInitiator, RuleAction, Group, RuleSet,
-                         Config as HubConfig, ServerConfig )
+                         Config as HubConfig, ServerConfig, group_tags )
 
 
 # Cache TTLs
 # TODO: ADD THIS TO ENVIROMENT VARIABLES
 CACHE_TTL_SECONDS = 3600 # Cache Hub/Server configs for 1 hour
 RULES_CACHE_TTL_SECONDS = 600 # Cache group rules for 10 min
+BEEHIVES_SNAPSHOT_TTL_SECONDS = 60 # Upper bound of staleness of /sapi/beehives readings (ingest doesn't invalidate it)
+BEEHIVES_SNAPSHOT_KEY = "snapshot:sapi:beehives"
+GROUP_RULES_KEY = "rules:group:{}"
+# Groups whose entries in schedule index need resync (app/engines/rules_engine/schedule_index.py)
+SCHEDULE_DIRTY_GROUPS_KEY = "rules:schedule:dirty"
+GROUP_TAGS_KEY = "tags:group:{}"
+# Member of cached tag set of group without tags (empty set can't be stored)
+_NO_TAGS = ""
+
+_group_tags_local = LocalLRUCache("group_tags")
+# Decoded rule lists, read on every reading (json.loads of the Redis entry each time otherwise)
+_group_rules_local = LocalLRUCache("group_rules")
 
 
 # --- Hub/Client Configuration Loading ---
@@ -148,6 +162,44 @@ def get_server_config_cached(db: Session, rc: Optional[redis.Redis]) -> Dict[str
 
     return server_config_map
 
+def rule_to_dict(rule: Rule) -> Dict[str, Any]:
+    """Converts Rule ORM (initiators, their tags and actions loaded) into RuleDict of the rules cache."""
+    # Convert initiators
+    initiators = [
+        {'initiator_table_id': i.initiator_table_id,
+         'initiator_ref_id': i.initiator_ref_id,
+         'type': i.type,
+         'operator': i.operator,
+         'value': str(i.value) if i.value is not None else None, # Convert Decimal to string
+         'value2': str(i.value2) if i.value2 is not None else None, # Convert Decimal to string
+         'hysteresis': str(i.hysteresis) if i.hysteresis is not None else None,
+         'schedule_type': i.schedule_type, # Include schedule details
+         'schedule_value': i.schedule_value,
+         'tags': sorted(tag.id for tag in i.tags) # List, set was cached as its str()
+         } for i in rule.initiators
+    ]
+    # Convert actions, ensuring sorted order
+    actions = sorted([
+        {'action_id': a.action_id,
+         'action_type': a.action_type,
+         'action_params': a.action_params, # Assumes JSONB loads as dict
+         'execution_order': a.execution_order}
+        for a in rule.actions
+        ], key=lambda x: x['execution_order']) # Sort by execution order
+
+    # Build the final RuleDict for this rule
+    return {
+        'id': rule.id,
+        'name': rule.name,
+        'logical_operator': rule.logical_operator,
+        'priority': rule.priority, # Include priority field
+        'hold_seconds': rule.hold_seconds,
+        'cooldown_seconds': rule.cooldown_seconds,
+        'initiators': initiators,
+        'actions': actions
+    }
+
+
 # --- Rule Loading ---
 
 def get_rules_for_group_cached(db: Session, rc: Optional[redis.Redis], group_id: str) -> Dict:
@@ -161,10 +213,14 @@ def get_rules_for_group_cached(db: Session, rc: Optional[redis.Redis], group_id:
         logging.warning("Attempted to get rules for empty group_id.")
         return []
 
-    cache_key = f"rules:group:{group_id}"
+    cache_key = GROUP_RULES_KEY.format(group_id)
     group_rules_list = []
 
-    # 1. Try Cache
+    # 1. Try Cache (process local, then Redis)
+    ensure_invalidation_listener(rc)
+    local_rules = _group_rules_local.get(group_id)
+    if local_rules is not MISSING:
+        return local_rules
     if rc:
         try:
             cached_data = rc.get(cache_key)
@@ -173,6 +229,7 @@ def get_rules_for_group_cached(db: Session, rc: Optional[redis.Redis], group_id:
                 loaded_list = json.loads(cached_data)
                 # Perform basic validation on cached structure if needed
                 if isinstance(loaded_list, list):
+                    _group_rules_local.set(group_id, loaded_list)
                     return loaded_list # Return cached (already sorted) list
                 else:
                     logging.error(f"Cached group rule data invalid format for {group_id}. Refetching.")
@@ -227,39 +284,7 @@ def get_rules_for_group_cached(db: Session, rc: Optional[redis.Redis], group_id:
                     active_rules_orm.add(rule)
 
         # Convert the unique set of ORM rules to dictionaries
-        temp_list = []
-        for rule in active_rules_orm:
-            # Convert initiators
-            initiators = [
-                {'initiator_table_id': i.initiator_table_id,
-                 'initiator_ref_id': i.initiator_ref_id,
-                 'type': i.type,
-                 'operator': i.operator,
-                 'value': str(i.value) if i.value is not None else None, # Convert Decimal to string
-                 'value2': str(i.value2) if i.value2 is not None else None, # Convert Decimal to string
-                 'schedule_type': i.schedule_type, # Include schedule details
-                 'schedule_value': i.schedule_value,
-                 'tags': set((tag.id for tag in i.tags))
-                 } for i in rule.initiators
-            ]
-            # Convert actions, ensuring sorted order
-            actions = sorted([
-                {'action_id': a.action_id,
-                 'action_type': a.action_type,
-                 'action_params': a.action_params, # Assumes JSONB loads as dict
-                 'execution_order': a.execution_order}
-                for a in rule.actions
-                ], key=lambda x: x['execution_order']) # Sort by execution order
-
-            # Build the final RuleDict for this rule
-            temp_list.append({
-                'id': rule.id,
-                'name': rule.name,
-                'logical_operator': rule.logical_operator,
-                'priority': rule.priority, # Include priority field
-                'initiators': initiators,
-                'actions': actions
-            })
+        temp_list = [rule_to_dict(rule) for rule in active_rules_orm]
 
         # Sort the final list of rule dictionaries by priority (higher number = higher priority)
         group_rules_list = sorted(temp_list, key=lambda x: x['priority'], reverse=False)
@@ -282,6 +307,7 @@ def get_rules_for_group_cached(db: Session, rc: Optional[redis.Redis], group_id:
             logging.error(f"Redis SETEX error group rules '{cache_key}': {e}")
         except TypeError as e:
              logging.error(f"Failed serialize group rules cache '{cache_key}': {e}")
+    _group_rules_local.set(group_id, group_rules_list)
 
     return group_rules_list
 
@@ -311,13 +337,108 @@ def invalidate_server_config_cache(rc: Optional[redis.Redis]):
         logging.error(f"Redis DELETE error invalidating server config cache {cache_key}: {e}")
 
 def invalidate_group_rules_cache(rc: Optional[redis.Redis], group_id: str):
-    """Clears the rule cache for a specific group."""
-    if not rc or not group_id:
+    """Clears the rule cache for a specific group (Redis and local caches of all workers)."""
+    if not group_id:
+        return
+    if rc:
+        cache_key = GROUP_RULES_KEY.format(group_id)
+        try:
+            pipe = rc.pipeline()
+            pipe.delete(cache_key)
+            pipe.sadd(SCHEDULE_DIRTY_GROUPS_KEY, group_id)
+            deleted_count = pipe.execute()[0]
+            if deleted_count > 0:
+                 logging.info(f"Invalidated rule cache for group: {group_id}")
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis DELETE error invalidating group rule cache {group_id}: {e}")
+    publish_invalidation(rc, "group_rules", group_id)
+
+
+# --- Group Tags ---
+
+def get_group_tag_ids_cached(db: Session, rc: Optional[redis.Redis], group_id: str) -> FrozenSet[str]:
+    """
+    Returns ids of tags assigned to group, from local cache, Redis set or DB.
+    Unknown group has no tags.
+    """
+    if not group_id:
+        return frozenset()
+    ensure_invalidation_listener(rc)
+    cached = _group_tags_local.get(group_id)
+    if cached is not MISSING:
+        return cached
+
+    cache_key = GROUP_TAGS_KEY.format(group_id)
+    if rc:
+        try:
+            members = rc.smembers(cache_key)
+            if members:
+                tag_ids = frozenset(m.decode() if isinstance(m, bytes) else m for m in members) - {_NO_TAGS}
+                _group_tags_local.set(group_id, tag_ids)
+                return tag_ids
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis SMEMBERS error group tags '{cache_key}': {e}. Falling back.")
+
+    tag_ids = frozenset(
+        tag_id for (tag_id,) in db.query(group_tags.c.tag_id).filter(group_tags.c.group_id == group_id).all()
+    )
+    if rc:
+        try:
+            pipe = rc.pipeline()
+            pipe.delete(cache_key)
+            pipe.sadd(cache_key, *(tag_ids or {_NO_TAGS}))
+            pipe.expire(cache_key, CACHE_TTL_SECONDS)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis SADD error group tags '{cache_key}': {e}")
+    _group_tags_local.set(group_id, tag_ids)
+    return tag_ids
+
+
+def invalidate_group_tags_cache(rc: Optional[redis.Redis], group_id: Optional[str] = None):
+    """Clears cached tags of group (all groups when group_id is None, e.g. tag deleted)."""
+    if rc:
+        try:
+            if group_id:
+                rc.delete(GROUP_TAGS_KEY.format(group_id))
+            else:
+                keys = list(rc.scan_iter(match=GROUP_TAGS_KEY.format("*"), count=500))
+                if keys:
+                    rc.delete(*keys)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis DELETE error invalidating group tags cache {group_id}: {e}")
+    publish_invalidation(rc, "group_tags", group_id)
+
+
+# --- Public Beehives Snapshot ---
+
+def get_beehives_snapshot(rc: Optional[redis.Redis]) -> Optional[Dict[str, Any]]:
+    """Returns formatted /sapi/beehives response from cache or None."""
+    if not rc:
+        return None
+    try:
+        cached = rc.get(BEEHIVES_SNAPSHOT_KEY)
+        if cached:
+            logging.debug("Cache HIT for beehives snapshot")
+            return json.loads(cached)
+    except redis.exceptions.RedisError as e: logging.error(f"Redis GET error beehives snapshot: {e}. Falling back.")
+    except json.JSONDecodeError as e: logging.error(f"Redis cache corrupt beehives snapshot: {e}. Falling back.")
+    return None
+
+def set_beehives_snapshot(rc: Optional[redis.Redis], snapshot: Dict[str, Any]):
+    """Stores formatted /sapi/beehives response."""
+    if not rc:
         return
-    cache_key = f"rules:group:{group_id}"
     try:
-        deleted_count = rc.delete(cache_key)
-        if deleted_count > 0:
-             logging.info(f"Invalidated rule cache for group: {group_id}")
+        rc.setex(BEEHIVES_SNAPSHOT_KEY, BEEHIVES_SNAPSHOT_TTL_SECONDS, json.dumps(snapshot, default=str))
+    except redis.exceptions.RedisError as e: logging.error(f"Redis SETEX error beehives snapshot: {e}")
+    except TypeError as e: logging.error(f"Failed serialize beehives snapshot: {e}")
+
+def invalidate_beehives_snapshot(rc: Optional[redis.Redis]):
+    """Clears snapshot of /sapi/beehives (groups, sensors, tags or events changed)."""
+    if not rc:
+        return
+    try:
+        rc.delete(BEEHIVES_SNAPSHOT_KEY)
     except redis.exceptions.RedisError as e:
-        logging.error(f"Redis DELETE error invalidating group rule cache {group_id}: {e}")
+        logging.error(f"Redis DELETE error invalidating beehives snapshot: {e}")
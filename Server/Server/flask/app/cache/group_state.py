@@ -0,0 +1,184 @@
+########################################################
+# cache/group_state.py measurement state of groups
+# Last version of update: v0.95
+# app/cache/group_state.py
+########################################################
+
+# Latest reading of every sensor of a group and running aggregate of the
+# readings at the newest timestamp, per measurement. Rule engine reads the
+# average ("last value" of measurement initiators) with one HMGET instead of
+# two SQL statements over sensors. Same semantics as the SQL it replaces:
+# avg(last_reading_value) of sensors whose last_reading_time is the latest.
+#
+# Key layout
+# groupstate:{group_id} -> hash, per measurement m:
+#     {m}:ready              state of m was seeded from Postgres
+#     {m}:latest             newest reading time (unix microseconds)
+#     {m}:sum, {m}:count     aggregate of readings at {m}:latest
+#     {m}:v:{sensor_id}      latest value of sensor
+#     {m}:t:{sensor_id}      time of it
+#
+# Measurements are seeded lazily from sensors.last_reading_* on first read,
+# updates of unseeded measurements are skipped (seed would miss other sensors).
+# Rule engine applies each evaluated reading itself (apply_group_reading), so
+# trigger state of measurement rules steps on the group aggregate; the batch
+# update after ingest then only adds readings no rule looked at.
+# The hash is deleted when sensors of the group change (assign/unassign).
+
+import os
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, List
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db_man.pqsql.models import Sensor
+from app.cache.redis_scripts import get_script
+
+
+GROUP_STATE_KEY = "groupstate:{}"
+GROUP_STATE_TTL_SECONDS = int(os.getenv("GROUP_STATE_TTL_SECONDS", "86400"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# KEYS[1] state hash, ARGV: measurement, sensor_id, value, time (us), ttl
+_UPDATE_LUA = """
+local key, m, sid = KEYS[1], ARGV[1], ARGV[2]
+local ts = tonumber(ARGV[4])
+if redis.call('HEXISTS', key, m .. ':ready') == 0 then return 0 end
+local old_t = tonumber(redis.call('HGET', key, m .. ':t:' .. sid))
+if old_t and ts <= old_t then return 0 end
+redis.call('HSET', key, m .. ':v:' .. sid, ARGV[3], m .. ':t:' .. sid, ARGV[4])
+local latest = tonumber(redis.call('HGET', key, m .. ':latest'))
+if (not latest) or ts > latest then
+    redis.call('HSET', key, m .. ':latest', ARGV[4], m .. ':sum', ARGV[3], m .. ':count', 1)
+elseif ts == latest then
+    redis.call('HINCRBYFLOAT', key, m .. ':sum', ARGV[3])
+    redis.call('HINCRBY', key, m .. ':count', 1)
+end
+redis.call('EXPIRE', key, tonumber(ARGV[5]))
+return 1
+"""
+
+# KEYS[1] state hash, ARGV: measurement, ttl, then field/value pairs
+_SEED_LUA = """
+local key, m = KEYS[1], ARGV[1]
+if redis.call('HEXISTS', key, m .. ':ready') == 1 then return 0 end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', key, m .. ':' .. ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', key, m .. ':ready', 1)
+redis.call('EXPIRE', key, tonumber(ARGV[2]))
+return 1
+"""
+
+
+def _to_us(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def _seed_measurement(db: Session, rc: redis.Redis, group_id: str, measurement: str) -> Optional[float]:
+    """Seeds state of measurement from sensors table, returns its average."""
+    rows = db.execute(
+        select(Sensor.id, Sensor.last_reading_value, Sensor.last_reading_time)
+        .where(Sensor.group_id == group_id, Sensor.measurement == measurement, Sensor.last_reading_time.isnot(None))
+    ).all()
+    fields: List[Any] = []
+    latest = None
+    total = 0.0
+    count = 0
+    for sensor_id, value, reading_time in rows:
+        reading_us = _to_us(reading_time)
+        fields += [f"v:{sensor_id}", repr(float(value)) if value is not None else "", f"t:{sensor_id}", reading_us]
+        if latest is None or reading_us > latest:
+            latest, total, count = reading_us, 0.0, 0
+        if reading_us == latest and value is not None:
+            total += float(value)
+            count += 1
+    if latest is not None:
+        fields += ["latest", latest, "sum", repr(total), "count", count]
+    get_script(rc, "_group_state_seed", _SEED_LUA)(
+        keys=[GROUP_STATE_KEY.format(group_id)], args=[measurement, GROUP_STATE_TTL_SECONDS] + fields
+    )
+    return total / count if count else None
+
+
+def get_group_measurement_average(db: Session, rc: redis.Redis, group_id: str, measurement: str) -> Optional[float]:
+    """
+    Returns average of latest readings of measurement in group (None when no reading).
+
+    Raises:
+        RedisError: state can't be read (caller falls back to SQL)
+    """
+    key = GROUP_STATE_KEY.format(group_id)
+    ready, total, count = rc.hmget(key, f"{measurement}:ready", f"{measurement}:sum", f"{measurement}:count")
+    if ready is None:
+        return _seed_measurement(db, rc, group_id, measurement)
+    if not count or int(count) == 0:
+        return None
+    return float(total) / int(count)
+
+
+def apply_group_reading(db: Session, rc: redis.Redis, group_id: str, measurement: str, sensor_id: str,
+                        value: Any, reading_time: Optional[datetime]) -> Optional[float]:
+    """
+    Applies one reading to state of group (seeded when needed) and returns the average
+    of measurement after it. Reading not newer than the stored one of sensor changes nothing.
+
+    Raises:
+        RedisError: state can't be updated (caller falls back to SQL)
+    """
+    key = GROUP_STATE_KEY.format(group_id)
+    if not rc.hexists(key, f"{measurement}:ready"):
+        _seed_measurement(db, rc, group_id, measurement)
+    get_script(rc, "_group_state_update", _UPDATE_LUA)(
+        keys=[key], args=[measurement, sensor_id, repr(float(value)), _to_us(reading_time or datetime.now(timezone.utc)),
+              GROUP_STATE_TTL_SECONDS]
+    )
+    total, count = rc.hmget(key, f"{measurement}:sum", f"{measurement}:count")
+    if not count or int(count) == 0:
+        return None
+    return float(total) / int(count)
+
+
+def update_group_state(rc: Optional[redis.Redis], readings: List[Dict[str, Any]]):
+    """
+    Applies accepted readings of one ingest batch (entries of last_values with group_id),
+    readings not newer than the stored one of the sensor are ignored.
+    """
+    if rc is None:
+        return
+    grouped = [reading for reading in readings if reading.get("group_id")]
+    if not grouped:
+        return
+    try:
+        script = get_script(rc, "_group_state_update", _UPDATE_LUA)
+        pipe = rc.pipeline(transaction=False)
+        for reading in grouped:
+            script(
+                keys=[GROUP_STATE_KEY.format(reading["group_id"])],
+                args=[reading["measurement_type"], reading["sensor_id"], repr(float(reading["value"])),
+                      _to_us(reading["timestamp_dt"]), GROUP_STATE_TTL_SECONDS],
+                client=pipe,
+            )
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        # State may now lag behind, drop touched groups so they are seeded again
+        logging.error(f"Redis error updating group measurement state: {e}")
+        invalidate_group_state(rc, *{reading["group_id"] for reading in grouped})
+
+
+def invalidate_group_state(rc: Optional[redis.Redis], *group_ids: Optional[str]):
+    """Drops measurement state of groups (sensor membership changed)."""
+    keys = [GROUP_STATE_KEY.format(group_id) for group_id in group_ids if group_id]
+    if rc is None or not keys:
+        return
+    try:
+        rc.delete(*keys)
+        logging.debug(f"Invalidated measurement state of groups: {group_ids}")
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis DELETE error invalidating group state {group_ids}: {e}")
@@ -0,0 +1,115 @@
+########################################################
+# cache/hub_sessions.py live hub sessions in redis
+# Last version of update: v0.95
+# app/cache/hub_sessions.py
+########################################################
+
+# session_auth (Postgres) is the record of every hub handshake, live sessions
+# are also kept in Redis with native TTL, so authentication of hive requests
+# doesn't query the table. Expired rows are deleted by celery task
+# reap_expired_hub_sessions (app/db_man/pqsql/delete.py).
+#
+# Key layout
+# hubsession:{session_id}      -> hash(client_id, session_key_hash, session_end), expires at session_end
+# hubsession:hub:{client_id}   -> set of session ids of the hub (invalidation on hub delete)
+
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+import redis
+
+
+HUB_SESSIONS_IN_REDIS = os.getenv("HUB_SESSIONS_IN_REDIS", "1") == "1"
+
+SESSION_KEY = "hubsession:{}"
+HUB_SESSIONS_KEY = "hubsession:hub:{}"
+
+
+def _decode(raw: Dict[Any, Any]) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+
+
+def cache_session(rc: Optional[redis.Redis], session_id: str, client_id: str, session_key_hash: str,
+                  session_end: datetime):
+    """Stores live session, nothing is stored for expired one."""
+    if rc is None or not HUB_SESSIONS_IN_REDIS:
+        return
+    if session_end.tzinfo is None:
+        session_end = session_end.replace(tzinfo=timezone.utc)
+    if session_end <= datetime.now(timezone.utc):
+        return
+    key = SESSION_KEY.format(session_id)
+    hub_key = HUB_SESSIONS_KEY.format(client_id)
+    try:
+        pipe = rc.pipeline()
+        pipe.hset(key, mapping={
+            "client_id": client_id,
+            "session_key_hash": session_key_hash,
+            "session_end": session_end.isoformat(),
+        })
+        pipe.expireat(key, session_end)
+        pipe.sadd(hub_key, session_id)
+        # Sessions have the same length, the newest one ends last
+        pipe.expireat(hub_key, session_end)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error caching hub session {session_id}: {e}")
+
+
+def get_cached_session(rc: Optional[redis.Redis], session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns live session (client_id, session_key_hash, session_end) or None
+    when it is not cached (caller falls back to Postgres).
+    """
+    if rc is None or not HUB_SESSIONS_IN_REDIS or not session_id:
+        return None
+    try:
+        raw = rc.hgetall(SESSION_KEY.format(session_id))
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading hub session {session_id}: {e}")
+        return None
+    if not raw:
+        return None
+    entry: Dict[str, Any] = _decode(raw)
+    try:
+        entry["session_end"] = datetime.fromisoformat(entry["session_end"])
+    except (KeyError, ValueError) as e:
+        logging.warning(f"Malformed hub session entry {session_id}: {e}")
+        return None
+    if entry["session_end"] <= datetime.now(timezone.utc):
+        # Key TTL is in seconds, session may end just before it
+        return None
+    return entry
+
+
+def invalidate_session(rc: Optional[redis.Redis], session_id: str, client_id: Optional[str] = None):
+    if rc is None:
+        return
+    try:
+        pipe = rc.pipeline()
+        pipe.delete(SESSION_KEY.format(session_id))
+        if client_id:
+            pipe.srem(HUB_SESSIONS_KEY.format(client_id), session_id)
+        pipe.execute()
+        logging.debug(f"Hub session {session_id} removed from cache.")
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error invalidating hub session {session_id}: {e}")
+
+
+def invalidate_hub_sessions(rc: Optional[redis.Redis], client_id: str):
+    """Removes all cached sessions of the hub (hub deleted)."""
+    if rc is None:
+        return
+    hub_key = HUB_SESSIONS_KEY.format(client_id)
+    try:
+        session_ids = rc.smembers(hub_key)
+        keys = [SESSION_KEY.format(s.decode() if isinstance(s, bytes) else s) for s in session_ids]
+        rc.delete(hub_key, *keys)
+        logging.debug(f"Removed {len(keys)} cached sessions of hub {client_id}.")
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error invalidating sessions of hub {client_id}: {e}")
@@ -0,0 +1,289 @@
+########################################################
+# cache/jwt_revocation.py revocation cache of JWT blocklist
+# Last version of update: v0.95
+# app/cache/jwt_revocation.py
+########################################################
+
+# jwt_blocklist (Postgres) stays the source of truth, Redis and a per process
+# Bloom filter answer the common case (token is not revoked) without DB.
+#
+# Key layout
+# jwt:revoked          -> sorted set, member jti, score exp of the token (unix time)
+# jwt:revoked:channel  -> pub/sub channel, message is jti of newly revoked token
+#
+# Check of jti:
+#   not in Bloom filter         -> not revoked (no round trip)
+#   maybe in Bloom filter       -> ZSCORE jwt:revoked, miss is confirmed in Postgres
+#                                  (false positive of filter or lost Redis data)
+#   filter not synchronized     -> ZSCORE jwt:revoked, miss is confirmed in Postgres
+#   Redis unavailable           -> Postgres
+# Filter is filled from jwt_blocklist and jwt:revoked, kept up to date by the
+# channel and rebuilt every JWT_BLOOM_REBUILD_SECONDS, so expired tokens drop
+# out of it and revocations missed by Redis are picked up. Rows without
+# expires_at (revoked before it existed) count as revoked until created_at +
+# JWT_BLOCKLIST_LEGACY_RETENTION_DAYS, the longest token lifetime.
+
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any
+
+import redis
+from sqlalchemy import select, delete, or_, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db_man.pqsql.models import JwtBlocklist
+
+
+REVOKED_KEY = "jwt:revoked"
+REVOKED_CHANNEL = "jwt:revoked:channel"
+
+JWT_BLOOM_CAPACITY = int(os.getenv("JWT_BLOOM_CAPACITY", "100000"))
+JWT_BLOOM_ERROR_RATE = float(os.getenv("JWT_BLOOM_ERROR_RATE", "0.001"))
+JWT_BLOOM_REBUILD_SECONDS = int(os.getenv("JWT_BLOOM_REBUILD_SECONDS", "600"))
+# Rows without expires_at (revoked before it existed) are kept this long,
+# not shorter than the longest token lifetime (refresh token, 30 days)
+JWT_BLOCKLIST_LEGACY_RETENTION_DAYS = int(os.getenv("JWT_BLOCKLIST_LEGACY_RETENTION_DAYS", "30"))
+JWT_BLOCKLIST_PRUNE_BATCH_SIZE = int(os.getenv("JWT_BLOCKLIST_PRUNE_BATCH_SIZE", "5000"))
+
+
+class BloomFilter:
+    """Bloom filter on bytearray, k positions from double hashing of one blake2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        # m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# State of this process, reset after fork (uwsgi workers)
+_state: Dict[str, Any] = {"pid": None, "bloom": None, "built_at": 0.0, "listener": None, "synced": False, "pending": None}
+_state_lock = threading.Lock()
+_stats: Dict[str, int] = {"bloom_negative": 0, "redis_checks": 0, "db_checks": 0, "revoked_hits": 0}
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _on_revoked_message(message):
+    if message.get("type") != "message":
+        return
+    jti = _decode(message["data"])
+    if _state["bloom"] is not None:
+        _state["bloom"].add(jti)
+    if _state["pending"] is not None:
+        # Filter is being rebuilt, the scan may have missed it
+        _state["pending"].add(jti)
+
+
+def _on_listener_error(error, pubsub, thread):
+    # Revocations published while disconnected would be missed, checks go to Redis until restart
+    logging.warning(f"JWT revocation listener stopped: {error}")
+    _state["synced"] = False
+    thread.stop()
+    try:
+        pubsub.close()
+    except Exception:
+        pass
+
+
+def _start_listener(rc: redis.Redis):
+    pubsub = rc.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{REVOKED_CHANNEL: _on_revoked_message})
+    _state["listener"] = pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=_on_listener_error)
+
+
+def _sync_from_db(db: Session, rc: redis.Redis) -> int:
+    """Writes unexpired blocklist rows into jwt:revoked (lost Redis data, failed revoke_token)."""
+    now = datetime.now(timezone.utc)
+    legacy_retention = timedelta(days=JWT_BLOCKLIST_LEGACY_RETENTION_DAYS)
+    rows = db.execute(
+        select(JwtBlocklist.jti, JwtBlocklist.expires_at, JwtBlocklist.created_at).where(or_(
+            JwtBlocklist.expires_at > now,
+            and_(JwtBlocklist.expires_at.is_(None),
+                 or_(JwtBlocklist.created_at.is_(None), JwtBlocklist.created_at > now - legacy_retention)),
+        ))
+    ).all()
+    if rows:
+        rc.zadd(REVOKED_KEY, {
+            jti: (expires_at or (created_at or now) + legacy_retention).timestamp()
+            for jti, expires_at, created_at in rows
+        })
+    return len(rows)
+
+
+def _rebuild_filter(rc: redis.Redis, db: Optional[Session]):
+    """Builds new filter from unexpired members of jwt:revoked."""
+    if db is not None:
+        _sync_from_db(db, rc)
+    _state["pending"] = set()
+    try:
+        now = time.time()
+        members = [_decode(jti) for jti, exp in rc.zscan_iter(REVOKED_KEY) if exp > now]
+        bloom = BloomFilter(max(JWT_BLOOM_CAPACITY, len(members) * 2), JWT_BLOOM_ERROR_RATE)
+        for jti in members + list(_state["pending"]):
+            bloom.add(jti)
+        _state.update(bloom=bloom, built_at=time.monotonic())
+    finally:
+        _state["pending"] = None
+    logging.debug(f"JWT revocation filter rebuilt with {len(members)} tokens (pid {os.getpid()}).")
+
+
+def _ensure_filter(rc: redis.Redis, db: Optional[Session]) -> bool:
+    """
+    Starts listener and builds filter in this process when needed.
+
+    Returns:
+        bool: True if the filter can answer negative checks
+    """
+    listener = _state["listener"]
+    if (_state["pid"] == os.getpid() and _state["synced"] and listener is not None and listener.is_alive()
+            and time.monotonic() - _state["built_at"] < JWT_BLOOM_REBUILD_SECONDS):
+        return True
+    if not _state_lock.acquire(blocking=False):
+        # Other greenlet is building it, use Redis meanwhile
+        return False
+    try:
+        if _state["pid"] != os.getpid():
+            # Listener thread of parent process does not exist after fork
+            _state.update(pid=os.getpid(), bloom=None, listener=None, synced=False)
+        listener = _state["listener"]
+        if listener is None or not listener.is_alive():
+            _state["synced"] = False
+            # Subscribe before reading the set, revocations in between are not lost
+            _start_listener(rc)
+        _rebuild_filter(rc, db)
+        _state["synced"] = True
+        return True
+    except (redis.exceptions.RedisError, SQLAlchemyError) as e:
+        logging.warning(f"JWT revocation filter could not be synchronized: {e}")
+        if isinstance(e, SQLAlchemyError) and db is not None:
+            db.rollback()
+        _state["synced"] = False
+        return False
+    finally:
+        _state_lock.release()
+
+
+def _is_revoked_in_db(db: Session, jti: str) -> bool:
+    _stats["db_checks"] += 1
+    return db.execute(select(JwtBlocklist.id).where(JwtBlocklist.jti == jti)).scalar() is not None
+
+
+def is_token_revoked(rc: Optional[redis.Redis], db: Session, jti: str) -> bool:
+    """
+    Checks if JWT is revoked.
+
+    Raises:
+        SQLAlchemyError: fallback query failed (callers treat token as revoked)
+    """
+    if rc is None:
+        return _is_revoked_in_db(db, jti)
+
+    filtered = _ensure_filter(rc, db)
+    if filtered and jti not in _state["bloom"]:
+        _stats["bloom_negative"] += 1
+        return False
+
+    try:
+        _stats["redis_checks"] += 1
+        exp = rc.zscore(REVOKED_KEY, jti)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error checking revocation of jti {jti}: {e}")
+        return _is_revoked_in_db(db, jti)
+    if exp is not None:
+        _stats["revoked_hits"] += 1
+        return True
+    # Filter false positive, filter being rebuilt, or entry lost in Redis (evicted, restart)
+    revoked = _is_revoked_in_db(db, jti)
+    if revoked:
+        _stats["revoked_hits"] += 1
+    return revoked
+
+
+def revoke_token(rc: Optional[redis.Redis], jti: str, exp: int):
+    """
+    Adds jti into jwt:revoked and notifies other processes.
+    Call after the jwt_blocklist row is committed.
+    """
+    if rc is None:
+        return
+    try:
+        pipe = rc.pipeline()
+        pipe.zadd(REVOKED_KEY, {jti: exp})
+        pipe.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        pipe.publish(REVOKED_CHANNEL, jti)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        # Other processes miss it until their next rebuild, which reads jwt_blocklist
+        logging.error(f"Redis error revoking jti {jti}: {e}")
+    bloom = _state["bloom"]
+    if bloom is not None and _state["pid"] == os.getpid():
+        bloom.add(jti)
+
+
+def get_revocation_status() -> Dict[str, Any]:
+    """Returns state of revocation filter and check counters of this process."""
+    bloom = _state["bloom"]
+    listener = _state["listener"]
+    return {
+        "synced": _state["synced"] and _state["pid"] == os.getpid(),
+        "listener": listener is not None and listener.is_alive(),
+        "filterEntries": bloom.count if bloom is not None else None,
+        "filterAgeSeconds": round(time.monotonic() - _state["built_at"], 1) if bloom is not None else None,
+        "checks": dict(_stats),
+    }
+
+
+def prune_revoked_tokens(db: Session, rc: Optional[redis.Redis] = None,
+                         batch_size: int = JWT_BLOCKLIST_PRUNE_BATCH_SIZE) -> int:
+    """
+    Deletes blocklist rows of tokens which expired (they fail exp check anyway)
+    in batches, and expired members of jwt:revoked.
+
+    Returns:
+        int: number of deleted rows
+    """
+    now = datetime.now(timezone.utc)
+    expired = or_(
+        JwtBlocklist.expires_at < now,
+        and_(JwtBlocklist.expires_at.is_(None),
+             JwtBlocklist.created_at < now - timedelta(days=JWT_BLOCKLIST_LEGACY_RETENTION_DAYS)),
+    )
+    deleted = 0
+    while True:
+        ids = select(JwtBlocklist.id).where(expired).limit(batch_size).scalar_subquery()
+        result = db.execute(delete(JwtBlocklist).where(JwtBlocklist.id.in_(ids)).execution_options(synchronize_session=False))
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    if rc is not None:
+        try:
+            rc.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error pruning {REVOKED_KEY}: {e}")
+    return deleted
@@ -0,0 +1,185 @@
+########################################################
+# cache/last_value_index.py last value index of sensors and hubs
+# Last version of update: v0.95
+# app/cache/last_value_index.py
+########################################################
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List
+
+import redis
+
+from app.cache.redis_scripts import get_script
+
+# Key layout
+# lastvalue:sensor:{sensor_id}     -> hash(value, unit, time, ts, hub_id, measurement_type)
+# lastvalue:hub:{client_id}:sensors -> set of sensor ids reported by the hub
+# lastvalue:measurement:{name}     -> hash(value, unit, time, ts, sensor_id, hub_id)
+# ts is time in microseconds, an entry is replaced only by a newer reading
+SENSOR_KEY = "lastvalue:sensor:{}"
+HUB_SENSORS_KEY = "lastvalue:hub:{}:sensors"
+MEASUREMENT_KEY = "lastvalue:measurement:{}"
+
+# Measurement name used for every point written by the ingest pipeline
+INFLUX_MEASUREMENT = "sensor_measurement"
+
+# KEYS[1] entry hash, ARGV: ts (us), then field/value pairs. Newer timestamp wins,
+# re-sent or out of order readings don't overwrite newer value.
+_SET_NEWER_LUA = """
+local old_ts = tonumber(redis.call('HGET', KEYS[1], 'ts'))
+if old_ts and tonumber(ARGV[1]) < old_ts then return 0 end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def _decode(raw: Dict[Any, Any]) -> Dict[str, str]:
+    """Decodes hash returned by redis, works for clients with and without decode_responses."""
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+
+
+def _parse_entry(raw: Dict[Any, Any]) -> Optional[Dict[str, Any]]:
+    """Converts raw redis hash into entry with float value and aware datetime."""
+    if not raw:
+        return None
+    entry: Dict[str, Any] = _decode(raw)
+    try:
+        entry["value"] = float(entry["value"])
+        entry["time"] = datetime.fromisoformat(entry["time"])
+    except (KeyError, ValueError, TypeError) as e:
+        logging.warning(f"Malformed last value entry {entry}: {e}")
+        return None
+    if not entry.get("unit"):
+        entry["unit"] = None
+    return entry
+
+
+def update_last_value_index(rc: Optional[redis.Redis], client_id: str, readings: List[Dict[str, Any]]) -> bool:
+    """
+    Writes newest readings of one ingest batch into the last value index.
+
+    All keys are written in one MULTI/EXEC transaction, so readers never see
+    a sensor updated without its hub. Only the newest reading of each sensor
+    in the batch is written.
+
+    Args:
+        rc (redis.Redis): redis client, index is skipped when None
+        client_id (str): hub id
+        readings (list): dicts with sensor_id, measurement_type, value, unit, timestamp_dt
+
+    Returns:
+        bool: True if the index was written
+    """
+    if not rc or not readings:
+        return False
+
+    newest_per_sensor: Dict[str, Dict[str, Any]] = {}
+    for reading in readings:
+        current = newest_per_sensor.get(reading["sensor_id"])
+        if current is None or reading["timestamp_dt"] >= current["timestamp_dt"]:
+            newest_per_sensor[reading["sensor_id"]] = reading
+    newest_overall = max(newest_per_sensor.values(), key=lambda r: r["timestamp_dt"])
+
+    def _args(reading: Dict[str, Any]) -> List[str]:
+        time_utc = reading["timestamp_dt"].astimezone(timezone.utc)
+        ts = int(time_utc.timestamp()) * 1_000_000 + time_utc.microsecond
+        return [str(ts),
+                "value", str(reading["value"]),
+                "unit", reading.get("unit") or "",
+                "time", time_utc.isoformat(),
+                "ts", str(ts),
+                "sensor_id", reading["sensor_id"],
+                "hub_id", client_id,
+                "measurement_type", reading.get("measurement_type") or ""]
+
+    try:
+        set_newer = get_script(rc, "_last_value_set_newer", _SET_NEWER_LUA)
+        pipe = rc.pipeline(transaction=True)
+        for sensor_id, reading in newest_per_sensor.items():
+            set_newer(keys=[SENSOR_KEY.format(sensor_id)], args=_args(reading), client=pipe)
+        pipe.sadd(HUB_SENSORS_KEY.format(client_id), *newest_per_sensor.keys())
+        set_newer(keys=[MEASUREMENT_KEY.format(INFLUX_MEASUREMENT)], args=_args(newest_overall), client=pipe)
+        pipe.execute()
+        logging.debug(f"Last value index updated for hub {client_id}: {len(newest_per_sensor)} sensors")
+        return True
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error updating last value index for hub {client_id}: {e}")
+        return False
+
+
+def get_sensor_last_value(rc: Optional[redis.Redis], sensor_id: str) -> Optional[Dict[str, Any]]:
+    """Returns last indexed reading of sensor or None if not indexed."""
+    if not rc:
+        return None
+    try:
+        return _parse_entry(rc.hgetall(SENSOR_KEY.format(sensor_id)))
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis HGETALL error last value sensor {sensor_id}: {e}")
+        return None
+
+
+def get_hub_last_values(rc: Optional[redis.Redis], client_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Returns last indexed reading of every sensor of hub or None if hub is not
+    (fully) indexed, callers read InfluxDB then. Sensors without entry are pruned from the hub set.
+    """
+    if not rc:
+        return None
+    hub_key = HUB_SENSORS_KEY.format(client_id)
+    try:
+        sensor_ids = rc.smembers(hub_key)
+        if not sensor_ids:
+            return None
+        sensor_ids = sorted(s.decode() if isinstance(s, bytes) else s for s in sensor_ids)
+        pipe = rc.pipeline(transaction=False)
+        for sensor_id in sensor_ids:
+            pipe.hgetall(SENSOR_KEY.format(sensor_id))
+        raw_entries = pipe.execute()
+        missing = [sensor_id for sensor_id, raw in zip(sensor_ids, raw_entries) if not raw]
+        if missing:
+            rc.srem(hub_key, *missing)
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error reading last values of hub {client_id}: {e}")
+        return None
+    entries = [_parse_entry(raw) for raw in raw_entries]
+    if not all(entries):
+        # Partial result would hide sensors, treat as miss
+        logging.debug(f"Last value index of hub {client_id} is incomplete")
+        return None
+    return entries
+
+
+def remove_hub_last_values(rc: Optional[redis.Redis], client_id: str, sensor_ids: Optional[List[str]] = None):
+    """Removes sensors (all when sensor_ids is None) of hub from the index, used when they are deleted."""
+    if not rc:
+        return
+    hub_key = HUB_SENSORS_KEY.format(client_id)
+    try:
+        if sensor_ids is None:
+            sensor_ids = [s.decode() if isinstance(s, bytes) else s for s in rc.smembers(hub_key)]
+        pipe = rc.pipeline(transaction=True)
+        if sensor_ids:
+            pipe.delete(*(SENSOR_KEY.format(sensor_id) for sensor_id in sensor_ids))
+            pipe.srem(hub_key, *sensor_ids)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error removing last values of hub {client_id}: {e}")
+
+
+def get_measurement_last_time(rc: Optional[redis.Redis], measurement: str) -> Optional[datetime]:
+    """Returns time of last indexed reading of measurement or None."""
+    if not rc:
+        return None
+    try:
+        entry = _parse_entry(rc.hgetall(MEASUREMENT_KEY.format(measurement)))
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis HGETALL error last value measurement {measurement}: {e}")
+        return None
+    return entry["time"] if entry else None
+
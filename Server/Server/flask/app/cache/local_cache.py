@@ -0,0 +1,152 @@
+########################################################
+# cache/local_cache.py process local caches in front of redis
+# Last version of update: v0.95
+# app/cache/local_cache.py
+########################################################
+
+# Bounded LRU with TTL per worker process, for decoded values which are read
+# on every reading (group tags, compiled rules). Invalidations are published
+# on redis channel cache:invalidate ("{cache name}|{key}") and applied by a
+# listener thread of every process. While the listener of the process is not
+# running, local caches are bypassed, so a missed message can't leave stale
+# entries behind; TTL is the upper bound of staleness otherwise.
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import redis
+
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "2048"))
+LOCAL_CACHE_TTL_SECONDS = float(os.getenv("LOCAL_CACHE_TTL_SECONDS", "60"))
+
+MISSING = object()
+
+
+class LocalLRUCache:
+    """LRU dict with per entry TTL, safe for greenlets and threads."""
+
+    def __init__(self, name: str, max_entries: int = LOCAL_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = LOCAL_CACHE_TTL_SECONDS):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _caches[name] = self
+
+    def get(self, key: Hashable) -> Any:
+        """Returns cached value or MISSING."""
+        if not _listener_alive():
+            return MISSING
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drops one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "maxEntries": self.max_entries, "ttlSeconds": self.ttl_seconds}
+
+
+_caches: Dict[str, LocalLRUCache] = {}
+_listener: Dict[str, Any] = {"pid": None, "thread": None}
+_listener_lock = threading.Lock()
+
+
+def _listener_alive() -> bool:
+    thread = _listener["thread"]
+    return _listener["pid"] == os.getpid() and thread is not None and thread.is_alive()
+
+
+def _on_invalidation(message):
+    if message.get("type") != "message":
+        return
+    data = message["data"]
+    data = data.decode() if isinstance(data, bytes) else data
+    name, _, key = data.partition("|")
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate(key or None)
+
+
+def _on_listener_error(error, pubsub, thread):
+    logging.warning(f"Local cache invalidation listener stopped: {error}")
+    thread.stop()
+    try:
+        pubsub.close()
+    except Exception:
+        pass
+    # Entries may have missed invalidations while disconnected
+    for cache in _caches.values():
+        cache.invalidate()
+
+
+def ensure_invalidation_listener(rc: Optional[redis.Redis]) -> bool:
+    """Starts invalidation listener of this process (after fork) if it isn't running."""
+    if _listener_alive():
+        return True
+    if rc is None or not _listener_lock.acquire(blocking=False):
+        return False
+    try:
+        if _listener_alive():
+            return True
+        for cache in _caches.values():
+            cache.invalidate()
+        pubsub = rc.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidation})
+        _listener.update(pid=os.getpid(), thread=pubsub.run_in_thread(
+            sleep_time=1.0, daemon=True, exception_handler=_on_listener_error))
+        logging.debug(f"Local cache invalidation listener started (pid {os.getpid()}).")
+        return True
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Local cache invalidation listener could not start: {e}")
+        return False
+    finally:
+        _listener_lock.release()
+
+
+def publish_invalidation(rc: Optional[redis.Redis], name: str, key: Optional[str] = None):
+    """Drops key (or whole cache) in this process and in all other processes."""
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate(key)
+    if rc is None:
+        return
+    try:
+        rc.publish(INVALIDATION_CHANNEL, f"{name}|{key or ''}")
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis PUBLISH error invalidating local cache {name}:{key}: {e}")
+
+
+def get_local_cache_stats() -> Dict[str, Any]:
+    """Returns size and hit counters of local caches of this process."""
+    return {"listener": _listener_alive(), "caches": {name: cache.stats() for name, cache in _caches.items()}}
@@ -0,0 +1,20 @@
+########################################################
+# cache/redis_scripts.py Lua scripts of redis caches
+# Last version of update: v0.95
+# app/cache/redis_scripts.py
+########################################################
+
+# Lua scripts (group state, last value index, trigger state, schedule index)
+# are registered once per redis client and run with EVALSHA, redis-py loads
+# them again on NOSCRIPT (after redis restart or SCRIPT FLUSH).
+
+import redis
+
+
+def get_script(rc: redis.Redis, attr: str, source: str):
+    """Script object registered once per client, kept on the client as attribute attr."""
+    script = getattr(rc, attr, None)
+    if script is None:
+        script = rc.register_script(source)
+        setattr(rc, attr, script)
+    return script
@@ -0,0 +1,355 @@
+####################################################
+# Flux query builder
+# Last version of update: v0.95
+# app/db_man/influxdb/query_builder.py
+####################################################
+
+# Every Flux query of the system is defined here as named template.
+# Templates are compiled once (at import), request values are never put
+# into query text, they are sent as Influx query parameters (params.*),
+# so the query text stays the same between calls and the server can reuse it.
+# Parts which can't be parameters (operators, window sizes) are picked from
+# whitelists and produce separate named templates.
+
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Iterator
+
+from influxdb_client import InfluxDBClient  # type: ignore
+
+from app.db_man.influxdb.engine import org, bucket, token, url
+
+
+INFLUX_QUERY_TIMEOUT_MS = int(os.getenv("INFLUX_QUERY_TIMEOUT_MS", "30000"))
+# Queries slower than this are logged as warning
+INFLUX_SLOW_QUERY_MS = int(os.getenv("INFLUX_SLOW_QUERY_MS", "2000"))
+
+# Allowed characters of ids (sensor_id, client_id, bid, measurement names)
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z0-9_\-.:]{1,128}$")
+# Relative range accepted from API ("-1h", "-7d", ...)
+_RELATIVE_RANGE_RE = re.compile(r"^-(\d{1,5})([mhdw])$")
+_RANGE_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+# --- Templates ---
+
+_SENSOR_HISTORY = '''
+from(bucket: params.bucket)
+  |> range(start: params.start)
+  |> filter(fn: (r) => r._measurement == "sensor_measurement" and r.sensor_id == params.sensor_id and r._field == "value")
+  |> keep(columns: ["_time", "_value", "measurement_type"])
+  |> sort(columns: ["_time"], desc: false)
+'''
+
+_LATEST_PER_SENSOR = '''
+from(bucket: params.bucket)
+  |> range(start: params.start)
+  |> filter(fn: (r) =>
+      r._measurement == "sensor_measurement" and
+      exists r.client_id and
+      exists r.sensor_id and
+      r._field == "value"
+      )
+  |> group(columns: ["sensor_id","client_id"])
+  |> last()
+  |> keep(columns: ["_time", "_value", "sensor_id", "client_id", "standard_unit"])
+'''
+
+# Rollups of one schedule condition: per sensor and closed bucket
+# count, min, max and matches (points equal to the condition value)
+_SCHEDULE_ROLLUP = '''
+from(bucket: params.bucket)
+  |> range(start: params.start, stop: params.stop)
+  |> filter(fn: (r) => r._measurement == params.measurement and r._field == params.field)
+  |> filter(fn: (r) => contains(value: r.sensor_id, set: params.sensor_ids))
+  |> group(columns: ["sensor_id"])
+  |> window(every: __EVERY__)
+  |> reduce(
+      identity: {count: 0, min: 0.0, max: 0.0, matches: 0},
+      fn: (r, accumulator) => ({
+          count: accumulator.count + 1,
+          min: if accumulator.count == 0 or r._value < accumulator.min then r._value else accumulator.min,
+          max: if accumulator.count == 0 or r._value > accumulator.max then r._value else accumulator.max,
+          matches: accumulator.matches + (if r._value == params.value then 1 else 0),
+      }),
+  )
+'''
+
+# Bulk export, one time partition per query
+_EXPORT_CHUNK = '''
+from(bucket: params.bucket)
+  |> range(start: params.start, stop: params.stop)
+  |> filter(fn: (r) => r._measurement == "sensor_measurement" and r._field == "value")
+  __SENSOR_FILTER__
+  |> keep(columns: ["_time", "_value", "client_id", "sensor_id", "measurement_type", "standard_unit"])
+'''
+
+# Historic (bid based) schema, used by app/db_man/influxdb/read.py
+_BID_TIMEDATA = '''
+from(bucket: params.bucket)
+  |> range(start: __RANGE__)
+  |> filter(fn:(r) => r.bid == params.bid)
+  |> filter(fn:(r) => r._field == "value")
+  |> aggregateWindow(every: __EVERY__, fn: mean, createEmpty: false)
+'''
+
+_BID_LAST_VALUES = '''
+from(bucket: params.bucket)
+  |> range(start: -10y)
+  |> filter(fn:(r) => r.bid == params.bid)
+  |> filter(fn:(r) => r._field == "value")
+  |> last()
+'''
+
+_BID_LAST_RECORDS = '''
+from(bucket: params.bucket)
+  |> range(start: -10y)
+  |> filter(fn:(r) => r.bid == params.bid)
+  |> last()
+'''
+
+_BID_COUNT = '''
+from(bucket: params.bucket)
+  |> range(start: -30d)
+  |> distinct(column: "bid")
+  |> count()
+'''
+
+_MEASUREMENT_DISTINCT_IDS = '''
+from(bucket: params.bucket)
+  |> range(start: -7y)
+  |> filter(fn: (r) => r._measurement == params.measurement)
+  |> keep(columns: ["id"])
+  |> distinct(column: "id")
+'''
+
+_MEASUREMENT_LAST = '''
+from(bucket: params.bucket)
+  |> range(start: -10y)
+  |> filter(fn: (r) => r._measurement == params.measurement)
+  |> filter(fn:(r) => r._field == "value")
+  |> last()
+'''
+
+_SENSOR_LAST_IN_BID = '''
+from(bucket: params.bucket)
+  |> range(start: -10y)
+  |> filter(fn:(r) => r.bid == params.bid)
+  |> filter(fn:(r) => r.id == params.sensor_id)
+  |> last()
+'''
+
+_ALL_SENSOR_DATA = '''
+from(bucket: params.bucket)
+  |> range(start: -5y)
+  |> filter(fn: (r) => r["id"] == params.sensor_id)
+'''
+
+# Operators allowed in schedule conditions (normalized form)
+SCHEDULE_OPERATORS = (">", "<", ">=", "<=", "==", "!=")
+
+# Bucket length -> window of schedule condition rollups
+SCHEDULE_ROLLUP_WINDOWS = {
+    timedelta(minutes=1): "1m",
+    timedelta(hours=1): "1h",
+    timedelta(days=1): "1d",
+    timedelta(weeks=1): "1w",
+}
+
+# time_scale -> (range, window) of bid timedata
+BID_TIME_SCALES = {
+    "year": ("-1y", "1mo"),
+    "month": ("-1mo", "7d"),
+    "week": ("-7d", "1d"),
+    "day": ("-1d", "4h"),
+    "hour": ("-1h", "10m"),
+}
+
+
+def _compile_templates() -> Dict[str, str]:
+    """Builds all named queries, whitelisted variants get their own name."""
+    compiled = {
+        "sensor_history": _SENSOR_HISTORY,
+        "sensor_history_limited": _SENSOR_HISTORY + "  |> limit(n: params.limit)\n",
+        "latest_per_sensor": _LATEST_PER_SENSOR,
+        "export_chunk": _EXPORT_CHUNK.replace("__SENSOR_FILTER__", ""),
+        "export_chunk_sensors": _EXPORT_CHUNK.replace(
+            "__SENSOR_FILTER__",
+            "|> filter(fn: (r) => contains(value: r.sensor_id, set: params.sensor_ids))",
+        ),
+        "bid_last_values": _BID_LAST_VALUES,
+        "bid_last_records": _BID_LAST_RECORDS,
+        "bid_count": _BID_COUNT,
+        "measurement_distinct_ids": _MEASUREMENT_DISTINCT_IDS,
+        "measurement_last": _MEASUREMENT_LAST,
+        "sensor_last_in_bid": _SENSOR_LAST_IN_BID,
+        "all_sensor_data": _ALL_SENSOR_DATA,
+    }
+    for every in SCHEDULE_ROLLUP_WINDOWS.values():
+        compiled[f"schedule_rollup:{every}"] = _SCHEDULE_ROLLUP.replace("__EVERY__", every)
+    for scale, (range_start, every) in BID_TIME_SCALES.items():
+        compiled[f"bid_timedata:{scale}"] = (
+            _BID_TIMEDATA.replace("__RANGE__", range_start).replace("__EVERY__", every)
+        )
+    return {name: text.strip() for name, text in compiled.items()}
+
+
+QUERIES: Dict[str, str] = _compile_templates()
+
+
+# --- Validation ---
+
+def validate_identifier(value: Any, kind: str = "identifier") -> str:
+    """
+    Validates id used in query (sensor_id, bid, measurement name).
+
+    Raises:
+        ValueError: if value is empty or contains not allowed characters
+    """
+    value_str = str(value) if value is not None else ""
+    if not _IDENTIFIER_RE.match(value_str):
+        raise ValueError(f"Invalid {kind}: '{value_str[:64]}'")
+    return value_str
+
+
+def parse_relative_range(range_str: str) -> timedelta:
+    """
+    Converts relative range ("-1h", "-7d") to timedelta.
+
+    Raises:
+        ValueError: if the range is not in supported format
+    """
+    match = _RELATIVE_RANGE_RE.match(str(range_str).strip())
+    if not match:
+        raise ValueError(f"Invalid relative range: '{range_str}'")
+    return timedelta(**{_RANGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def range_start(range_value) -> datetime:
+    """
+    Returns absolute start time for relative range (str or timedelta).
+
+    Raises:
+        ValueError: if the range is not in supported format or reaches before year 1
+    """
+    delta = range_value if isinstance(range_value, timedelta) else parse_relative_range(range_value)
+    try:
+        return datetime.now(timezone.utc) - delta
+    except OverflowError:
+        raise ValueError(f"Relative range out of bounds: '{range_value}'")
+
+
+def is_relative_range(range_str: str) -> bool:
+    """Validation for routes, True when range_start accepts the range."""
+    try:
+        range_start(range_str)
+        return True
+    except ValueError:
+        return False
+
+
+# --- Execution & Timing ---
+
+_client: Optional[InfluxDBClient] = None
+_client_lock = threading.Lock()
+
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _get_client() -> InfluxDBClient:
+    """Returns shared client, created lazily (after uwsgi/celery fork)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InfluxDBClient(url=url, token=token, org=org, timeout=INFLUX_QUERY_TIMEOUT_MS)
+    return _client
+
+
+def _record_timing(name: str, elapsed_ms: float, failed: bool):
+    with _stats_lock:
+        entry = _stats.setdefault(name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["last_ms"] = elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        if failed:
+            entry["errors"] += 1
+
+
+def get_query_timings() -> Dict[str, Dict[str, float]]:
+    """Returns per query timing of this process (count, errors, total/avg/max/last ms)."""
+    with _stats_lock:
+        timings = {name: dict(entry) for name, entry in _stats.items()}
+    for entry in timings.values():
+        entry["avg_ms"] = entry["total_ms"] / entry["count"] if entry["count"] else 0.0
+    return timings
+
+
+def run_query(name: str, params: Optional[Dict[str, Any]] = None, client: Optional[InfluxDBClient] = None):
+    """
+    Runs named query with parameters.
+
+    Args:
+        name (str): name of the template in QUERIES
+        params (dict): query parameters, bucket is added automatically
+        client (InfluxDBClient): optional client, shared client is used when None
+
+    Returns:
+        TableList: result of query_api.query
+
+    Raises:
+        KeyError: unknown query name
+        InfluxDBError: query failed
+    """
+    query = QUERIES[name]
+    query_params = {"bucket": bucket}
+    if params:
+        query_params.update(params)
+
+    query_api = (client or _get_client()).query_api()
+    started = time.perf_counter()
+    failed = True
+    try:
+        tables = query_api.query(query=query, org=org, params=query_params)
+        failed = False
+        return tables
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _record_timing(name, elapsed_ms, failed)
+        if elapsed_ms >= INFLUX_SLOW_QUERY_MS:
+            logging.warning(f"Slow Flux query '{name}': {elapsed_ms:.1f} ms")
+        else:
+            logging.debug(f"Flux query '{name}' took {elapsed_ms:.1f} ms (failed: {failed})")
+
+
+def stream_query(name: str, params: Optional[Dict[str, Any]] = None,
+                 client: Optional[InfluxDBClient] = None) -> Iterator[Any]:
+    """
+    Runs named query and yields FluxRecords as the response is read (query_api.query_stream),
+    for results too large to hold as TableList. Timing covers the whole stream.
+
+    Raises:
+        KeyError: unknown query name
+        InfluxDBError: query failed
+    """
+    query = QUERIES[name]
+    query_params = {"bucket": bucket}
+    if params:
+        query_params.update(params)
+
+    query_api = (client or _get_client()).query_api()
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield from query_api.query_stream(query=query, org=org, params=query_params)
+        failed = False
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _record_timing(name, elapsed_ms, failed)
+        logging.debug(f"Flux stream '{name}' took {elapsed_ms:.1f} ms (failed: {failed})")
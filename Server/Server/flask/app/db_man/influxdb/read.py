@@ -5,40 +5,34 @@
 ####################################################
 
 from app.db_man.influxdb.engine import *
+from app.db_man.influxdb.query_builder import run_query, validate_identifier, BID_TIME_SCALES
 import logging
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
+from app.cache.last_value_index import (
+    get_sensor_last_value,
+    get_hub_last_values,
+    get_measurement_last_time,
+)
+
+
+def _redis_client(rc=None):
+    """Returns passed redis client or the one of the running flask app (None outside app context)."""
+    if rc is not None:
+        return rc
+    try:
+        from flask import current_app
+        return current_app.redis_client
+    except (ImportError, RuntimeError, AttributeError):
+        return None
 
 
 def get_bid_timedata(bid, time_scale):
     logging.debug(f"time_scale: {time_scale}")
-    if time_scale == "year":
-        inrange = "-1y"
-        ourange = "1mo"
-    elif time_scale == "month":
-        inrange = "-1mo"
-        ourange = "7d"
-    elif time_scale == "week":
-        inrange = "-7d"
-        ourange = "1d"
-    elif time_scale == "day":
-        inrange = "-1d"
-        ourange = "4h"
-    elif time_scale == "hour":
-        inrange = "-1h"
-        ourange = "10m"
-    else:
-        inrange = "-7d"
-        ourange = "1d"
-
-    query_api = client.query_api()
-    query = f'from(bucket:"{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")\
-    |> range(start: {inrange})\
-    |> filter(fn:(r) => r.bid == "{bid}")\
-    |> filter(fn:(r) => r._field == "value")\
-    |> aggregateWindow(every: {ourange}, fn: mean, createEmpty: false)'
-    result = query_api.query(org=org, query=query)
+    if time_scale not in BID_TIME_SCALES:
+        time_scale = "week"
+    result = run_query(f"bid_timedata:{time_scale}", {"bid": validate_identifier(bid, "bid")})
     group = {}
     for table in result:
          for record in table.records:
@@ -61,15 +55,13 @@ def get_bid_timedata(bid, time_scale):
     results.sort(key=lambda x: x["timestamp"])
     return results
 
-def get_meteo_station_data(bid):
-    query_api = client.query_api()
-    query = f'''from(bucket:"{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-    |> range(start: -10y)
-    |> filter(fn:(r) => r.bid == "{bid}")
-    |> filter(fn:(r) => r._field == "value")
-    |> last()
-    '''
-    result = query_api.query(org=org, query=query)
+def get_meteo_station_data(bid, rc=None):
+    indexed = get_hub_last_values(_redis_client(rc), bid)
+    if indexed:
+        return {str(entry["unit"] or "N/A"): round(entry["value"], 2) for entry in indexed}
+
+    logging.debug(f"Last value index miss for hub {bid}, querying InfluxDB")
+    result = run_query("bid_last_values", {"bid": validate_identifier(bid, "bid")})
     group = {}
     for table in result:
          for record in table.records:
@@ -81,14 +73,7 @@ def get_meteo_station_data(bid):
     return group
 
 def get_num_bid():
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-        |> range(start: -30d)  // Adjust time range as needed
-        |> distinct(column: "bid")  // Get unique bid values
-        |> count()  // Count the number of unique bid values
-    '''
-    result = query_api.query(query)
+    result = run_query("bid_count")
     for table in result:
         for record in table.records:
             unique_bids_count = record["_value"]
@@ -96,30 +81,21 @@ def get_num_bid():
 
 
 def get_num_id_in_measurement(measurement):
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-        |> range(start: -7y)  // Adjust time range as needed
-        |> filter(fn: (r) => r._measurement == "{measurement}")
-        |> keep(columns: ["id"])  
-        |> distinct(column: "id")
-    '''
-    count = 0
-    result = query_api.query(query)
+    result = run_query("measurement_distinct_ids", {"measurement": validate_identifier(measurement, "measurement")})
     unique_ids = {record["_value"] for table in result for record in table.records}
     count = len(unique_ids)
     return count
 
-def get_last_group_data(bid):
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-        |> range(start: -10y)  // Adjust as needed
-        
-        |> filter(fn:(r) => r.bid == "{bid}")
-        |> last()  // Get the last record for each sensor
-    '''
-    tables = query_api.query(query)
+def get_last_group_data(bid, rc=None):
+    indexed = get_hub_last_values(_redis_client(rc), bid)
+    if indexed:
+        group_data = {"id": bid}
+        for entry in indexed:
+            group_data[entry["unit"]] = entry["value"]
+        return [group_data]
+
+    logging.debug(f"Last value index miss for hub {bid}, querying InfluxDB")
+    tables = run_query("bid_last_records", {"bid": validate_identifier(bid, "bid")})
     logging.debug(f"debug moment: {tables}")
     group_data = {}
     for table in tables:
@@ -138,17 +114,13 @@ def get_last_group_data(bid):
 
 
 
-def get_last_update_time(measurement):
+def get_last_update_time(measurement, rc=None):
     logging.debug(f"measurement: {measurement}")
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-        |> range(start: -10y)  // Adjust as needed
-        |> filter(fn: (r) => r._measurement == "{measurement}")
-        |> filter(fn:(r) => r._field == "value")
-        |> last()  // Get the last record for each sensor
-    '''
-    tables = query_api.query(query)
+    indexed_time = get_measurement_last_time(_redis_client(rc), measurement)
+    if indexed_time:
+        return indexed_time.astimezone(ZoneInfo("Europe/Prague"))
+
+    tables = run_query("measurement_last", {"measurement": validate_identifier(measurement, "measurement")})
     time = 0
     for table in tables:
         for record in table.records:
@@ -158,16 +130,18 @@ def get_last_update_time(measurement):
 
 
 
-def get_last_single_data(sensor_id, bid):
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")}")
-        |> range(start: -10y)  // Adjust as needed
-        |> filter(fn:(r) => r.bid == "{bid}") // filter
-        |> filter(fn:(r) => r.id == "{sensor_id}") // 
-        |> last()  // Get the last record for each sensor
-    '''
-    tables = query_api.query(query)
+def get_last_single_data(sensor_id, bid, rc=None):
+    indexed = get_sensor_last_value(_redis_client(rc), sensor_id)
+    if indexed and indexed.get("hub_id") == bid:
+        return [{
+            "bid": bid,
+            "unit": indexed["unit"],
+            "value": indexed["value"],
+            "time": indexed["time"].astimezone(ZoneInfo("Europe/Prague")),
+        }]
+
+    logging.debug(f"Last value index miss for sensor {sensor_id}, querying InfluxDB")
+    tables = run_query("sensor_last_in_bid", {"bid": validate_identifier(bid, "bid"), "sensor_id": validate_identifier(sensor_id, "sensor_id")})
     group_data = {}
     for table in tables:
         for record in table.records:
@@ -193,11 +167,5 @@ def get_last_single_data(sensor_id, bid):
 
 
 def read_all_sensor_data(id):
-    query_api = client.query_api()
-    query = f'''
-    from(bucket: "{os.getenv('DOCKER_INFLUXDB_INIT_BUCKET')}")
-    |> range(start: -5y)  // Adjust time range as needed
-    |> filter(fn: (r) => r["id"] == "{id}")
-    '''
-    result = query_api.query(query)
+    result = run_query("all_sensor_data", {"sensor_id": validate_identifier(id, "sensor_id")})
     return result
\ No newline at end of file
@@ -7,12 +7,59 @@
 
 import os
 import logging # Use logging instead of print for better practice
-from sqlalchemy import create_engine
+import threading
+from typing import Dict, Any
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
 import logging
 
+
+# --- Gevent cooperative psycopg ---
+# psycogreen.patch_psycopg() only supports psycopg2 (set_wait_callback), psycopg 3
+# waits for the socket through psycopg.waiting.wait. The C wait function (wait_c)
+# blocks the whole gevent hub, wait_select goes through the monkey-patched select,
+# so it yields to other greenlets. Must run before psycopg is imported.
+def _gevent_select_patched() -> bool:
+    try:
+        from gevent import monkey  # type: ignore
+    except ImportError:
+        return False
+    return monkey.is_module_patched("select")
+
+
+def make_psycopg_cooperative() -> bool:
+    """
+    Selects gevent friendly wait function of psycopg when gevent monkey patching is active.
+
+    Returns:
+        bool: True if psycopg waits cooperatively
+    """
+    if not _gevent_select_patched():
+        return False
+    os.environ.setdefault("PSYCOPG_WAIT_FUNC", "wait_select")
+    import psycopg.waiting  # type: ignore
+    wait_name = getattr(psycopg.waiting.wait, "__name__", "")
+    if wait_name != "wait_select":
+        logging.warning(f"gevent is active but psycopg uses '{wait_name}' (psycopg imported before patching?), "
+                        "database I/O will block the event loop.")
+        return False
+    logging.info("psycopg configured for gevent (wait_select).")
+    return True
+
+
+PSYCOPG_COOPERATIVE = make_psycopg_cooperative()
+
+
+# --- Pool Settings ---
+# Up to gevent=100 greenlets per uwsgi process share one pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds to wait for free connection before sqlalchemy.exc.TimeoutError
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
 # Assuming models.py is in a 'pqsql' subdirectory relative to this file
 # Adjust the import path if your structure is different
 try:
@@ -31,11 +78,16 @@ try:
     engine = create_engine(
             f"postgresql+psycopg://client_modifier:{os.getenv('POSTGRES_USERS_ACCESS_PASS')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/clients_system",
             pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
             echo=False,
             future=True,
             isolation_level="READ COMMITTED"
         ) # echo=False for production
-    logging.info(f"Database engine created for URL: {engine.url.render_as_string(hide_password=True)}") # Hide password in logs
+    logging.info(f"Database engine created for URL: {engine.url.render_as_string(hide_password=True)} "
+                 f"(pool {DB_POOL_SIZE}+{DB_MAX_OVERFLOW}, timeout {DB_POOL_TIMEOUT}s, recycle {DB_POOL_RECYCLE}s)") # Hide password in logs
 
     # --- Session Factory ---
     # This factory creates *independent* sessions when called
@@ -48,6 +100,84 @@ except Exception as e:
     exit(1) # Exit if we can't create the engine/session factory
 
 
+# --- Read Replica (optional) ---
+# Enabled by POSTGRES_REPLICA_HOST, read only routes select it with
+# app.db_man.pqsql.replica.read_replica, see there for lag tolerance and fallback.
+POSTGRES_REPLICA_HOST = os.getenv("POSTGRES_REPLICA_HOST")
+POSTGRES_REPLICA_PORT = os.getenv("POSTGRES_REPLICA_PORT", os.getenv("POSTGRES_PORT"))
+replica_engine = None
+ReplicaSessionLocal = None
+if POSTGRES_REPLICA_HOST:
+    try:
+        replica_engine = create_engine(
+                f"postgresql+psycopg://client_modifier:{os.getenv('POSTGRES_USERS_ACCESS_PASS')}@{POSTGRES_REPLICA_HOST}:{POSTGRES_REPLICA_PORT}/clients_system",
+                pool_pre_ping=True,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                echo=False,
+                future=True,
+                isolation_level="READ COMMITTED",
+                execution_options={"postgresql_readonly": True},
+            )
+        ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+        logging.info(f"Read replica engine created for URL: {replica_engine.url.render_as_string(hide_password=True)}")
+    except Exception as e:
+        # Replica is optional, everything keeps running on primary
+        logging.error(f"Error creating read replica engine, using primary only: {e}", exc_info=True)
+        replica_engine = None
+        ReplicaSessionLocal = None
+
+
+# --- Pool Metrics ---
+_pool_stats: Dict[str, int] = {"checkouts": 0, "connects": 0, "invalidated": 0, "max_checked_out": 0, "timeouts": 0}
+_pool_stats_lock = threading.Lock()
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    with _pool_stats_lock:
+        _pool_stats["connects"] += 1
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    checked_out = engine.pool.checkedout()
+    with _pool_stats_lock:
+        _pool_stats["checkouts"] += 1
+        _pool_stats["max_checked_out"] = max(_pool_stats["max_checked_out"], checked_out)
+
+
+@event.listens_for(engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    with _pool_stats_lock:
+        _pool_stats["invalidated"] += 1
+
+
+def record_pool_timeout():
+    """Counts pool exhaustion (called by the TimeoutError handler)."""
+    with _pool_stats_lock:
+        _pool_stats["timeouts"] += 1
+
+
+def get_pool_status(db_engine=engine) -> Dict[str, Any]:
+    """Returns usage of connection pool of this process."""
+    pool = db_engine.pool
+    with _pool_stats_lock:
+        stats: Dict[str, Any] = dict(_pool_stats)
+    stats.update({
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout_s": DB_POOL_TIMEOUT,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "cooperative": PSYCOPG_COOPERATIVE,
+    })
+    return stats
+
+
 # This function is for future usage, actually not used
 
 def create_db_and_tables(db_engine=engine): # Accept engine argument
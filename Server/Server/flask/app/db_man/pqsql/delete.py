@@ -0,0 +1,51 @@
+####################################################
+# delete functions, bulk cleanup of expired rows
+# Last version of update: v0.95
+# app/db_man/pqsql/delete.py
+####################################################
+
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from app.db_man.pqsql.models import SessionAuth
+
+
+# Expired sessions are kept this long (audit of recent hub connections)
+HUB_SESSION_RETENTION_HOURS = int(os.getenv("HUB_SESSION_RETENTION_HOURS", "24"))
+HUB_SESSION_REAP_BATCH_SIZE = int(os.getenv("HUB_SESSION_REAP_BATCH_SIZE", "5000"))
+
+
+def delete_expired_sessions(db: Session, retention_hours: int = HUB_SESSION_RETENTION_HOURS,
+                            batch_size: int = HUB_SESSION_REAP_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """
+    Deletes sessions which ended more than retention_hours ago, one commit per batch
+    (short transactions, index idx_session_auth_session_end).
+
+    Returns:
+        int: number of deleted sessions
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = (
+            select(SessionAuth.session_id)
+            .where(SessionAuth.session_end < cutoff)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = db.execute(
+            delete(SessionAuth).where(SessionAuth.session_id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        deleted += result.rowcount
+        batches += 1
+        logging.debug(f"Deleted batch of {result.rowcount} expired hub sessions.")
+        if result.rowcount < batch_size:
+            break
+    return deleted
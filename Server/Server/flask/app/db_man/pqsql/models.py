@@ -9,7 +9,7 @@ import enum
 from datetime import datetime, timezone, date
 from sqlalchemy import (
     Column, String, Integer, Text, Date, DateTime, Boolean, Float, Numeric,
-    ForeignKey, Table, CheckConstraint, Enum, desc # IMPORT desc if used elsewhere, not strictly needed for this snippet
+    ForeignKey, Table, CheckConstraint, Enum, Index, desc # IMPORT desc if used elsewhere, not strictly needed for this snippet
 )
 # --- Make sure relationship and backref are imported ---
 from sqlalchemy.orm import declarative_base, relationship, backref
@@ -128,6 +128,11 @@ class Group(Base):
 
 class Sensor(Base):
     __tablename__ = "sensors"
+    # Indexes are shipped by migrations (migrations/versions), keep names in sync
+    __table_args__ = (
+        Index("idx_sensors_client_id", "client_id"),
+        Index("idx_sensors_group_measurement_time", "group_id", "measurement", "last_reading_time"),
+    )
     id = Column(Text, primary_key=True)
     # FK to the SENSOR CLIENT SYSTEM table, NO ACTION on delete at DB level
     client_id = Column(Text, ForeignKey("available_sensors_database.client_id"), nullable=True)
@@ -198,7 +203,12 @@ class ScheduleCondition(Base):
         return f"<ScheduleCondition(id={self.condition_id}, schedule_id='{self.schedule_id}', type='{self.type}')>"
 
 class GroupEvent(Base):
+    # Partitioned by month of event_date in database (migrations/versions/0002),
+    # primary key there is (event_table_id, event_date), ids stay unique (sequence)
     __tablename__ = 'group_events'
+    __table_args__ = (
+        Index("idx_group_events_group_id_date", "group_id", "event_date", "event_table_id"),
+    )
     event_table_id = Column(Integer, primary_key=True)
     group_id = Column(Text, ForeignKey("groups.id", ondelete="CASCADE"), nullable=False)
     event_ref_id = Column(Text)
@@ -237,6 +247,9 @@ class Rule(Base):
     # FK to RuleSet, ON DELETE SET NULL allows rules to exist outside sets
     rule_set_id = Column(Text, ForeignKey("rule_sets.id", ondelete="SET NULL"), nullable=True)
     priority = Column(Integer, nullable=False, default=5)
+    # Trigger state machine (app/engines/rules_engine/trigger_state.py)
+    hold_seconds = Column(Integer, nullable=False, default=0) # Condition must hold this long before firing
+    cooldown_seconds = Column(Integer, nullable=False, default=0) # Rule can't fire again until this passes after clearing
 
     initiators = relationship("RuleInitiator", back_populates="rule", cascade="all, delete-orphan")
     actions = relationship("RuleAction", back_populates="rule", cascade="all, delete-orphan")
@@ -259,6 +272,7 @@ class RuleInitiator(Base):
     operator = Column(Text, default='') # e.g., >, <, ==, between
     value = Column(Numeric, default=0) # Threshold 1 or schedule value
     value2 = Column(Numeric) # Threshold 2 for 'between'/'outside'
+    hysteresis = Column(Numeric) # Band past the threshold(s) the value must leave before the rule re-arms
     schedule_type = Column(Text) # e.g., interval, cron, date
     schedule_value = Column(Text) # Specific value for schedule type
 
@@ -311,6 +325,9 @@ class AvailableSensorsDatabase(Base): # Sensor Client System Definition
 
 class SessionAuth(Base): # Sensor Client System Session
     __tablename__ = 'session_auth'
+    __table_args__ = (
+        Index("idx_session_auth_session_end", "session_end"),
+    )
     session_id = Column(Text, primary_key=True)
     client_id = Column(Text, ForeignKey("available_sensors_database.client_id", ondelete="CASCADE"), nullable=False)
     session_key_hash = Column(Text, nullable=False)
@@ -360,6 +377,12 @@ class JwtBlocklist(Base):
     id = Column(Integer, primary_key=True)
     jti = Column(Text, unique=True, nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # exp of the revoked token, row is pruned after it
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('idx_jwt_blocklist_expires_at', 'expires_at'),
+    )
 
     def __repr__(self):
         return f"<JwtBlocklist(id={self.id}, jti='{self.jti}')>"
@@ -0,0 +1,211 @@
+####################################################
+# Partition maintenance of group_events
+# Last version of update: v0.95
+# app/db_man/pqsql/partitions.py
+####################################################
+
+# group_events is partitioned by month of event_date (migrations/versions/0002),
+# partitions are named group_events_pYYYYMM, rows outside of them land in
+# group_events_default. Celery task maintain_group_event_partitions (and worker
+# / beat startup) creates partitions ahead and detaches partitions older than retention, archives them
+# into zstd Parquet files (EVENT_ARCHIVE_DIR) and drops them.
+# The functions need DDL rights: sessions of role partition_maintainer, owner of
+# group_events and its partitions (client_modifier only reads and writes rows).
+
+import os
+import re
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Optional, Dict, Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    logging.warning("pyarrow library not installed. Archival of group_events partitions will be unavailable.")
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+
+GROUP_EVENTS_RETENTION_MONTHS = int(os.getenv("GROUP_EVENTS_RETENTION_MONTHS", "24"))
+GROUP_EVENTS_PREMAKE_MONTHS = int(os.getenv("GROUP_EVENTS_PREMAKE_MONTHS", "3"))
+EVENT_ARCHIVE_DIR = os.getenv("EVENT_ARCHIVE_DIR", "/app/app/event_archive")
+ARCHIVE_BATCH_ROWS = 10000
+
+PARENT_TABLE = "group_events"
+DEFAULT_PARTITION = "group_events_default"
+_PARTITION_RE = re.compile(r"^group_events_p(\d{4})(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"group_events_p{month.year:04d}{month.month:02d}"
+
+
+def _partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_group_event_partitions(db: Session) -> List[str]:
+    """Returns names of monthly partitions attached to group_events (without default)."""
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass) ORDER BY c.relname"
+    ), {"parent": PARENT_TABLE}).scalars().all()
+    return [name for name in rows if _partition_month(name)]
+
+
+def list_detached_partitions(db: Session) -> List[str]:
+    """Returns partition tables left detached by interrupted archival."""
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = current_schema() "
+        "WHERE c.relkind = 'r' AND c.relname LIKE 'group_events_p%' AND NOT c.relispartition"
+    )).scalars().all()
+    return [name for name in rows if _partition_month(name)]
+
+
+def _create_partition(db: Session, month: date):
+    """
+    Creates partition of month. Rows of the month which already landed in the
+    default partition (partition was missing) are moved into it: default is
+    detached, partition created and filled, default re-attached, in one transaction.
+    """
+    name = partition_name(month)
+    # Bounds are generated dates, not user input
+    bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    params = {"start": month, "stop": add_months(month, 1)}
+    in_default = db.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE event_date >= :start AND event_date < :stop LIMIT 1"
+    ), params).scalar()
+    if not in_default:
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} {bounds}"))
+        db.commit()
+        return
+    db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    db.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bounds}"))
+    moved = db.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE event_date >= :start AND event_date < :stop RETURNING *) "
+        f"INSERT INTO {name} SELECT event_table_id, group_id, event_ref_id, event_date, event_type, description FROM moved"
+    ), params).rowcount
+    db.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    db.commit()
+    logging.info(f"Moved {moved} rows of {name} out of {DEFAULT_PARTITION}")
+
+
+def ensure_group_event_partitions(db: Session, months_ahead: int = GROUP_EVENTS_PREMAKE_MONTHS,
+                                  today: Optional[date] = None) -> List[str]:
+    """
+    Creates missing monthly partitions from current month to months_ahead,
+    rows of them stored in the default partition meanwhile are moved in.
+
+    Returns:
+        list: names of created partitions
+    """
+    current = month_start(today or datetime.now(timezone.utc).date())
+    existing = set(list_group_event_partitions(db))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        try:
+            _create_partition(db, month)
+            created.append(name)
+            logging.info(f"Created partition {name}")
+        except SQLAlchemyError as e:
+            db.rollback()
+            logging.error(f"Could not create partition {name}: {e}")
+    return created
+
+
+def _archive_path(name: str) -> str:
+    return os.path.join(EVENT_ARCHIVE_DIR, f"{name}.parquet")
+
+
+def _archive_partition(db: Session, name: str) -> int:
+    """Writes all rows of detached partition into Parquet file, returns row count."""
+    schema = pa.schema([
+        ("event_table_id", pa.int64()),
+        ("group_id", pa.string()),
+        ("event_ref_id", pa.string()),
+        ("event_date", pa.date32()),
+        ("event_type", pa.string()),
+        ("description", pa.string()),
+    ])
+    os.makedirs(EVENT_ARCHIVE_DIR, exist_ok=True)
+    final_path = _archive_path(name)
+    tmp_path = final_path + ".part"
+    rows = 0
+    result = db.execute(
+        text(f"SELECT event_table_id, group_id, event_ref_id, event_date, event_type, description "
+             f"FROM {name} ORDER BY event_date, event_table_id"),
+        execution_options={"stream_results": True},
+    )
+    writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+    try:
+        for batch in result.partitions(ARCHIVE_BATCH_ROWS):
+            columns: Dict[str, list] = {field: [] for field in schema.names}
+            for row in batch:
+                for field in schema.names:
+                    columns[field].append(getattr(row, field))
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(batch)
+    except Exception:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, final_path)
+    return rows
+
+
+def archive_old_group_event_partitions(db: Session, retention_months: int = GROUP_EVENTS_RETENTION_MONTHS,
+                                       today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Detaches partitions older than retention, archives them and drops them.
+    Partition is dropped only after its archive file is written.
+
+    Returns:
+        list: dicts with name, rows and path of archived partitions
+    """
+    if pa is None:
+        logging.warning("pyarrow is not installed, old group_events partitions are kept.")
+        return []
+    cutoff = add_months(month_start(today or datetime.now(timezone.utc).date()), -retention_months)
+    archived = []
+    detached = set(list_detached_partitions(db))
+    for name in list_group_event_partitions(db) + sorted(detached):
+        month = _partition_month(name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        try:
+            if name not in detached:
+                db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                db.commit()
+                logging.info(f"Detached partition {name}")
+            rows = _archive_partition(db, name)
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            archived.append({"name": name, "rows": rows, "path": _archive_path(name)})
+            logging.info(f"Archived partition {name}: {rows} rows into {_archive_path(name)}")
+        except Exception as e:
+            # Detached table stays in database, next run retries it (list_detached_partitions)
+            db.rollback()
+            logging.error(f"Archival of partition {name} failed: {e}", exc_info=True)
+    return archived
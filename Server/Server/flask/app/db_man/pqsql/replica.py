@@ -0,0 +1,135 @@
+####################################################
+# Read replica routing
+# Last version of update: v0.95
+# app/db_man/pqsql/replica.py
+####################################################
+
+# Usage (read only routes, below jwt_required):
+#
+#   @bp.route('/list', methods=['POST'])
+#   @jwt_required()
+#   @read_replica
+#   def list_groups():
+#       db: Session = DbRequestSession()   # session of read replica
+#
+# Replica is used only when it's configured (POSTGRES_REPLICA_HOST), reachable
+# and its replay lag is under DB_REPLICA_MAX_LAG_SECONDS. Otherwise the request
+# runs on primary (DB_REPLICA_FALLBACK=1, default) or gets 503.
+
+import os
+import time
+import logging
+import threading
+from functools import wraps
+from typing import Optional, Dict, Any
+
+from flask import abort
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db_man.pqsql.database import replica_engine, ReplicaSessionLocal
+
+
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_FALLBACK = os.getenv("DB_REPLICA_FALLBACK", "1") == "1"
+# Lag is measured at most once per interval per process
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "2"))
+
+# Replay lag, 0 when replica has replayed everything it received
+# (pg_last_xact_replay_timestamp alone grows while primary is idle), and whether
+# WAL receiver streams (replayed everything is true also when it is disconnected).
+# Replica role needs pg_read_all_stats (pg_monitor) to see status of the receiver.
+_LAG_QUERY = text(
+    "SELECT pg_is_in_recovery(), "
+    "EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'), "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_lag_state: Dict[str, Any] = {"lag_s": None, "checked_at": 0.0, "healthy": False, "error": None}
+_lag_lock = threading.Lock()
+_lag_checking = False
+_usage: Dict[str, int] = {"replica": 0, "fallback": 0, "rejected": 0}
+
+
+def _measure_lag() -> Dict[str, Any]:
+    """Queries replica (network I/O, called without _lag_lock held), returns new lag state."""
+    try:
+        with replica_engine.connect() as connection:
+            in_recovery, streaming, lag = connection.execute(_LAG_QUERY).one()
+    except SQLAlchemyError as e:
+        logging.warning(f"Read replica check failed: {e}")
+        return {"lag_s": None, "healthy": False, "error": str(e)}
+    if not in_recovery:
+        # Replica url points to primary?
+        return {"lag_s": None, "healthy": False, "error": "server is not a replica"}
+    if not streaming:
+        # Everything received is replayed, but nothing is received, data may be arbitrarily old
+        return {"lag_s": None, "healthy": False, "error": "WAL receiver is not streaming"}
+    return {"lag_s": float(lag) if lag is not None else None, "healthy": lag is not None, "error": None}
+
+
+def replica_usable() -> bool:
+    """Checks if replica is configured, reachable, streaming and inside lag tolerance."""
+    global _lag_checking
+    if replica_engine is None:
+        return False
+    with _lag_lock:
+        # One measurement at a time, others use the last one meanwhile
+        measure = not _lag_checking and time.monotonic() - _lag_state["checked_at"] >= DB_REPLICA_LAG_CHECK_SECONDS
+        if measure:
+            _lag_checking = True
+    if measure:
+        state = None
+        try:
+            state = _measure_lag()
+        finally:
+            with _lag_lock:
+                _lag_checking = False
+                if state is not None:
+                    _lag_state.update(state, checked_at=time.monotonic())
+    with _lag_lock:
+        return _lag_state["healthy"] and _lag_state["lag_s"] <= DB_REPLICA_MAX_LAG_SECONDS
+
+
+def get_replica_status() -> Dict[str, Any]:
+    """Returns last lag measurement, pool usage and routing counters of this process."""
+    pool = replica_engine.pool if replica_engine is not None else None
+    with _lag_lock:
+        status = {key: value for key, value in _lag_state.items() if key != "checked_at"}
+    status.update({
+        "max_lag_s": DB_REPLICA_MAX_LAG_SECONDS,
+        "fallback": DB_REPLICA_FALLBACK,
+        "requests": dict(_usage),
+        "checked_out": pool.checkedout() if pool is not None else None,
+    })
+    return status
+
+
+def read_replica(func):
+    """
+    Runs route with DbRequestSession bound to read replica.
+    Route must not write, replica connections are read only.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if replica_engine is None:
+            return func(*args, **kwargs)
+
+        # Imported here, app package imports this module's dependencies first
+        from app import DbRequestSession
+
+        if replica_usable():
+            # Session opened before (jwt blocklist check) belongs to primary, close it first
+            if DbRequestSession.registry.has():
+                DbRequestSession.remove()
+            DbRequestSession.registry.set(ReplicaSessionLocal())
+            _usage["replica"] += 1
+        elif DB_REPLICA_FALLBACK:
+            logging.debug(f"Read replica unusable (lag: {_lag_state['lag_s']}, error: {_lag_state['error']}), using primary.")
+            _usage["fallback"] += 1
+        else:
+            _usage["rejected"] += 1
+            abort(503, description="Read database is unavailable, try again later.")
+        return func(*args, **kwargs)
+    return wrapper
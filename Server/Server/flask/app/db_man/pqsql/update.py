@@ -11,6 +11,8 @@ from app.db_man.pqsql.models import (
     Config, ServerConfig, JwtBlocklist
 )
 from typing import List, Optional, Dict, Any
+import redis
+from app.cache.database_caching import invalidate_group_tags_cache
 from datetime import date, datetime, timezone
 
 # --- User Update (Web User) ---
@@ -158,13 +160,14 @@ def update_group(db: Session, group_id: str, update_data: Dict[str, Any]) -> Opt
         return db_group
     return None
 
-def set_group_tags(db: Session, group_id: str, tag_ids: List[str]) -> Optional[Group]:
+def set_group_tags(db: Session, group_id: str, tag_ids: List[str], rc: Optional[redis.Redis] = None) -> Optional[Group]:
     """Replaces a group's tags with a new set."""
     db_group = db.get(Group, group_id)
     if db_group:
         new_tags = db.query(Tag).filter(Tag.id.in_(tag_ids)).all()
         db_group.tags = new_tags # Replace the list
         db.commit()
+        invalidate_group_tags_cache(rc, group_id)
         return db_group
     return None
 
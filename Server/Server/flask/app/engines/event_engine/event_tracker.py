@@ -4,14 +4,32 @@
 # app/engines/event_engine/event_tracker.py
 ####################################################
 
+import os
+import json
 import logging
 from decimal import Decimal, InvalidOperation
 from typing import Dict, Any, Optional, List, Set
-from datetime import datetime, UTC
+from datetime import datetime, date, UTC
+import redis
+from sqlalchemy import insert
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.helpers.formatters import _format_initiator, _format_action
 from app.db_man.pqsql.models import GroupEvent
+from app.cache.database_caching import invalidate_beehives_snapshot
+
+# Rule triggered events are buffered in redis list and written with multi-row
+# INSERT when the buffer reaches EVENT_BUFFER_BATCH_SIZE, by celery task
+# flush_group_events every EVENT_FLUSH_INTERVAL_SECONDS, or by flush_events()
+# from readers which need to see their own events.
+EVENT_BUFFER_KEY = "events:group_events:buffer"
+EVENT_BUFFER_BATCH_SIZE = int(os.getenv("EVENT_BUFFER_BATCH_SIZE", "200"))
+EVENT_FLUSH_INTERVAL_SECONDS = int(os.getenv("EVENT_FLUSH_INTERVAL_SECONDS", "5"))
+# Max rows popped and inserted by one flush round
+EVENT_FLUSH_MAX_ROWS = 5000
+# Events which can't be inserted even alone (e.g. group deleted meanwhile), newest kept
+EVENT_DEAD_LETTER_KEY = "events:group_events:dead"
+EVENT_DEAD_LETTER_MAX = int(os.getenv("EVENT_DEAD_LETTER_MAX", "10000"))
 
 def summarize_rule(rule: dict) -> str:
     parts = []
@@ -21,33 +39,121 @@ def summarize_rule(rule: dict) -> str:
 
     return "\n".join(parts)
 
-def write_event(db, trigger_context):
-    # trigger_context
-    #               group_id
-    #               type
-    #               time
-    #               
-    logging.info("Writing Event")
+def _event_row(trigger_context) -> Optional[Dict[str, Any]]:
+    """Builds group_events row from trigger context."""
     group_id = trigger_context.get('group_id')
-    if group_id is None: return
+    if group_id is None: return None
 
     type = trigger_context.get('type')
     time = trigger_context.get('time', datetime.now(UTC))
-    
+    event_date = time.date() if isinstance(time, datetime) else time
+
+    description = None
     if type == 'rule_executed':
         description = summarize_rule(trigger_context.get('rule_context'))
-    
+    return {
+        "group_id": group_id,
+        "event_type": type,
+        "event_date": event_date.isoformat() if isinstance(event_date, date) else event_date,
+        "description": description,
+        "event_ref_id": trigger_context.get('event_ref_id'),
+    }
+
+
+def _insert_rows(db, rows: List[Dict[str, Any]]) -> int:
+    """Inserts rows with one multi-row INSERT and commits."""
+    for row in rows:
+        if isinstance(row["event_date"], str):
+            row["event_date"] = date.fromisoformat(row["event_date"])
+    db.execute(insert(GroupEvent), rows)
+    db.commit()
+    return len(rows)
+
+
+def write_event(db, trigger_context, rc: Optional[redis.Redis] = None):
+    # trigger_context
+    #               group_id
+    #               type
+    #               time
+    #               rule_context (type rule_executed)
+    # Event is buffered when redis is available, else it's inserted directly.
+    logging.info("Writing Event")
+    row = _event_row(trigger_context)
+    if row is None: return
+
+    if rc is not None:
+        try:
+            buffered = rc.rpush(EVENT_BUFFER_KEY, json.dumps(row))
+            if buffered >= EVENT_BUFFER_BATCH_SIZE:
+                flush_events(db, rc)
+            return
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error buffering group event, writing directly: {e}")
+
     try:
-        new_event = GroupEvent(
-            group_id=group_id,
-            event_type=type,
-            event_date=time,
-            description=description
-        )
-        db.add(new_event)
-        db.commit()
-        db.refresh(new_event)
-        return new_event
+        _insert_rows(db, [row])
     except SQLAlchemyError as e:
         db.rollback()
-        logging.error(f"Failed to create new Groupevent err: {e}")
\ No newline at end of file
+        logging.error(f"Failed to create new Groupevent err: {e}")
+
+
+def _insert_rows_one_by_one(db, rc: redis.Redis, raw_rows: List[Any]) -> int:
+    """
+    Inserts rows of failed batch separately, rows failing alone are moved
+    to the dead letter list, so one bad row doesn't block the buffer.
+    """
+    written = 0
+    dead = []
+    for raw in raw_rows:
+        try:
+            written += _insert_rows(db, [json.loads(raw)])
+        except SQLAlchemyError as e:
+            db.rollback()
+            logging.error(f"Group event can't be written, moved to {EVENT_DEAD_LETTER_KEY}: {raw!r}: {e}")
+            dead.append(raw)
+    if dead:
+        try:
+            pipe = rc.pipeline()
+            pipe.rpush(EVENT_DEAD_LETTER_KEY, *dead)
+            pipe.ltrim(EVENT_DEAD_LETTER_KEY, -EVENT_DEAD_LETTER_MAX, -1)
+            pipe.execute()
+        except redis.exceptions.RedisError as re:
+            logging.error(f"Redis error dead-lettering group events, {len(dead)} events lost: {re}")
+    return written
+
+
+def flush_events(db, rc: Optional[redis.Redis]) -> int:
+    """
+    Writes buffered events into group_events.
+
+    Pops are atomic, so concurrent flushes from more processes never write
+    the same event twice. When batch insert fails, rows are inserted one by one
+    and the failing ones go to EVENT_DEAD_LETTER_KEY.
+
+    Returns:
+        int: number of written events
+    """
+    if rc is None:
+        return 0
+    written = 0
+    while True:
+        try:
+            raw_rows = rc.lpop(EVENT_BUFFER_KEY, EVENT_FLUSH_MAX_ROWS)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error reading group event buffer: {e}")
+            return written
+        if not raw_rows:
+            break
+        rows = [json.loads(raw) for raw in raw_rows]
+        try:
+            written += _insert_rows(db, rows)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logging.error(f"Failed to flush {len(rows)} group events in batch, writing them one by one: {e}")
+            written += _insert_rows_one_by_one(db, rc, raw_rows)
+        if len(raw_rows) < EVENT_FLUSH_MAX_ROWS:
+            break
+    if written:
+        logging.debug(f"Flushed {written} group events")
+        invalidate_beehives_snapshot(rc)
+    return written
@@ -0,0 +1,98 @@
+####################################################
+# Rule action jobs
+# Last version of update: v0.95
+# app/engines/rules_engine/action_queue.py
+####################################################
+
+# Actions of a triggered rule are sent as one job onto celery queue
+# RULE_ACTIONS_QUEUE (own worker, see docker-compose celery_actions_worker),
+# so ingest latency doesn't depend on how many rules fire. Job runs actions
+# in execution_order, failed action is retried and the job resumes from it.
+# When the job can't be sent (broker down), actions run in the caller.
+# Tags added by the actions are evaluated by the job's TagCascade once they ran.
+#
+# Job payload
+# {"rule_id": ..., "actions": [action dict of rule cache, ...], "context": trigger context + rule_id/name/priority}
+
+import os
+import time
+import logging
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Dict, Any, Optional, List
+
+import redis # type: ignore
+from sqlalchemy.orm import Session
+
+from .actions import execute_action
+from .rule_stats import record_actions, query_count
+from .cascade import TagCascade
+
+
+RULE_ACTIONS_ASYNC = os.getenv("RULE_ACTIONS_ASYNC", "1") == "1"
+RULE_ACTIONS_QUEUE = os.getenv("RULE_ACTIONS_QUEUE", "rule_actions")
+RULE_ACTION_MAX_RETRIES = int(os.getenv("RULE_ACTION_MAX_RETRIES", "3"))
+RULE_ACTION_RETRY_SECONDS = int(os.getenv("RULE_ACTION_RETRY_SECONDS", "10"))
+
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_json_safe(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def build_action_job(rule_id: str, actions: List[Dict[str, Any]], action_context: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "rule_id": rule_id,
+        "actions": sorted(_json_safe(actions), key=lambda action: action.get('execution_order') or 0),
+        "context": _json_safe(action_context),
+    }
+
+
+def enqueue_rule_actions(job: Dict[str, Any]) -> bool:
+    """Sends job onto rule action queue, False when actions have to run in the caller."""
+    if not RULE_ACTIONS_ASYNC:
+        return False
+    try:
+        # Local import, tasks module imports the rule engine
+        from app.background_worker.tasks import execute_rule_actions
+        execute_rule_actions.apply_async(args=[job], queue=RULE_ACTIONS_QUEUE, retry=False)
+        logging.debug(f"Queued {len(job['actions'])} actions of rule {job['rule_id']} on '{RULE_ACTIONS_QUEUE}'.")
+        return True
+    except Exception as e:
+        logging.error(f"Could not queue actions of rule {job['rule_id']}: {e}. Running them synchronously.")
+        return False
+
+
+def run_rule_actions(job: Dict[str, Any], db: Optional[Session], rc: Optional[redis.Redis], start: int = 0) -> Optional[int]:
+    """
+    Executes actions of job from index start in execution_order.
+
+    Returns:
+        index of the first failed action (job resumes there on retry), None when all ran
+    """
+    context = dict(job["context"])
+    # Tags added by the actions are evaluated afterwards, level by level (cascade.py)
+    cascade = context['cascade'] = TagCascade()
+    cascade.mark_fired(context.get('group_id'), job["rule_id"])
+    actions = job["actions"]
+    started, queries = time.perf_counter(), query_count(db)
+    failed = None
+    for index in range(start, len(actions)):
+        if not execute_action(actions[index], context, rc=rc, db=db):
+            failed = index
+            break
+    executed = (failed + 1 if failed is not None else len(actions)) - start
+    record_actions(rc, job["rule_id"], time.perf_counter() - started, executed, int(failed is not None),
+                   query_count(db) - queries)
+    if db is not None:
+        cascade.run(db, rc)
+    return failed
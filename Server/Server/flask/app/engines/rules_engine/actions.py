@@ -12,6 +12,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 import redis # For type hinting rc
 
+from app.cache.database_caching import invalidate_group_tags_cache
+from .cascade import TagCascade
+
 try:
     from app.sse import update_sse # Import the SSE update function
     SSE_AVAILABLE = True
@@ -102,6 +105,7 @@ def action_adjust_health(params: Optional[Dict[str, Any]], context: Dict[str, An
     except SQLAlchemyError as e:
         db.rollback()
         logging.error(f"Database error adjusting health for group '{group_id}': {e}", exc_info=True)
+        raise
     except Exception as e:
         db.rollback()
         logging.error(f"Unexpected error adjusting health for group '{group_id}': {e}", exc_info=True)
@@ -126,7 +130,7 @@ def action_send_sse_tip(params: Optional[Dict[str, Any]], context: Dict[str, Any
         logging.error(f"Failed to send SSE tip: {e}", exc_info=True)
 
 def action_add_tag(params: Optional[Dict[str, Any]], context: Dict[str, Any], db: Optional[Session] = None, rc: Optional[redis.Redis] = None): # Renamed from action_add_tip for clarity, added rc
-    """Action: Adds a specified tag to the target group and re-evaluates rules."""
+    """Action: Adds a specified tag to the target group, tag_change rules are re-evaluated by the cascade (cascade.py)."""
     logging.info("--- Rule Action: Add Tag Triggered ---")
     if not db:
         logging.error("Add Tag action failed: Database session unavailable.")
@@ -165,39 +169,22 @@ def action_add_tag(params: Optional[Dict[str, Any]], context: Dict[str, Any], db
         # Add the tag
         group.tags.append(tag_to_add)
         db.commit()
+        invalidate_group_tags_cache(rc, group_id)
         logging.info(f"Successfully added tag '{tag_to_add.name}' (ID: {tag_to_add_id}) to group '{group_id}'.")
 
-        # Re-evaluate rules for this group due to tag change
-        # Perform local import to break circular dependency
-        try:
-            from app.engines.rules_engine.evaluator import check_and_trigger_rules_for_event
-            
-            logging.info(f"Re-evaluating rules for group '{group_id}' due to tag change (added tag ID: {tag_to_add_id}).")
-            
-            tag_change_trigger_context = {
-                'group_id': group_id,
-                'trigger_type': 'tag_change', # Important for evaluator logic
-                'changed_tag_id': tag_to_add_id,
-                'change_details': 'added'
-            }
-            # The evaluator's check_rule_initiators will use 'group_id' from context to fetch current tags
-            # and 'trigger_type' to know how to match initiators.
-            
-            check_and_trigger_rules_for_event(
-                db=db,
-                rc=rc, # Pass the redis client
-                group_id=group_id,
-                trigger_type="tag_change",
-                trigger_context=tag_change_trigger_context
-            )
-        except ImportError:
-            logging.error("Failed to import 'check_and_trigger_rules_for_event' for tag change re-evaluation. Rule re-triggering skipped.")
-        except Exception as e_reeval:
-            logging.error(f"Error during rule re-evaluation after tag change for group '{group_id}': {e_reeval}", exc_info=True)
+        # Re-evaluate rules for this group due to tag change, batched by the cascade of running actions
+        cascade = context.get('cascade')
+        if cascade is not None:
+            cascade.add_tag_change(group_id, tag_to_add_id)
+        else:
+            cascade = TagCascade()
+            cascade.add_tag_change(group_id, tag_to_add_id)
+            cascade.run(db, rc)
 
     except SQLAlchemyError as e_db:
         db.rollback()
         logging.error(f"Database error adding tag to group '{group_id}': {e_db}", exc_info=True)
+        raise
     except Exception as e_main:
         db.rollback() # Ensure rollback on other unexpected errors before re-evaluation attempt
         logging.error(f"Unexpected error adding tag to group '{group_id}': {e_main}", exc_info=True)
@@ -226,7 +213,10 @@ ACTION_DISPATCHER = {k: v for k, v in ACTION_DISPATCHER.items() if v is not None
 
 
 def execute_action(action_data: ActionDict, context: Dict[str, Any], rc: Optional[redis.Redis] = None, db: Optional[Session] = None): # Add rc
-    """Looks up and executes the appropriate action function, passing db and rc session."""
+    """
+    Looks up and executes the appropriate action function, passing db and rc session.
+    Returns False when the action raised (worth retrying), True otherwise.
+    """
     action_type = action_data.get('action_type')
     action_params = action_data.get('action_params')
     rule_id = context.get('rule_id', 'N/A')
@@ -242,5 +232,7 @@ def execute_action(action_data: ActionDict, context: Dict[str, Any], rc: Optiona
             action_function(action_params, context, db=db, rc=rc) # Pass rc
         except Exception as e:
             logging.error(f"Error executing action '{backend_action_key}' (Rule:{rule_id}, Prio:{rule_prio}): {e}", exc_info=True)
+            return False
     else:
-        logging.warning(f"Unknown or unimplemented action type '{action_type}' (mapped to '{backend_action_key}') Rule:{rule_id} (Prio:{rule_prio})")
\ No newline at end of file
+        logging.warning(f"Unknown or unimplemented action type '{action_type}' (mapped to '{backend_action_key}') Rule:{rule_id} (Prio:{rule_prio})")
+    return True
\ No newline at end of file
@@ -0,0 +1,92 @@
+####################################################
+# Tag change cascade of rules
+# Last version of update: v0.95
+# app/engines/rules_engine/cascade.py
+####################################################
+
+# Tags added by rule actions re-trigger "tag_change" rules of the group, whose
+# actions can add further tags. Instead of evaluating recursively from
+# action_add_tag, tag changes are collected into the TagCascade of the
+# running actions (context['cascade']) and evaluated breadth first: one
+# tag_change evaluation per changed group per level, changes of one level
+# de-duplicated. Actions of rules fired inside the cascade run inline (not on
+# the action queue), so their tag changes join the next level.
+#
+# Limits
+# TAG_CASCADE_MAX_DEPTH  levels evaluated after the first tag change, the rest is dropped (logged)
+# cycle detection        a rule fires at most once per group in one cascade and a tag
+#                        added to a group once (changes coming back again are dropped)
+
+import os
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+import redis # type: ignore
+from sqlalchemy.orm import Session
+
+
+TAG_CASCADE_MAX_DEPTH = int(os.getenv("TAG_CASCADE_MAX_DEPTH", "5"))
+
+
+class TagCascade:
+    """Tag changes made by actions of one rule run, evaluated level by level by run()."""
+
+    def __init__(self, max_depth: int = TAG_CASCADE_MAX_DEPTH):
+        self.max_depth = max_depth
+        self.depth = 0
+        # group_id -> tag ids added in the current level
+        self.pending: Dict[str, Set[str]] = {}
+        self.added: Set[Tuple[str, str]] = set()
+        self.fired: Set[Tuple[str, str]] = set()
+
+    def add_tag_change(self, group_id: str, tag_id: str):
+        """Records tag added to group, its tag_change evaluation runs in the next level."""
+        if (group_id, tag_id) in self.added:
+            logging.warning(f"Tag cascade cycle: tag '{tag_id}' added to group '{group_id}' again at depth {self.depth}, skipped.")
+            return
+        self.added.add((group_id, tag_id))
+        self.pending.setdefault(group_id, set()).add(tag_id)
+
+    def mark_fired(self, group_id: Optional[str], rule_id: Optional[str]):
+        if group_id and rule_id:
+            self.fired.add((group_id, rule_id))
+
+    def allows(self, group_id: str, rule_id: str) -> bool:
+        """False when rule already fired for group in this cascade (cycle)."""
+        if (group_id, rule_id) in self.fired:
+            logging.warning(f"Tag cascade cycle: rule '{rule_id}' already fired for group '{group_id}', skipped at depth {self.depth}.")
+            return False
+        return True
+
+    def run(self, db: Session, rc: Optional[redis.Redis]) -> int:
+        """Evaluates tag_change rules of changed groups until no change is left or max depth. Returns levels run."""
+        # Local import, evaluator imports the action modules
+        from .evaluator import check_and_trigger_rules_for_event
+        while self.pending:
+            if self.depth >= self.max_depth:
+                logging.warning(f"Tag cascade stopped at max depth {self.max_depth}, "
+                                f"tag changes of groups {sorted(self.pending)} not evaluated.")
+                self.pending = {}
+                break
+            self.depth += 1
+            changes, self.pending = self.pending, {}
+            for group_id, tag_ids in changes.items():
+                logging.info(f"Re-evaluating rules for group '{group_id}' due to tag change (added tag IDs: {sorted(tag_ids)}, depth {self.depth}).")
+                try:
+                    check_and_trigger_rules_for_event(
+                        db=db,
+                        rc=rc,
+                        group_id=group_id,
+                        trigger_type="tag_change",
+                        trigger_context={
+                            'group_id': group_id,
+                            'trigger_type': 'tag_change',
+                            'changed_tag_ids': sorted(tag_ids),
+                            'change_details': 'added',
+                            'cascade_depth': self.depth,
+                            'cascade': self,
+                        },
+                    )
+                except Exception as e:
+                    logging.error(f"Error during rule re-evaluation after tag change for group '{group_id}': {e}", exc_info=True)
+        return self.depth
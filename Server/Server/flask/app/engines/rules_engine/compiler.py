@@ -0,0 +1,275 @@
+####################################################
+# Rule compiler
+# Last version of update: v0.95
+# app/engines/rules_engine/compiler.py
+####################################################
+
+# Rule lists of get_rules_for_group_cached are compiled once per decoded list
+# held in its process local cache: thresholds are parsed into Decimal, operators resolved into
+# functions and rules are indexed by the key their initiators react to
+# (measurement name after translate_init, or trigger type such as "schedule"
+# and "tag_change"). A trigger only touches rules from its bucket.
+
+import logging
+import operator as op
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, Optional, List, Callable, FrozenSet, NamedTuple, Tuple
+
+import redis # type: ignore
+from sqlalchemy.orm import Session
+
+from app.cache.database_caching import get_rules_for_group_cached
+from app.cache.local_cache import LocalLRUCache, MISSING
+from app.dep_lib import measurement_init, translate_init
+
+
+TAG_INITIATOR_TYPES = frozenset(('tag', 'set_tag', 'tag_change'))
+SCHEDULE_INITIATOR_TYPES = frozenset(('date', 'time', 'schedule_interval', 'time_interval', 'schedule'))
+
+# Trigger types (trigger_context['trigger_type']) initiators of a kind react to
+TRIGGER_TAG_CHANGE = "tag_change"
+TRIGGER_SCHEDULE = "schedule"
+
+# Initiator kinds
+KIND_MEASUREMENT = "measurement"
+KIND_TAG = "tag"
+KIND_SCHEDULE = "schedule"
+KIND_OTHER = "other"
+
+_COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    '>': op.gt, 'gt': op.gt,
+    '>=': op.ge, 'gte': op.ge,
+    '<': op.lt, 'lt': op.lt,
+    '<=': op.le, 'lte': op.le,
+    '=': op.eq, '==': op.eq, 'eq': op.eq,
+    '!=': op.ne, 'ne': op.ne,
+}
+
+
+def _inside(low: Decimal, high: Decimal) -> Callable[[Decimal], bool]:
+    return lambda value: low <= value <= high
+
+
+def _outside(low: Decimal, high: Decimal) -> Callable[[Decimal], bool]:
+    return lambda value: value < low or value > high
+
+
+_RANGES: Dict[str, Callable[[Decimal, Decimal], Callable[[Decimal], bool]]] = {
+    'between': _inside,
+    'outside': _outside,
+    'not between': _outside,
+}
+
+
+def _never(value) -> bool:
+    return False
+
+
+def compile_condition(operator: Optional[str], threshold1_str: Optional[str],
+                      threshold2_str: Optional[str] = None) -> Callable[[Any], bool]:
+    """
+    Returns predicate of one measurement condition, same semantics as evaluator.evaluate_condition.
+    Invalid conditions compile to predicate which is always False (logged once here).
+    """
+    if operator is None or threshold1_str is None:
+        return _never
+    op_name = operator.lower().strip()
+    try:
+        threshold1 = Decimal(threshold1_str)
+        threshold2 = Decimal(threshold2_str) if threshold2_str is not None else None
+    except (InvalidOperation, TypeError, ValueError) as e:
+        logging.error(f"Rule compile error: Invalid thresholds. Op='{operator}', T1='{threshold1_str}', T2='{threshold2_str}'. Error: {e}")
+        return _never
+
+    if op_name in _COMPARISONS:
+        compare = _COMPARISONS[op_name]
+        predicate = lambda value: compare(value, threshold1)
+    elif op_name in _RANGES:
+        if threshold2 is None:
+            logging.warning(f"Rule compile: '{op_name}' needs 2 thresholds.")
+            return _never
+        low, high = (threshold1, threshold2) if threshold1 <= threshold2 else (threshold2, threshold1)
+        predicate = _RANGES[op_name](low, high)
+    else:
+        logging.warning(f"Unsupported rule operator: '{operator}'")
+        return _never
+
+    def condition(value) -> bool:
+        if value is None:
+            return False
+        try:
+            return predicate(value if isinstance(value, Decimal) else Decimal(str(value)))
+        except (InvalidOperation, TypeError, ValueError):
+            return False
+    return condition
+
+
+# Direction the threshold of a comparison moves when relaxed by hysteresis band
+_BAND_DIRECTION: Dict[str, int] = {
+    '>': -1, 'gt': -1, '>=': -1, 'gte': -1,
+    '<': 1, 'lt': 1, '<=': 1, 'lte': 1,
+}
+
+
+def relax_thresholds(operator: Optional[str], threshold1_str: Optional[str], threshold2_str: Optional[str] = None,
+                     hysteresis: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Returns thresholds relaxed by the hysteresis band (e.g. '> 35' with band 2 -> '33'),
+    unchanged without band, for = / != or when they can't be parsed.
+    """
+    try:
+        band = abs(Decimal(hysteresis)) if hysteresis not in (None, '') else Decimal(0)
+        threshold1 = Decimal(threshold1_str) if threshold1_str is not None else None
+        threshold2 = Decimal(threshold2_str) if threshold2_str is not None else None
+    except (InvalidOperation, TypeError, ValueError) as e:
+        logging.error(f"Rule compile error: Invalid hysteresis. Op='{operator}', band='{hysteresis}'. Error: {e}")
+        return threshold1_str, threshold2_str
+    if not band or operator is None or threshold1 is None:
+        return threshold1_str, threshold2_str
+
+    op_name = operator.lower().strip()
+    if op_name in _BAND_DIRECTION:
+        return str(threshold1 + _BAND_DIRECTION[op_name] * band), threshold2_str
+    if op_name in _RANGES and threshold2 is not None:
+        low, high = (threshold1, threshold2) if threshold1 <= threshold2 else (threshold2, threshold1)
+        if _RANGES[op_name] is _inside:
+            return str(low - band), str(high + band)
+        # Band wider than the range shrinks it to its middle
+        middle = (low + high) / 2
+        return str(min(low + band, middle)), str(max(high - band, middle))
+    return threshold1_str, threshold2_str
+
+
+def compile_hold_condition(operator: Optional[str], threshold1_str: Optional[str],
+                           threshold2_str: Optional[str] = None, hysteresis: Optional[str] = None) -> Callable[[Any], bool]:
+    """
+    Returns predicate telling that a met condition still holds: thresholds are relaxed
+    by the hysteresis band (e.g. '> 35' with band 2 holds while value > 33).
+    Without band (or for = / !=) it is the condition itself.
+    """
+    return compile_condition(operator, *relax_thresholds(operator, threshold1_str, threshold2_str, hysteresis))
+
+
+class CompiledInitiator(NamedTuple):
+    kind: str
+    type: str
+    # Measurement name (translate_init applied), trigger type of tag/schedule initiators
+    # or raw type, matched against trigger
+    match_key: str
+    condition: Callable[[Any], bool]
+    # Condition relaxed by hysteresis band, a fired rule re-arms once it stops holding
+    holds: Callable[[Any], bool]
+    tags: FrozenSet[str]
+    raw: Dict[str, Any]
+
+
+class CompiledRule(NamedTuple):
+    id: str
+    priority: int
+    # all / any
+    combine: Callable[[Any], bool]
+    initiators: Tuple[CompiledInitiator, ...]
+    hold_seconds: int
+    cooldown_seconds: int
+    rule: Dict[str, Any]
+
+
+class CompiledRuleSet(NamedTuple):
+    group_id: str
+    rules: Tuple[CompiledRule, ...]
+    # match key -> rules (priority order) having at least one initiator with that key
+    by_key: Dict[str, Tuple[CompiledRule, ...]]
+
+    def candidates(self, trigger_context: Dict[str, Any]) -> List[CompiledRule]:
+        """Rules which can react to trigger (its measurement type or trigger type), priority order."""
+        keys = {str(key) for key in (trigger_context.get('measurement_type'), trigger_context.get('trigger_type'))
+                if key is not None}
+        if len(keys) == 1:
+            return list(self.by_key.get(keys.pop(), ()))
+        matched = {rule.id for key in keys for rule in self.by_key.get(key, ())}
+        return [rule for rule in self.rules if rule.id in matched]
+
+
+def _initiator_tags(tags) -> FrozenSet[str]:
+    if not tags:
+        return frozenset()
+    if isinstance(tags, str):
+        # Entries cached before tags were stored as list ("{'a', 'b'}")
+        return frozenset(tag.strip(" '\"") for tag in tags.strip("{}").split(",") if tag.strip(" '\""))
+    return frozenset(str(tag) for tag in tags)
+
+
+def compile_initiator(initiator: Dict[str, Any]) -> CompiledInitiator:
+    initiator_type = str(initiator.get('type'))
+    if initiator_type in TAG_INITIATOR_TYPES:
+        kind = KIND_TAG
+    elif initiator_type in SCHEDULE_INITIATOR_TYPES:
+        kind = KIND_SCHEDULE
+    elif initiator_type in measurement_init:
+        kind = KIND_MEASUREMENT
+    else:
+        kind = KIND_OTHER
+    has_condition = kind in (KIND_MEASUREMENT, KIND_OTHER)
+    if kind == KIND_TAG:
+        match_key = TRIGGER_TAG_CHANGE
+    elif kind == KIND_SCHEDULE:
+        match_key = TRIGGER_SCHEDULE
+    else:
+        match_key = translate_init.get(initiator_type, initiator_type)
+    return CompiledInitiator(
+        kind=kind,
+        type=initiator_type,
+        match_key=match_key,
+        condition=compile_condition(initiator.get('operator'), initiator.get('value'), initiator.get('value2'))
+        if has_condition else _never,
+        holds=compile_hold_condition(initiator.get('operator'), initiator.get('value'), initiator.get('value2'),
+                                     initiator.get('hysteresis'))
+        if has_condition else _never,
+        tags=_initiator_tags(initiator.get('tags')),
+        raw=initiator,
+    )
+
+
+def compile_rules(group_id: str, rules: List[Dict[str, Any]]) -> CompiledRuleSet:
+    """Compiles rule list of group (sorted by priority) into CompiledRuleSet."""
+    compiled_rules = []
+    by_key: Dict[str, List[CompiledRule]] = {}
+    for rule in rules:
+        logical_operator = str(rule.get('logical_operator') or 'or').lower()
+        if logical_operator not in ('and', 'or'):
+            logging.warning(f"Unsupported logical operator '{logical_operator}' for rule {rule.get('id')}. Defaulting to AND.")
+        compiled = CompiledRule(
+            id=rule.get('id', 'UNKNOWN'),
+            priority=rule.get('priority'),
+            combine=any if logical_operator == 'or' else all,
+            initiators=tuple(compile_initiator(initiator) for initiator in rule.get('initiators', [])),
+            hold_seconds=int(rule.get('hold_seconds') or 0),
+            cooldown_seconds=int(rule.get('cooldown_seconds') or 0),
+            rule=rule,
+        )
+        compiled_rules.append(compiled)
+        for key in {initiator.match_key for initiator in compiled.initiators}:
+            by_key.setdefault(key, []).append(compiled)
+    return CompiledRuleSet(
+        group_id=group_id,
+        rules=tuple(compiled_rules),
+        by_key={key: tuple(value) for key, value in by_key.items()},
+    )
+
+
+# group_id -> (decoded rule list the set was compiled from, compiled set), per process
+_compiled_local = LocalLRUCache("compiled_rules")
+
+
+def get_compiled_rules(db: Session, rc: Optional[redis.Redis], group_id: str) -> CompiledRuleSet:
+    """
+    Returns compiled rules of group. Compiled set is reused while the local cache
+    of get_rules_for_group_cached returns the same list (invalidation and TTL replace it).
+    """
+    rules = get_rules_for_group_cached(db, rc, group_id)
+    entry = _compiled_local.get(group_id)
+    if entry is not MISSING and entry[0] is rules:
+        return entry[1]
+    compiled = compile_rules(group_id, rules)
+    _compiled_local.set(group_id, (rules, compiled))
+    return compiled
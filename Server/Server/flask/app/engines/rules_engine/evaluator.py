@@ -5,33 +5,29 @@
 ####################################################
 
 import logging
+import time
 from decimal import Decimal, InvalidOperation
 from typing import Dict, Any, Optional, List, Set
 
 from .actions import execute_action # Actions from sibling module
-# Adjust import path for loader function and types
-try:
-    from app.cache.database_caching import get_rules_for_group_cached
-except ImportError as err1:
-    logging.error(f"Evaluator error: {err1}")
-    try: 
-        from .loader import get_rules_for_group_cached, ActionDict, InitiatorDict
-    except ImportError: 
-        logging.error("Cannot import rule loader function/types for evaluator. 1")
-        RuleDict=Dict 
-        ActionDict=Dict 
-        InitiatorDict=Dict; 
-        def get_rules_for_group_cached(*args, **kwargs): return []
+from .action_queue import enqueue_rule_actions, build_action_job
+from .compiler import (
+    get_compiled_rules, CompiledRule, CompiledInitiator, KIND_MEASUREMENT, KIND_TAG, KIND_SCHEDULE
+)
 
 
 # Import DB session/Redis for loader call
 from sqlalchemy.orm import Session, joinedload, selectinload
 import redis # type: ignore
 from datetime import timedelta, datetime, timezone
-from app.dep_lib import measurement_init, translate_init
 from app.db_man.pqsql.models import Group, Sensor
 from sqlalchemy import func
 from app.engines.event_engine.event_tracker import write_event
+from app.cache.group_state import get_group_measurement_average, apply_group_reading
+from app.cache.database_caching import get_group_tag_ids_cached
+from .trigger_state import step_trigger_state
+from .rule_stats import record_evaluation, record_actions, query_count
+from .cascade import TagCascade
 
 window_seconds = 10
 
@@ -76,53 +72,72 @@ def trigger_rule_actions(rule_data: Dict, trigger_context: Dict[str, Any], rc, d
     action_context['rule_name'] = rule_data.get('name')
     action_context['rule_priority'] = rule_prio
 
+    # Dedicated queue, synchronously only when it can't be used
+    # or inside a tag cascade (its tag changes join the next level of the cascade)
+    cascade = action_context.get('cascade')
+    if cascade is None and enqueue_rule_actions(build_action_job(rule_id, actions, action_context)):
+        return
+    owns_cascade = cascade is None
+    if owns_cascade:
+        cascade = action_context['cascade'] = TagCascade()
+        cascade.mark_fired(action_context.get('group_id'), rule_id)
+
     # Actions are pre-sorted by loader
+    started, queries, failures = time.perf_counter(), query_count(db), 0
     for action_data in actions:
         # Pass the db session down to execute_action
-        execute_action(action_data, action_context, rc=rc, db=db) # Pass db
+        if not execute_action(action_data, action_context, rc=rc, db=db): # Pass db
+            failures += 1
+    record_actions(rc, rule_id, time.perf_counter() - started, len(actions), failures, query_count(db) - queries)
+    if owns_cascade and db is not None:
+        cascade.run(db, rc)
 
 
 
 
-def evaluate_measurement(db, initiator, trigger_context):
-    measurement_type = initiator.get('type', "None")
-    group_id = trigger_context.get('group_id')
+def _average_from_sql(db, group_id, measurement):
     latest_time_subquery = db.query(
         func.max(Sensor.last_reading_time)
     ).filter(
         Sensor.group_id == group_id,
-        Sensor.measurement == translate_init.get(measurement_type, measurement_type),
+        Sensor.measurement == measurement,
         Sensor.last_reading_time.isnot(None)  # Only consider sensors with actual reading times
     ).scalar_subquery()
 
-    average_value = db.query(
+    return db.query(
         func.avg(Sensor.last_reading_value)
     ).filter(
         Sensor.group_id == group_id,
-        Sensor.measurement == translate_init.get(measurement_type, measurement_type),
+        Sensor.measurement == measurement,
         Sensor.last_reading_time == latest_time_subquery  # Filter by the most recent time
     ).scalar()
 
-    condition_met = evaluate_condition(
-                    sensor_value=average_value,
-                    operator=initiator.get('operator'),
-                    threshold1_str=initiator.get('value'),
-                    threshold2_str=initiator.get('value2')
-    )
-    return condition_met
 
+def _group_average(db, rc: Optional[redis.Redis], group_id, measurement):
+    """Average of the latest readings of measurement in group, Redis state or SQL."""
+    if rc is not None:
+        try:
+            return get_group_measurement_average(db, rc, group_id, measurement)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error reading measurement state of group {group_id}: {e}. Falling back to SQL.")
+    return _average_from_sql(db, group_id, measurement)
 
 
-def evaluate_tag(db, intiator_tags, trigger_context):
-    # get tags
-    group = db.query(Group).options(joinedload(Group.tags)).filter(Group.id == trigger_context.get('group_id')).first()
-    result = set(intiator_tags).issubset(set(group.tags))
-    return result
+def evaluate_measurement(db, initiator: CompiledInitiator, trigger_context, rc: Optional[redis.Redis] = None):
+    """Evaluates condition on average of the latest readings of measurement in group."""
+    return initiator.condition(_group_average(db, rc, trigger_context.get('group_id'), initiator.match_key))
 
-def evaluate_schedule(initiator):
+
+
+def evaluate_tag(db, initiator_tags, trigger_context, rc: Optional[redis.Redis] = None):
+    """True when group has all tags of initiator (cached tag ids of group)."""
+    return initiator_tags <= get_group_tag_ids_cached(db, rc, trigger_context.get('group_id'))
+
+def evaluate_schedule(initiator, at: Optional[datetime] = None):
+    """Matches schedule initiator against `at` (time the schedule was due, schedule_index.py) or now."""
     schedule_type = initiator.get('schedule_type', 'None')
     schedule_value = initiator.get('schedule_value', "None")
-    current_time = datetime.now(timezone.utc)
+    current_time = at or datetime.now(timezone.utc)
     try:
         # --- 1. Parse scheduled time (HH:MM) ---
         # This is common to all types.
@@ -193,104 +208,105 @@ def evaluate_schedule(initiator):
         logging.warning(f"An unexpected error occurred: {e}") # Or log
         return False
     
+def _evaluate_initiator(db: Session, rc: Optional[redis.Redis], initiator: CompiledInitiator,
+                        trigger_context: Dict[str, Any]) -> bool:
+    if initiator.match_key == trigger_context.get('measurement_type'):
+        # called by measurement, before writing into postgres last sensor value.
+        # Only used without Redis, check_rule_initiators de-duplicates through trigger state otherwise.
+        got_value_condition_met = initiator.condition(trigger_context.get('value'))
+        if not got_value_condition_met:
+            return False
+        # if hub with multiple sensors assigned to specific group and the sensors data get inside at the same time,
+        # then if the values are near threshold there will be multiple warnings.
+        # user can add schedule initator that will activates
+        last_value_condition_met = evaluate_measurement(db, initiator, trigger_context, rc)
+        if last_value_condition_met:
+            logging.debug("Last is evaluated same as the new one")
+        return not last_value_condition_met
+    if initiator.kind == KIND_MEASUREMENT:
+        return evaluate_measurement(db, initiator, trigger_context, rc)
+    if initiator.kind == KIND_TAG:
+        try:
+            return evaluate_tag(db, initiator.tags, trigger_context, rc)
+        except Exception as e:
+            logging.error(f"ERROR IN THE TAG INCI: {initiator.raw}, trigger: {trigger_context}, error: {e}")
+            return False
+    if initiator.kind == KIND_SCHEDULE:
+        return evaluate_schedule(initiator.raw, trigger_context.get('scheduled_at'))
+    logging.debug(f"Edge case or not stored: 5 {initiator.type}")
+    return False
+
+
+def _group_value_after_reading(db: Session, rc: redis.Redis, trigger_context: Dict[str, Any]) -> Optional[float]:
+    """Average of the reading's measurement in group with the reading applied, once per reading."""
+    if '_group_value' not in trigger_context:
+        trigger_context['_group_value'] = apply_group_reading(
+            db, rc, trigger_context.get('group_id'), trigger_context.get('measurement_type'),
+            trigger_context.get('sensor_id'), trigger_context.get('value'), trigger_context.get('timestamp_dt'),
+        )
+    return trigger_context['_group_value']
+
+
+def _evaluate_with_trigger_state(db: Session, rc: redis.Redis, rule: CompiledRule,
+                                 trigger_context: Dict[str, Any]) -> bool:
+    """
+    Evaluates rule on a measurement reading and moves its trigger state (trigger_state.py),
+    True only when the rule fires now. Raises RedisError when the state can't be updated.
+    State is kept per group, so initiator on the reading's measurement compares the group
+    average with the reading applied (a low and a high sensor of one group don't re-arm
+    and fire the rule on every reading).
+    """
+    met: List[bool] = []
+    holds: List[bool] = []
+    for initiator in rule.initiators:
+        if initiator.match_key == trigger_context.get('measurement_type'):
+            value = _group_value_after_reading(db, rc, trigger_context)
+        elif initiator.kind == KIND_MEASUREMENT:
+            value = _group_average(db, rc, trigger_context.get('group_id'), initiator.match_key)
+        else:
+            result = _evaluate_initiator(db, rc, initiator, trigger_context)
+            met.append(result)
+            holds.append(result)
+            continue
+        met.append(initiator.condition(value))
+        holds.append(initiator.holds(value))
+    return step_trigger_state(rc, rule.id, trigger_context.get('group_id'), rule.combine(met), rule.combine(holds),
+                              rule.hold_seconds, rule.cooldown_seconds)
+
+
 def check_rule_initiators(
     db: Session,
-    rule_data: Dict,
+    rule: CompiledRule,
     trigger_type: str, # e.g., "measurement", "schedule", "tag_change"
-    trigger_context: Dict[str, Any]
+    trigger_context: Dict[str, Any],
+    rc: Optional[redis.Redis] = None
     ) -> bool:
     """
-    Evaluates initiators of a specific type for a given rule against the trigger context.
-    Applies the rule's logical operator.
+    Evaluates initiators of a compiled rule against the trigger context.
+    Applies the rule's logical operator, evaluation stops as soon as the result is known.
 
     Args:
-        rule_data: Dictionary representing the rule.
+        rule: Compiled rule, picked by CompiledRuleSet.candidates (has initiator reacting to the trigger).
         trigger_type: The type of event triggering the check.
         trigger_context: Data relevant to the trigger
                          (e.g., sensor data for 'measurement', time info for 'schedule').
 
     Returns:
         True if the rule's conditions (for the specified trigger type) are met, False otherwise.
+        Measurement readings return True only on the transition into the condition (trigger state in Redis).
     """
-    initiators = rule_data.get('initiators', [])
-    logical_operator = rule_data.get('logical_operator', 'or').lower()
-    rule_id = rule_data.get('id', 'UNKNOWN')
-
-    relevant_initiator_results: List[bool] = []
-    found_intiators = []
-
-    for initiator in initiators:
-        stored_type = translate_init.get(str(initiator.get('type')), str(initiator.get('type')))
-        if (stored_type == trigger_context.get('measurement_type')) or (str(stored_type) == str(trigger_context.get('trigger_type'))):
-            found_intiators.append(initiator)
-        else:
-            logging.debug(f"Stored type: {stored_type}, trigger_type: {trigger_type}")
-
-    if found_intiators == []:
-        logging.debug(f"Rule {rule_id} has no initiators matching trigger type '{trigger_type}'.")
-        logging.debug(f"stored_type: {stored_type}")
-        logging.debug(f"measurement_type: {trigger_context.get('measurement_type')}")
-        logging.debug(f"trigger_context: {trigger_context.get('trigger_type')}")
-        return False
-    num_init = 0
-    for initiator in initiators:
-        num_init += 1
-        condition_met = False
-        initiator_type = str(initiator.get('type'))
-        logging.debug(f"Intiator: {num_init}/{len(initiators)}, type: {initiator_type}")
-        if (translate_init.get(initiator_type, initiator_type) == trigger_context.get('measurement_type')):
-            # called by measurement, before writing into postgres last sensor value.
-            logging.debug("Case_1: initiator called by trigger_context")
-            sensor_value = trigger_context.get('value')
-            logging.debug(f"sensor value: {sensor_value}, trigger: {trigger_context}")
-            got_value_condition_met = evaluate_condition(
-                    sensor_value=sensor_value,
-                    operator=initiator.get('operator'),
-                    threshold1_str=initiator.get('value'),
-                    threshold2_str=initiator.get('value2')
-            )
-            last_value_condition_met = evaluate_measurement(db, initiator, trigger_context) # I can because, measurement rule is evaluated before put into postgres database, 
-            if got_value_condition_met and last_value_condition_met:        # if hub with multiple sensors assigned to specific group and the sensors data get inside at the same time, then if the values are near threshold there will be multiple warnings. 
-                logging.debug("Last is evaluated same as the new one")                                                              # user can add schedule initator that will activates              
-                condition_met = False
-            else:
-                condition_met = got_value_condition_met
-            logging.debug(f"Final Case_1: {condition_met}")
-        elif (initiator_type in measurement_init):
-            logging.debug("Case_2: initiator is measurement but the trigger_context")
-            condition_met = evaluate_measurement(db, initiator, trigger_context)
-            logging.debug(f"Final Case_2: {condition_met}")
-        elif (initiator_type in set(('tag', 'set_tag', 'tag_change'))):
-            try:
-                logging.debug("Case_3: initiator is tag.")
-                condition_met = evaluate_tag(db, initiator.get('tags'), trigger_context)
-                logging.debug(f"Final Case_3: {condition_met}")
-            except Exception as e:
-                logging.error(f"ERROR IN THE TAG INCI: {initiator}, trigger: {trigger_context}, rule: {rule_data}")
-        elif (initiator_type in set(('date', 'time', 'schedule_interval', 'time_interval', 'schedule'))):
-            logging.debug("Case 4: initiator is time")
-            condition_met = evaluate_schedule(initiator)
-            logging.debug(f"Final Case 4: {condition_met}")
-        else:
-            logging.debug(f"Edge case or not stored: 5 {initiator_type}")
-            condition_met = False
-        if condition_met:
-            relevant_initiator_results.append(True)
-        else:
-            relevant_initiator_results.append(False)
-
-    logging.debug(f"Final Intiators status: {relevant_initiator_results}")
-    if logical_operator == 'and':
-        result = all(relevant_initiator_results)
-        logging.info(f"Rule {rule_id} (AND on '{trigger_type}') evaluation result: {result}")
-        return result
-    elif logical_operator == 'or':
-        result = any(relevant_initiator_results)
-        logging.info(f"Rule {rule_id} (OR on '{trigger_type}') evaluation result: {result}")
-        return result
-    else:
-        logging.warning(f"Unsupported logical operator '{logical_operator}' for rule {rule_id}. Defaulting to AND.")
-        return all(relevant_initiator_results)
+    measurement_type = trigger_context.get('measurement_type')
+    if rc is not None and measurement_type is not None and any(
+            initiator.match_key == measurement_type for initiator in rule.initiators):
+        try:
+            result = _evaluate_with_trigger_state(db, rc, rule, trigger_context)
+            logging.debug(f"Rule {rule.id} ({rule.combine.__name__} on '{trigger_type}') trigger state result: {result}")
+            return result
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error updating trigger state of rule {rule.id}: {e}. Falling back to last value comparison.")
+    result = rule.combine(_evaluate_initiator(db, rc, initiator, trigger_context) for initiator in rule.initiators)
+    logging.debug(f"Rule {rule.id} ({rule.combine.__name__} on '{trigger_type}') evaluation result: {result}")
+    return result
 
 
 
@@ -316,45 +332,56 @@ def check_and_trigger_rules_for_event(
         logging.warning("Cannot check rules: group_id is missing.")
         return triggered_rule_ids
 
-    # 1. Get rules for this group (sorted by priority)
-    rules_for_group = get_rules_for_group_cached(db, rc, group_id)
-    if not rules_for_group:
-        logging.debug(f"No active rules found for group {group_id} to check against trigger '{trigger_type}'.")
+    # 1. Get compiled rules for this group, only rules reacting to this trigger
+    rule_set = get_compiled_rules(db, rc, group_id)
+    candidates = rule_set.candidates(trigger_context)
+    if trigger_context.get('rule_ids'):
+        # Schedule dispatch names the rules which are due
+        candidates = [rule for rule in candidates if rule.id in trigger_context['rule_ids']]
+    cascade = trigger_context.get('cascade')
+    if cascade is not None:
+        # Tag cascade, rules which already fired for the group are skipped
+        candidates = [rule for rule in candidates if cascade.allows(group_id, rule.id)]
+    if not candidates:
+        logging.debug(f"No active rules of group {group_id} react to trigger '{trigger_type}' ({len(rule_set.rules)} rules).")
         return triggered_rule_ids
 
-    logging.debug(f"Evaluating {len(rules_for_group)} rules for group {group_id} based on trigger '{trigger_type}'...")
+    logging.debug(f"Evaluating {len(candidates)} of {len(rule_set.rules)} rules for group {group_id} based on trigger '{trigger_type}'...")
 
     # Add group_id to context if not already present
     if 'group_id' not in trigger_context:
         trigger_context['group_id'] = group_id
-    logging.debug("Evaluating intiators for each rule: ")
 
     logging.debug(f"Trigger context: {trigger_context}")
-    logging.debug("")
     # 2. Evaluate rules in priority order
-    for rule in rules_for_group:
-        rule_id = rule['id']
-        logging.debug(f"Checking Rule '{rule_id}' (Prio: {rule['priority']}) for trigger '{trigger_type}'...")
+    for compiled_rule in candidates:
+        rule = compiled_rule.rule
+        rule_id = compiled_rule.id
+        logging.debug(f"Checking Rule '{rule_id}' (Prio: {compiled_rule.priority}) for trigger '{trigger_type}'...")
         try:
-            logging.info(f"rule info: {rule}, trigger type:{trigger_type}, trigger context: {trigger_context}")
+            started, queries = time.perf_counter(), query_count(db)
             # Check if *this rule's* relevant initiators are met by the trigger event
             rule_conditions_met = check_rule_initiators(
                 db=db,
-                rule_data=rule,
+                rule=compiled_rule,
                 trigger_type=trigger_type,
-                trigger_context=trigger_context
+                trigger_context=trigger_context,
+                rc=rc
             )
+            record_evaluation(rc, rule_id, time.perf_counter() - started, query_count(db) - queries, rule_conditions_met)
 
             if rule_conditions_met:
-                logging.info(f"RULE TRIGGERED: Rule ID '{rule_id}' (Prio: {rule['priority']}) fully met by '{trigger_type}' event for group {group_id}.")
+                logging.info(f"RULE TRIGGERED: Rule ID '{rule_id}' (Prio: {compiled_rule.priority}) fully met by '{trigger_type}' event for group {group_id}.")
                 triggered_rule_ids.add(rule_id)
+                if cascade is not None:
+                    cascade.mark_fired(group_id, rule_id)
                 # Execute actions for this triggered rule, PASSING DB
                 write_event(db, {'group_id': trigger_context.get("group_id"), 
                                  'type': 'rule_executed',
-                                 'rule_context': rule})
+                                 'rule_context': rule}, rc=rc)
                 trigger_rule_actions(rule, trigger_context,rc,db=db) # Pass db here
                 
         except Exception as e:
              logging.error(f"Error processing rule '{rule_id}' during event '{trigger_type}': {e}", exc_info=True)
 
-    return triggered_rule_ids
\ No newline at end of file
+    return triggered_rule_ids
@@ -0,0 +1,151 @@
+####################################################
+# Per-rule evaluation statistics
+# Last version of update: v0.95
+# app/engines/rules_engine/rule_stats.py
+####################################################
+
+# Counters of every rule (evaluations, triggers, evaluation time, DB queries,
+# action time) are summed per process and flushed into Redis in one pipeline
+# by a timer RULE_STATS_FLUSH_SECONDS after the first counter since the last
+# flush (and at process exit), so recording doesn't add a round trip per
+# evaluation. Redis keeps one sorted set per counter, which gives the
+# top-N view (GET /access/rules/rules/stats) directly.
+#
+# Key layout
+# rulestats:{metric}  -> zset rule_id, score counter (summed by every process)
+# rulestats:since     -> time of the first flush after reset
+
+import os
+import logging
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List
+
+import redis # type: ignore
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+RULE_STATS_ENABLED = os.getenv("RULE_STATS_ENABLED", "1") == "1"
+RULE_STATS_FLUSH_SECONDS = int(os.getenv("RULE_STATS_FLUSH_SECONDS", "5"))
+
+RULE_STATS_KEY = "rulestats:{}"
+RULE_STATS_SINCE_KEY = "rulestats:since"
+METRICS = ("evaluations", "triggers", "eval_ms", "db_queries", "actions", "action_ms", "action_failures")
+
+_QUERY_COUNT = "rule_stats_queries"
+
+_pending: Dict[str, Dict[str, float]] = {}
+_pending_lock = threading.Lock()
+# Flush timer of this process (timer of parent process doesn't exist after fork), last client for exit
+_flush_state: Dict[str, Any] = {"timer": None, "pid": None, "rc": None}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_query(orm_execute_state):
+    # Every statement of session incl. lazy loads, read as delta around a rule
+    info = orm_execute_state.session.info
+    info[_QUERY_COUNT] = info.get(_QUERY_COUNT, 0) + 1
+
+
+def query_count(db: Optional[Session]) -> int:
+    """Statements executed by session so far."""
+    return db.info.get(_QUERY_COUNT, 0) if db is not None else 0
+
+
+def _flush_on_timer():
+    with _pending_lock:
+        _flush_state["timer"] = None
+        rc = _flush_state["rc"]
+    flush_rule_stats(rc)
+
+
+def _add(rc: Optional[redis.Redis], rule_id: str, **values: float):
+    with _pending_lock:
+        counters = _pending.setdefault(rule_id, {})
+        for metric, value in values.items():
+            if value:
+                counters[metric] = counters.get(metric, 0) + value
+        _flush_state["rc"] = rc
+        if _flush_state["timer"] is not None and _flush_state["pid"] == os.getpid():
+            return
+        timer = threading.Timer(RULE_STATS_FLUSH_SECONDS, _flush_on_timer)
+        timer.daemon = True
+        _flush_state.update(timer=timer, pid=os.getpid())
+    timer.start()
+
+
+def record_evaluation(rc: Optional[redis.Redis], rule_id: str, seconds: float, db_queries: int, triggered: bool):
+    """Counts one evaluation of rule."""
+    if RULE_STATS_ENABLED:
+        _add(rc, rule_id, evaluations=1, triggers=int(triggered), eval_ms=seconds * 1000, db_queries=db_queries)
+
+
+def record_actions(rc: Optional[redis.Redis], rule_id: str, seconds: float, actions: int, failures: int = 0,
+                   db_queries: int = 0):
+    """Counts executed actions of rule (queue job or synchronous fallback)."""
+    if RULE_STATS_ENABLED:
+        _add(rc, rule_id, actions=actions, action_ms=seconds * 1000, action_failures=failures, db_queries=db_queries)
+
+
+def flush_rule_stats(rc: Optional[redis.Redis]):
+    """Writes counters of this process into Redis (dropped when Redis is unavailable)."""
+    global _pending
+    with _pending_lock:
+        pending, _pending = _pending, {}
+    if not pending or rc is None:
+        return
+    try:
+        pipe = rc.pipeline(transaction=False)
+        for rule_id, counters in pending.items():
+            for metric, value in counters.items():
+                pipe.zincrby(RULE_STATS_KEY.format(metric), value, rule_id)
+        pipe.set(RULE_STATS_SINCE_KEY, datetime.now(timezone.utc).isoformat(), nx=True)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error flushing statistics of {len(pending)} rules: {e}")
+
+
+@atexit.register
+def _flush_at_exit():
+    if _flush_state["pid"] == os.getpid():
+        flush_rule_stats(_flush_state["rc"])
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_top_rules(rc: redis.Redis, metric: str = "eval_ms", limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Returns rules with the highest counter metric, all counters of each.
+
+    Raises:
+        ValueError: unknown metric
+        RedisError: counters can't be read
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown rule statistic '{metric}'")
+    top = rc.zrevrange(RULE_STATS_KEY.format(metric), 0, limit - 1)
+    rule_ids = [_decode(rule_id) for rule_id in top]
+    if not rule_ids:
+        return []
+    pipe = rc.pipeline(transaction=False)
+    for name in METRICS:
+        pipe.zmscore(RULE_STATS_KEY.format(name), rule_ids)
+    scores = dict(zip(METRICS, pipe.execute()))
+    return [
+        {"rule_id": rule_id, **{name: scores[name][index] or 0 for name in METRICS}}
+        for index, rule_id in enumerate(rule_ids)
+    ]
+
+
+def get_stats_since(rc: redis.Redis) -> Optional[str]:
+    since = rc.get(RULE_STATS_SINCE_KEY)
+    return _decode(since) if since else None
+
+
+def reset_rule_stats(rc: redis.Redis):
+    """Deletes counters of all rules."""
+    rc.delete(RULE_STATS_SINCE_KEY, *(RULE_STATS_KEY.format(metric) for metric in METRICS))
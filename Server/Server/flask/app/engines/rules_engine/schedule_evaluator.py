@@ -5,13 +5,16 @@
 ####################################################
 
 from sqlalchemy.orm import Session, selectinload, joinedload
-from datetime import datetime, timezone, date
+from typing import Dict, List, Optional, Any
+from datetime import datetime, timezone, date, timedelta
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
 from influxdb_client.client.exceptions import InfluxDBError
 import logging
 import os
+import redis
 from app.db_man.pqsql.models import *
+from app.db_man.influxdb.query_builder import run_query, validate_identifier, SCHEDULE_OPERATORS, SCHEDULE_ROLLUP_WINDOWS
 
 
 INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8087")
@@ -20,33 +23,26 @@ INFLUXDB_ORG = os.getenv("DOCKER_INFLUXDB_INIT_ORG", "vceljak")
 INFLUXDB_BUCKET = os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")
 
 
-def check_sensor_condition_all_must_match(
-    time_period: str,
-    sensor_id: str,
-    measurement_name: str = "sensor_measurement",
-    field_key: str = "value",
-    operator: str = "==",
-    condition_value: float = 0.0
-) -> bool:
-    """
-    Checks if ALL sensor values meet a condition within a given time period.
-    - For value comparisons: True if data exists AND all data points meet the condition.
-    - For "observed": True if any data point exists.
+# Rollup bucket of each duration_unit, streak advances by one per closed bucket
+CONDITION_BUCKETS = {
+    "minute": timedelta(minutes=1), "minutes": timedelta(minutes=1),
+    "hour": timedelta(hours=1), "hours": timedelta(hours=1),
+    "day": timedelta(days=1), "days": timedelta(days=1),
+    "week": timedelta(weeks=1), "weeks": timedelta(weeks=1),
+    "check": timedelta(hours=1), # Default 'check' to 1 hour
+}
+MEASUREMENT_CONDITION_TYPES = ['temperature', 'humidity', 'weight', 'pressure', 'sound level', 'voc'] # Add all relevant measurement types
 
-    Args:
-        time_period: The duration string for the query range (e.g., "1h", "7d").
-        sensor_id: The ID of the sensor to check.
-        measurement_name: The InfluxDB measurement name.
-        field_key: The field key containing the value to check.
-        operator: The comparison operator (">", "<", "==", "<=", ">=", "observed").
-        condition_value: The value to compare against (ignored if operator is "observed").
+# Per condition state: last processed bucket, streak and running min/max of the streak
+CONDITION_STATE_KEY = "schedule:condition:{}:state"
+CONDITION_STATE_TTL_SECONDS = int(os.getenv("SCHEDULE_CONDITION_STATE_TTL_SECONDS", str(90 * 24 * 3600)))
 
-    Returns:
-        True if the condition is met according to the "all must match" logic, False otherwise.
-    """
-    flux_query = ""
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-    normalized_operator = operator.lower().strip()
+
+def normalize_condition_operator(operator: str) -> str:
+    """Translates operator of schedule condition (above, below, ...) to comparison operator."""
+    normalized_operator = operator.lower().strip() if operator else ""
 
     if normalized_operator == "above":
         normalized_operator = ">"
@@ -56,260 +52,262 @@ def check_sensor_condition_all_must_match(
         normalized_operator = ">="
     elif normalized_operator == "belowequal":
         normalized_operator = "<="
-    elif normalized_operator == "equal":
-        normalized_operator = "="
-    
-
-    if normalized_operator == "observed":
-        
-        flux_query = f'''
-            import "array"
-
-            // Base data for the sensor and field
-            base_data = from(bucket: "{INFLUXDB_BUCKET}")
-              |> range(start: -{time_period})
-              |> filter(fn: (r) => r._measurement == "{measurement_name}")
-              |> filter(fn: (r) => r.sensor_id == "{sensor_id}")
-              |> filter(fn: (r) => r._field == "{field_key}")
-
-            // Filter for the specific value we want to observe
-            specific_value_present = base_data
-              |> filter(fn: (r) => r._value == {float(condition_value)}) // Check for equality with condition_value
-              |> count() // Count how many times this specific value was found
-              |> map(fn: (r) => ({{_value: r._value > 0 }})) // True if count > 0 (i.e., value was found at least once)
-              |> findRecord(fn: (key) => true, idx: 0) // Get the single result record
-
-            meets_condition = if exists specific_value_present._value then
-                                 specific_value_present._value
-                               else
-                                 false // If findRecord fails or no data, assume false
-
-            array.from(rows: [{{final_condition_met: meets_condition}}])
-              |> yield(name: "result")
-        '''
-    else:
-        
-
-        flux_query = f'''
-            import "array"
-
-            base_data = from(bucket: "{INFLUXDB_BUCKET}")
-              |> range(start: -{time_period})
-              |> filter(fn: (r) => r._measurement == "{measurement_name}")
-              |> filter(fn: (r) => r.sensor_id == "{sensor_id}")
-              |> filter(fn: (r) => r._field == "{field_key}")
-
-            has_any_data_record = base_data
-              |> count()
-              |> map(fn: (r) => ({{_value: r._value > 0 }}))
-              |> findRecord(fn: (key) => true, idx: 0)
+    elif normalized_operator in ("equal", "="):
+        normalized_operator = "=="
+    return normalized_operator
 
-            has_any_data = if exists has_any_data_record._value then
-                                 has_any_data_record._value
-                               else
-                                 false
 
-            violators_count_record = base_data
-              |> filter(fn: (r) => not (r._value {normalized_operator} {float(condition_value)}))
-              |> count()
-              |> findRecord(fn: (key) => true, idx: 0)
+def floor_to_bucket(moment: datetime, bucket: timedelta) -> datetime:
+    """Floors time to bucket boundary (aligned to epoch, same as Flux window())."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return _EPOCH + ((moment - _EPOCH) // bucket) * bucket
 
-            violators_count = if exists violators_count_record._value then
-                                    violators_count_record._value
-                                  else
-                                    0
 
-            meets_condition = has_any_data and violators_count == 0
+def fetch_condition_rollups(
+    start: datetime,
+    stop: datetime,
+    bucket_every: str,
+    sensor_ids: List[str],
+    condition_value: float,
+    measurement_name: str = "sensor_measurement",
+    field_key: str = "value",
+) -> Optional[Dict[datetime, Dict[str, Dict[str, float]]]]:
+    """
+    Fetches rollups (count, min, max, matches) of closed buckets for all sensors in one query.
 
-            array.from(rows: [{{final_condition_met: meets_condition}}])
-              |> yield(name: "result")
-        '''
+    Args:
+        start, stop: bucket aligned range of closed buckets
+        bucket_every: bucket length ("1m", "1h", "1d", "1w")
+        sensor_ids: IDs of the sensors to check
+        condition_value: value counted in "matches" (used by "observed", "!=")
 
-    logging.debug(f"--- Executing Flux Query ---\n{flux_query}\n-------------------------------------------------")
+    Returns:
+        {bucket_start: {sensor_id: {"count", "min", "max", "matches"}}}, buckets/sensors
+        without data are missing. None if the query couldn't be executed.
+    """
+    try:
+        params = {
+            "start": start,
+            "stop": stop,
+            "sensor_ids": [validate_identifier(sensor_id, "sensor_id") for sensor_id in sensor_ids],
+            "measurement": validate_identifier(measurement_name, "measurement"),
+            "field": validate_identifier(field_key, "field"),
+            "value": float(condition_value),
+        }
+    except (ValueError, TypeError) as e:
+        logging.warning(f"Invalid schedule condition query parameters: {e}")
+        return None
 
+    rollups: Dict[datetime, Dict[str, Dict[str, float]]] = {}
     try:
-        with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG, timeout=20000) as client: # Increased timeout
-            query_api = client.query_api()
-            tables = query_api.query(query=flux_query)
-
-            if not tables:
-                logging.debug("Query returned no tables. Assuming condition not met.")
-                return False
-
-            for table in tables:
-                if table.records:
-                    for record in table.records:
-                        logging.debug(record)
-                        if record.values.get("final_condition_met") is True:
-                            return True
-                    # If loop finishes for a table with records, 'final_condition_met' was false.
-                    return False
-            # If no tables had records with 'final_condition_met'
-            logging.debug("Query returned tables but no relevant records found. Assuming condition not met.")
-            return False
+        tables = run_query(f"schedule_rollup:{bucket_every}", params)
+        for table in tables:
+            for record in table.records:
+                sensor_id = record.values.get("sensor_id")
+                bucket_start = record.values.get("_start")
+                if sensor_id is None or bucket_start is None:
+                    continue
+                rollups.setdefault(bucket_start, {})[sensor_id] = {
+                    "count": int(record.values.get("count") or 0),
+                    "min": float(record.values.get("min") or 0.0),
+                    "max": float(record.values.get("max") or 0.0),
+                    "matches": int(record.values.get("matches") or 0),
+                }
+        return rollups
 
     except InfluxDBError as e:
         logging.error(f"InfluxDB API Error: {e}")
-        return False
+        return None
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
-        return False
+        return None
 
 
+def rollup_meets_condition(rollup: Optional[Dict[str, float]], operator: str, condition_value: float) -> bool:
+    """
+    Verdict of one sensor in one bucket:
+    - For value comparisons: True if data exists AND all data points meet the condition.
+    - For "observed": True if the condition value was seen at least once.
+    """
+    if not rollup or rollup["count"] <= 0:
+        return False
+    if operator == "observed":
+        return rollup["matches"] > 0
+    if operator == ">":
+        return rollup["min"] > condition_value
+    if operator == ">=":
+        return rollup["min"] >= condition_value
+    if operator == "<":
+        return rollup["max"] < condition_value
+    if operator == "<=":
+        return rollup["max"] <= condition_value
+    if operator == "==":
+        return rollup["min"] == condition_value and rollup["max"] == condition_value
+    if operator == "!=":
+        return rollup["matches"] == 0
+    return False
+
+
+def _condition_signature(condition: ScheduleCondition) -> str:
+    return f"{condition.type}|{condition.operator}|{condition.value}|{condition.duration_unit}|{condition.group_id}"
+
+
+def _load_condition_state(rc: Optional[redis.Redis], condition: ScheduleCondition) -> Optional[Dict[str, str]]:
+    if not rc:
+        return None
+    try:
+        raw = rc.hgetall(CONDITION_STATE_KEY.format(condition.condition_id))
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis HGETALL error schedule condition state {condition.condition_id}: {e}")
+        return None
+    state = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+    if not state or state.get("signature") != _condition_signature(condition):
+        return None
+    return state
+
+
+def _save_condition_state(rc: Optional[redis.Redis], condition: ScheduleCondition, state: Dict[str, Any]):
+    if not rc:
+        return
+    key = CONDITION_STATE_KEY.format(condition.condition_id)
+    mapping = {k: ("" if v is None else str(v)) for k, v in state.items()}
+    mapping["signature"] = _condition_signature(condition)
+    try:
+        pipe = rc.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, CONDITION_STATE_TTL_SECONDS)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error saving schedule condition state {condition.condition_id}: {e}")
 
 
-def evaluate_condition(condition: ScheduleCondition) -> bool:
+def evaluate_condition(condition: ScheduleCondition, rc: Optional[redis.Redis] = None) -> float:
     """
-    Evaluates a single schedule condition.
+    Evaluates a single schedule condition incrementally.
+
+    Only rollup buckets (of condition.duration_unit) closed since the last processed
+    bucket are queried, each of them advances or resets the streak.
     Updates condition.actual_value (streak counter) and condition.last_update.
-    Returns True if the condition's target duration/streak is met, False otherwise.
+    Returns progress of the condition (streak / duration, max 1).
     Assumes condition.group (and .sensors) are pre-loaded.
     """
     current_time = datetime.now(timezone.utc)
-    condition.last_update = current_time  # Update last_update time regardless of outcome
+    target_duration = condition.duration if condition.duration is not None and condition.duration > 0 else 1
 
     try:
         # Ensure actual_value is treated as an integer for streak counting
-        current_streak = int(condition.actual_value) if condition.actual_value and condition.actual_value.isdigit() else 0
+        current_streak = int(condition.actual_value) if condition.actual_value and str(condition.actual_value).isdigit() else 0
     except ValueError:
         current_streak = 0
-    
-    target_duration = condition.duration if condition.duration is not None and condition.duration > 0 else 1
-    
-    condition_type_lower = condition.type.lower() if condition.type else ""
-    check_passed_this_iteration = 0 # Result of this specific check cycle
-
-    # --- Measurement Condition (e.g., temperature, humidity) ---
-    if condition_type_lower in ['temperature', 'humidity', 'weight', 'pressure', 'sound level', 'voc']: # Add all relevant measurement types
-        target_group = condition.group
-        if not target_group:
-            logging.debug(f"    Condition {condition.condition_id} ({condition.type}): Measurement check needs a group, but none linked.")
-            current_streak = 0 # Reset streak
-            condition.actual_value = str(current_streak)
-            return current_streak >= target_duration
-
-        if not target_group.sensors:
-            logging.debug(f"    Condition {condition.condition_id} ({condition.type}): Group '{target_group.id}' has no sensors for measurement check.")
-            current_streak = 0 # Reset streak
-            condition.actual_value = str(current_streak)
-            return current_streak >= target_duration
-
-        # Determine InfluxDB query_time_period from condition.duration_unit
-        # This time_period is for *one check interval*
-        influx_query_period_map = {
-            "minute": "1m", "minutes": "1m",
-            "hour": "1h", "hours": "1h",
-            "day": "1d", "days": "1d",
-            "week": "1w", "weeks": "1w",
-            "check": "1h", # Default 'check' to 1 hour; adjust as needed for your scheduling frequency
-        }
-        duration_unit_lower = condition.duration_unit.lower() if condition.duration_unit else "check"
-        query_time_period = influx_query_period_map.get(duration_unit_lower, "1h")
-
-        # Find the relevant sensor by matching condition.type with sensor.measurement
-        found_sensor = []
-        for sensor in target_group.sensors:
-            if sensor.measurement and sensor.measurement.lower() == condition_type_lower:
-                found_sensor.append(sensor)
-                
-        number_of_sensor = len(found_sensor)
-        if not found_sensor:
-            logging.debug(f"    Condition {condition.condition_id} ({condition.type}): No sensor found in Group '{target_group.id}' matching measurement type '{condition_type_lower}'.")
-            current_streak = 0 # Reset streak
-        else:
-            checks_passed = 0
-            for sensor in found_sensor:
-                value_to_check_str = condition.value
-                operator_str = condition.operator
-                
-                if operator_str.lower().strip() == "observed":
-                     value_to_check_float = float(value_to_check_str)# Not used by 'observed' operator logic in check_sensor_condition_all_must_match
-                else:
-                    try:
-                        value_to_check_float = float(value_to_check_str)
-                    except (ValueError, TypeError):
-                        logging.warning(f"    Condition {condition.condition_id} ({condition.type}): Invalid condition value '{value_to_check_str}' for numeric comparison. Resetting streak.")
-                        current_streak = 0 # Reset streak due to invalid config
-                        condition.actual_value = str(current_streak)
-                        return 0
-
-               
-                sensor_check = check_sensor_condition_all_must_match(
-                    time_period=query_time_period,
-                    sensor_id=sensor.id,
-                    measurement_name="sensor_measurement", # Standard measurement name for sensor data
-                    field_key="value",                    # Standard field key for sensor readings
-                    operator=operator_str,
-                    condition_value=value_to_check_float
-                )
-                if sensor_check:
-                    checks_passed += 1
-            if checks_passed == number_of_sensor:
-                check_passed_this_iteration = True
-    else:
-        logging.debug(f"    Condition {condition.condition_id}: Unhandled condition type '{condition.type}'. Resetting streak.")
-        current_streak = 0 # Reset streak for unhandled types
 
-    # Update streak based on this iteration's check result
-    if check_passed_this_iteration:
-        current_streak += 1
-    else:
-        current_streak = 0 # Reset streak if condition failed this time
-    
-    if int(condition.actual_value) > int(condition.duration):
-        condition.actual_value = str(condition.duration)
-    else: 
-        condition.actual_value = str(current_streak)
-    
-    if condition.operator == "observed":
-        if current_streak >= 1:
-            condition.actual_value = condition.duration
-            return 1
-    
-    logging.debug(f"    Condition {condition.condition_id} ({condition.type}): Streak updated to {current_streak}/{target_duration}.")
-    return int(current_streak) / int(condition.duration)
-
-from datetime import datetime, timedelta, timezone
+    def _finish(streak: int, state: Optional[Dict[str, Any]] = None) -> float:
+        streak = min(streak, target_duration)
+        condition.actual_value = str(streak)
+        condition.last_update = current_time
+        if state is not None:
+            state["streak"] = streak
+            _save_condition_state(rc, condition, state)
+        logging.debug(f"    Condition {condition.condition_id} ({condition.type}): Streak updated to {streak}/{target_duration}.")
+        return streak / target_duration
 
-def time_calc(db_timestamp_str, time_span_unit, condition):
+    condition_type_lower = condition.type.lower() if condition.type else ""
+    if condition_type_lower not in MEASUREMENT_CONDITION_TYPES:
+        logging.debug(f"    Condition {condition.condition_id}: Unhandled condition type '{condition.type}'. Resetting streak.")
+        return _finish(0)
+
+    target_group = condition.group
+    if not target_group:
+        logging.debug(f"    Condition {condition.condition_id} ({condition.type}): Measurement check needs a group, but none linked.")
+        return _finish(0)
+
+    # Find the relevant sensors by matching condition.type with sensor.measurement
+    found_sensor = [
+        sensor for sensor in (target_group.sensors or [])
+        if sensor.measurement and sensor.measurement.lower() == condition_type_lower
+    ]
+    if not found_sensor:
+        logging.debug(f"    Condition {condition.condition_id} ({condition.type}): No sensor found in Group '{target_group.id}' matching measurement type '{condition_type_lower}'.")
+        return _finish(0)
+
+    operator = normalize_condition_operator(condition.operator)
+    if operator != "observed" and operator not in SCHEDULE_OPERATORS:
+        logging.warning(f"    Condition {condition.condition_id} ({condition.type}): Unsupported operator '{condition.operator}'. Resetting streak.")
+        return _finish(0)
     try:
-        
-        # Ensure db_time is timezone-aware (it should be if fromisoformat parsed the +00)
-        if db_timestamp_str.tzinfo is None:
-            logging.warning("Warning: Database timestamp was parsed as naive. Assuming UTC.")
-            db_timestamp_str = db_timestamp_str.replace(tzinfo=timezone.utc)
-
-
-        # 2. Define the time delta based on the input
-        if time_span_unit.lower() == 'hours':
-            delta = timedelta(hours=1)
-        elif time_span_unit.lower() == 'days':
-            delta = timedelta(days=1)
-        elif time_span_unit.lower() == 'weeks':
-            delta = timedelta(weeks=1)
+        value_to_check_float = float(condition.value)
+    except (ValueError, TypeError):
+        logging.warning(f"    Condition {condition.condition_id} ({condition.type}): Invalid condition value '{condition.value}' for numeric comparison. Resetting streak.")
+        return _finish(0)
+
+    duration_unit_lower = condition.duration_unit.lower() if condition.duration_unit else "check"
+    bucket = CONDITION_BUCKETS.get(duration_unit_lower, CONDITION_BUCKETS["check"])
+    bucket_every = SCHEDULE_ROLLUP_WINDOWS[bucket]
+    last_closed_end = floor_to_bucket(current_time, bucket)
+
+    # Where the previous evaluation stopped: redis state, or last_update of the condition
+    state = _load_condition_state(rc, condition)
+    if state and state.get("last_bucket_end"):
+        processed_until = datetime.fromisoformat(state["last_bucket_end"])
+        current_streak = int(state.get("streak") or 0)
+        running_min = float(state["min"]) if state.get("min") else None
+        running_max = float(state["max"]) if state.get("max") else None
+    else:
+        last_update = condition.last_update or current_time
+        processed_until = floor_to_bucket(last_update, bucket)
+        running_min = running_max = None
+        state = {}
+
+    if processed_until >= last_closed_end:
+        logging.debug(f"    Condition {condition.condition_id} ({condition.type}): No bucket closed since last check.")
+        condition.actual_value = str(min(current_streak, target_duration))
+        return min(current_streak, target_duration) / target_duration
+
+    # Buckets older than target duration can't change the (capped) streak
+    earliest_needed = last_closed_end - bucket * target_duration
+    if processed_until < earliest_needed:
+        processed_until = earliest_needed
+        current_streak = 0
+        running_min = running_max = None
+
+    rollups = fetch_condition_rollups(
+        start=processed_until,
+        stop=last_closed_end,
+        bucket_every=bucket_every,
+        sensor_ids=[sensor.id for sensor in found_sensor],
+        condition_value=value_to_check_float,
+    )
+    if rollups is None:
+        # Query failed, keep the streak and retry the same buckets next time
+        condition.actual_value = str(min(current_streak, target_duration))
+        return min(current_streak, target_duration) / target_duration
+
+    bucket_start = processed_until
+    while bucket_start < last_closed_end:
+        bucket_rollups = rollups.get(bucket_start, {})
+        if all(rollup_meets_condition(bucket_rollups.get(sensor.id), operator, value_to_check_float) for sensor in found_sensor):
+            current_streak += 1
+            bucket_min = min(r["min"] for r in bucket_rollups.values())
+            bucket_max = max(r["max"] for r in bucket_rollups.values())
+            running_min = bucket_min if running_min is None else min(running_min, bucket_min)
+            running_max = bucket_max if running_max is None else max(running_max, bucket_max)
         else:
-            raise ValueError("Invalid time_span_unit. Choose 'hour', 'day', or 'week'.")
-        # 3. Calculate the target time (this will also be timezone-aware)
-        target_time = db_timestamp_str + delta
-
-        # 4. Get the current time as timezone-aware UTC
-        current_time_utc = datetime.now(timezone.utc)
+            current_streak = 0 # Reset streak if condition failed in this bucket
+            running_min = running_max = None
+        bucket_start += bucket
 
-        # 5. Compare (both are timezone-aware, so direct comparison is correct)
-        if condition.operator == "observed":
-            return True
-        return current_time_utc >= target_time 
+    state.update({"last_bucket_end": last_closed_end.isoformat(), "min": running_min, "max": running_max})
 
-    except ValueError as e:
-        logging.error(f"Error processing timestamp or timespan: {e}")
-        # Could be due to parsing db_timestamp_str or invalid time_span_unit/value
-        return False
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        return False
+    if operator == "observed" and current_streak >= 1:
+        return _finish(target_duration, state)
+    return _finish(current_streak, state)
 
 
-def check_and_update_schedule_progress(db: Session, schedule_id: str):
+def check_and_update_schedule_progress(db: Session, schedule_id: str, rc: Optional[redis.Redis] = None):
     """
     Checks all conditions for a given schedule, updates its progress,
     and status if all conditions are met.
@@ -337,15 +335,9 @@ def check_and_update_schedule_progress(db: Session, schedule_id: str):
         logging.debug(f"\nChecking conditions for Schedule: '{schedule.name}' (ID: {schedule.id}, Current Status: {schedule.status}, Progress: {schedule.progress}%)")
         for condition in schedule.conditions:
             logging.debug(f"  Evaluating Condition ID: {condition.condition_id}, Type: '{condition.type}', Operator: '{condition.operator}', Value: '{condition.value}', Target Duration: {condition.duration} {condition.duration_unit}, Current Streak: {condition.actual_value}, Group: {condition.group_id}")
-            if not (time_calc(condition.last_update, condition.duration_unit, condition)):
-                condition_progress = (int(condition.actual_value) / int(condition.duration))
-                if condition_progress > 1:
-                    met_conditions_count += 1
-                else: 
-                    met_conditions_count += condition_progress
-                continue
-            # condition_calculating_updating calls evaluate_condition, which updates condition.actual_value and condition.last_update
-            condition_met_for_schedule = evaluate_condition(condition)
+            # evaluate_condition processes only buckets closed since the last check (no query if none closed),
+            # it updates condition.actual_value and condition.last_update
+            condition_met_for_schedule = evaluate_condition(condition, rc)
             met_conditions_count += condition_met_for_schedule
             if condition_met_for_schedule == 1:
                 logging.debug(f"    Condition ID: {condition.condition_id} - FULLY MET (Streak: {condition.actual_value} >= Target: {condition.duration})")
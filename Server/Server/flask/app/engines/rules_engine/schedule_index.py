@@ -0,0 +1,198 @@
+####################################################
+# Schedule index of rules (time wheel)
+# Last version of update: v0.95
+# app/engines/rules_engine/schedule_index.py
+####################################################
+
+# Next fire time of every (group, rule) with schedule initiators is kept in a
+# Redis sorted set. Beat task dispatch_due_schedule_rules pops only the due
+# entries, reschedules them and enqueues one rule check per group with the
+# due rules and the time they were due (evaluate_schedule matches that time,
+# not the moment the worker runs, so broker lag doesn't miss schedules).
+#
+# Key layout
+# rules:schedule                -> zset "{group_id}|{rule_id}", score next fire time (unix seconds)
+# rules:schedule:group:{gid}    -> set of rule ids of group in the zset
+# rules:schedule:dirty          -> set of groups to resync (invalidate_group_rules_cache)
+# rules:schedule:built          -> marker of full rebuild, expires after SCHEDULE_REBUILD_SECONDS
+# rules:schedule:tick           -> time of the last dispatch
+
+import os
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+
+import redis # type: ignore
+from sqlalchemy.orm import Session
+
+from app.cache.database_caching import get_rules_for_group_cached, SCHEDULE_DIRTY_GROUPS_KEY
+from app.cache.redis_scripts import get_script
+from app.db_man.pqsql.models import Group
+from .compiler import SCHEDULE_INITIATOR_TYPES
+
+
+SCHEDULE_INDEX_KEY = "rules:schedule"
+SCHEDULE_GROUP_KEY = "rules:schedule:group:{}"
+SCHEDULE_BUILT_KEY = "rules:schedule:built"
+SCHEDULE_TICK_KEY = "rules:schedule:tick"
+SCHEDULE_REBUILD_SECONDS = int(os.getenv("SCHEDULE_REBUILD_SECONDS", "3600"))
+# Entries due longer ago (beat/workers were down) are rescheduled without firing
+SCHEDULE_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULE_MISFIRE_GRACE_SECONDS", "300"))
+SCHEDULE_POP_BATCH_SIZE = int(os.getenv("SCHEDULE_POP_BATCH_SIZE", "1000"))
+
+# Days searched for next matching date per schedule type (29/02 repeats after 4 years)
+_SEARCH_DAYS = {'daily': 2, 'weekly': 8, 'monthly': 366, 'yearly': 366 * 4 + 1}
+
+# KEYS[1] index, ARGV: now, limit. Returns member, score, member, score ...
+_POP_DUE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]))
+for i = 1, #due, 2 do
+    redis.call('ZREM', KEYS[1], due[i])
+end
+return due
+"""
+
+
+def _day_matches(schedule_type: str, date_part: Optional[str], day: datetime) -> bool:
+    """Date part of evaluate_schedule."""
+    if schedule_type == 'daily':
+        return True
+    if date_part is None:
+        return False
+    if schedule_type == 'weekly':
+        return day.weekday() == int(date_part)
+    if schedule_type == 'monthly':
+        return day.day == int(date_part)
+    if schedule_type == 'yearly':
+        day_str, month_str = date_part.split('/')
+        return day.day == int(day_str) and day.month == int(month_str)
+    return False
+
+
+def next_fire_time(schedule_type: Optional[str], schedule_value: Optional[str], after: datetime) -> Optional[datetime]:
+    """
+    Returns first time after `after` matched by schedule initiator (same formats as
+    evaluator.evaluate_schedule, UTC), None for unknown type or malformed value.
+    """
+    if schedule_type not in _SEARCH_DAYS or not schedule_value:
+        return None
+    try:
+        if ',' in schedule_value:
+            date_part, time_str = schedule_value.split(',', 1)
+        else:
+            date_part, time_str = None, schedule_value
+        hour, minute = map(int, time_str.split(':'))
+        start = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        for offset in range(_SEARCH_DAYS[schedule_type]):
+            candidate = start + timedelta(days=offset)
+            if candidate > after and _day_matches(schedule_type, date_part, candidate):
+                return candidate
+    except ValueError as e:
+        logging.debug(f"Unparsable schedule '{schedule_value}' of type '{schedule_type}': {e}")
+    return None
+
+
+def _rule_next_fire(rule: Dict[str, Any], after: datetime) -> Optional[datetime]:
+    times = [
+        next_fire_time(initiator.get('schedule_type'), initiator.get('schedule_value'), after)
+        for initiator in rule.get('initiators', []) if initiator.get('type') in SCHEDULE_INITIATOR_TYPES
+    ]
+    times = [moment for moment in times if moment is not None]
+    return min(times) if times else None
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def sync_group_schedule(db: Session, rc: redis.Redis, group_id: str, after: Optional[datetime] = None) -> int:
+    """
+    Replaces index entries of group by next fire times (after `after`, default now)
+    of its current rules, returns their count.
+    """
+    after = after or datetime.now(timezone.utc)
+    entries = {}
+    for rule in get_rules_for_group_cached(db, rc, group_id):
+        fire_at = _rule_next_fire(rule, after)
+        if fire_at is not None:
+            entries[f"{group_id}|{rule['id']}"] = fire_at.timestamp()
+
+    group_key = SCHEDULE_GROUP_KEY.format(group_id)
+    stale = {f"{group_id}|{_decode(rule_id)}" for rule_id in rc.smembers(group_key)} - set(entries)
+    pipe = rc.pipeline()
+    if stale:
+        pipe.zrem(SCHEDULE_INDEX_KEY, *stale)
+    pipe.delete(group_key)
+    if entries:
+        pipe.zadd(SCHEDULE_INDEX_KEY, entries)
+        pipe.sadd(group_key, *(member.split('|', 1)[1] for member in entries))
+    pipe.execute()
+    return len(entries)
+
+
+def rebuild_schedule_index(db: Session, rc: redis.Redis, after: Optional[datetime] = None) -> int:
+    """Resyncs every group (groups without schedule rules are removed by sync), returns number of entries."""
+    total = 0
+    prefix = SCHEDULE_GROUP_KEY.format("")
+    indexed_groups = {_decode(key)[len(prefix):] for key in rc.scan_iter(match=prefix + "*", count=500)}
+    group_ids = {group_id for (group_id,) in db.query(Group.id).all()}
+    for group_id in group_ids | indexed_groups:
+        total += sync_group_schedule(db, rc, group_id, after)
+    rc.set(SCHEDULE_BUILT_KEY, datetime.now(timezone.utc).isoformat(), ex=SCHEDULE_REBUILD_SECONDS)
+    logging.info(f"Schedule index rebuilt: {total} entries of {len(group_ids)} groups.")
+    return total
+
+
+def pop_due_schedules(db: Session, rc: redis.Redis) -> List[Tuple[str, List[str], datetime]]:
+    """
+    Takes due entries out of the index and reschedules them. Changed groups are
+    resynced from the previous tick first, so occurrences since then aren't skipped.
+
+    Returns:
+        (group_id, ids of rules due, time they were due) per group and due time,
+        only entries inside misfire grace
+    """
+    now = datetime.now(timezone.utc)
+    last_tick = rc.getset(SCHEDULE_TICK_KEY, now.isoformat())
+    try:
+        after = min(datetime.fromisoformat(_decode(last_tick)), now) if last_tick else now
+    except ValueError:
+        after = now
+    if not rc.exists(SCHEDULE_BUILT_KEY):
+        rebuild_schedule_index(db, rc, after)
+    while True:
+        group_id = rc.spop(SCHEDULE_DIRTY_GROUPS_KEY)
+        if group_id is None:
+            break
+        sync_group_schedule(db, rc, _decode(group_id), after)
+
+    pop_due = get_script(rc, "_schedule_pop_due", _POP_DUE_LUA)
+    due: Dict[Tuple[str, datetime], List[str]] = {}
+    rules_by_group: Dict[str, List[Dict[str, Any]]] = {}
+    while True:
+        popped = pop_due(keys=[SCHEDULE_INDEX_KEY], args=[now.timestamp(), SCHEDULE_POP_BATCH_SIZE])
+        if not popped:
+            break
+        reschedule = {}
+        for member, score in zip(popped[::2], popped[1::2]):
+            member = _decode(member)
+            group_id, rule_id = member.split('|', 1)
+            due_at = datetime.fromtimestamp(float(score), tz=timezone.utc)
+            if group_id not in rules_by_group:
+                rules_by_group[group_id] = get_rules_for_group_cached(db, rc, group_id)
+            rule = next((r for r in rules_by_group[group_id] if r.get('id') == rule_id), None)
+            if rule is None:
+                continue
+            # Next occurrence in the future (missed ones are skipped)
+            fire_at = _rule_next_fire(rule, now)
+            if fire_at is not None:
+                reschedule[member] = fire_at.timestamp()
+            if (now - due_at).total_seconds() > SCHEDULE_MISFIRE_GRACE_SECONDS:
+                logging.warning(f"Schedule of rule {rule_id} in group {group_id} due at {due_at} missed, skipped.")
+                continue
+            due.setdefault((group_id, due_at), []).append(rule_id)
+        if reschedule:
+            rc.zadd(SCHEDULE_INDEX_KEY, reschedule)
+        if len(popped) < SCHEDULE_POP_BATCH_SIZE * 2:
+            break
+    return [(group_id, rule_ids, due_at) for (group_id, due_at), rule_ids in due.items()]
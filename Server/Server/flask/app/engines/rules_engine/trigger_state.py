@@ -0,0 +1,90 @@
+####################################################
+# Trigger state machine of measurement rules
+# Last version of update: v0.95
+# app/engines/rules_engine/trigger_state.py
+####################################################
+
+# Measurement rules fire on the transition into their condition, not on every
+# reading which meets it. State per (rule, group) is kept in Redis and moved
+# by one Lua script, so concurrent readings of several sensors of a group
+# (other greenlets, other workers) can fire the rule only once.
+#
+#   armed    -> fired     condition met and held for rule.hold_seconds
+#                         (checked on readings, fires on the first one after the hold)
+#   fired    -> cooldown  condition relaxed by hysteresis band of initiators stops holding
+#   cooldown -> armed     after rule.cooldown_seconds (fired -> armed directly without cooldown)
+#
+# Key layout
+# rulestate:{rule_id}:{group_id} -> hash(state, since, until, fired_at), times in ms of Redis clock
+
+import os
+
+import redis # type: ignore
+
+from app.cache.redis_scripts import get_script
+
+
+RULE_STATE_KEY = "rulestate:{}:{}"
+RULE_STATE_TTL_SECONDS = int(os.getenv("RULE_STATE_TTL_SECONDS", "604800"))
+
+# KEYS[1] state hash, ARGV: met (0/1), holds (0/1), hold ms, cooldown ms, ttl
+_STEP_LUA = """
+local key = KEYS[1]
+local met, holds = ARGV[1] == '1', ARGV[2] == '1'
+local hold, cooldown = tonumber(ARGV[3]), tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', key, 'state') or 'armed'
+local fired = 0
+if state == 'fired' and not holds then
+    if cooldown > 0 then
+        state = 'cooldown'
+        redis.call('HSET', key, 'until', now + cooldown)
+    else
+        state = 'armed'
+    end
+end
+if state == 'cooldown' and now >= tonumber(redis.call('HGET', key, 'until') or 0) then
+    state = 'armed'
+    redis.call('HDEL', key, 'until')
+end
+if state == 'armed' then
+    local since = tonumber(redis.call('HGET', key, 'since'))
+    if since and not holds then since = nil end
+    if not since and met then since = now end
+    if since and now - since >= hold then
+        state = 'fired'
+        fired = 1
+        redis.call('HDEL', key, 'since')
+        redis.call('HSET', key, 'fired_at', now)
+    elseif since then
+        redis.call('HSET', key, 'since', since)
+    else
+        redis.call('HDEL', key, 'since')
+    end
+end
+redis.call('HSET', key, 'state', state)
+redis.call('EXPIRE', key, tonumber(ARGV[5]))
+return fired
+"""
+
+
+def step_trigger_state(rc: redis.Redis, rule_id: str, group_id: str, met: bool, holds: bool,
+                       hold_seconds: int = 0, cooldown_seconds: int = 0) -> bool:
+    """
+    Moves state of rule in group by one evaluation, returns True when the rule fires now.
+
+    Args:
+        met: condition of rule is met by the reading
+        holds: condition relaxed by hysteresis band still holds (True whenever met)
+
+    Raises:
+        RedisError: state can't be updated (caller falls back to last value comparison)
+    """
+    fired = get_script(rc, "_rule_trigger_step", _STEP_LUA)(
+        keys=[RULE_STATE_KEY.format(rule_id, group_id)],
+        args=[int(met), int(holds or met), max(hold_seconds, 0) * 1000, max(cooldown_seconds, 0) * 1000,
+              RULE_STATE_TTL_SECONDS],
+    )
+    return bool(int(fired))
+
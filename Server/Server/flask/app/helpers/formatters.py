@@ -149,35 +149,38 @@ def _format_initiator(initiator: RuleInitiator) -> dict:
         "operator": initiator.operator,
         "value": float(initiator.value) if initiator.value is not None else None,
         "value2": float(initiator.value2) if initiator.value2 is not None else None,
+        "hysteresis": float(initiator.hysteresis) if initiator.hysteresis is not None else None,
         "scheduleType": initiator.schedule_type,
         "scheduleValue": initiator.schedule_value,
         "tags": [tag.id for tag in initiator.tags] if initiator.tags else []
     }
 
-def _format_rule_response(rule: Rule) -> dict:
+def _format_rule_response(rule: Rule, fields: set | None = None) -> dict:
     """Formats a Rule ORM object into the detailed dictionary for API responses."""
-    formatted_actions = sorted(
-        [_format_action(act) for act in rule.actions],
-        key=lambda x: x.get('execution_order', 0)
-    )
-
- 
-    return {
-        "id": rule.id,
-        "name": rule.name,
-        "description": rule.description,
-        "initiators": [_format_initiator(init) for init in rule.initiators],
-        "logicalOperator": rule.logical_operator,
+    def formatted_actions():
+        return sorted(
+            [_format_action(act) for act in rule.actions],
+            key=lambda x: x.get('execution_order', 0)
+        )
+
+    builders = {
+        "id": lambda: rule.id,
+        "name": lambda: rule.name,
+        "description": lambda: rule.description,
+        "initiators": lambda: [_format_initiator(init) for init in rule.initiators],
+        "logicalOperator": lambda: rule.logical_operator,
         "actions": formatted_actions, # Full list (likely just one based on FE)
-        "action": formatted_actions[0].get('action_type') if formatted_actions else None,
-        "actionParams": formatted_actions[0].get('action_params') if formatted_actions else {},
-        "isActive": rule.is_active,
-    
-        # 'tags' field name already matches FE expectation for appliesTo='tagged'
-        "ruleSet": rule.rule_set_id or "none",
-        "priority": rule.priority,
+        "action": lambda: (formatted_actions() or [{}])[0].get('action_type'),
+        "actionParams": lambda: (formatted_actions() or [{}])[0].get('action_params', {}),
+        "isActive": lambda: rule.is_active,
 
+        # 'tags' field name already matches FE expectation for appliesTo='tagged'
+        "ruleSet": lambda: rule.rule_set_id or "none",
+        "priority": lambda: rule.priority,
+        "holdSeconds": lambda: rule.hold_seconds,
+        "cooldownSeconds": lambda: rule.cooldown_seconds,
     }
+    return {key: build() for key, build in builders.items() if fields is None or key in fields}
 
 def _format_event_response(event: GroupEvent) -> dict:
     """Formats a GroupEvent ORM object for API responses."""
@@ -190,10 +193,11 @@ def _format_event_response(event: GroupEvent) -> dict:
         "group_id": event.group_id
     }
 # --- FORMATTER FOR LIST VIEW ---
-def _format_group_list_item(group: Group, subgroup_map: dict | None = None) -> dict:
+def _format_group_list_item(group: Group, subgroup_map: dict | None = None, fields: set | None = None) -> dict:
     """
     Formats a Group ORM object for the LIST view API response.
     Includes only IDs for relationships.
+    With fields only those keys are built, so not loaded columns/relationships are not touched.
     """
     group_id = getattr(group, 'id', None)
     subgroup_ids = []
@@ -209,25 +213,26 @@ def _format_group_list_item(group: Group, subgroup_map: dict | None = None) -> d
         related_items = safe_get_attr(attr_name, [])
         return [item.id for item in related_items if hasattr(item, 'id')]
 
-    return {
-        "id": group_id,
-        "name": safe_get_attr("name"),
-        "type": safe_get_attr("type"),
-        "description": safe_get_attr("description"),
-        "parentId": safe_get_attr("parent_id"),
-        "sensors": get_id_list("sensors"),
-        "rules": get_id_list("rules"),
-        "ruleSets": get_id_list("rule_sets"),
-        "tags": get_id_list("tags"),
-        "subgroups": subgroup_ids, # From the map
-        "inspectionDate": safe_get_attr("last_inspection").isoformat() if safe_get_attr("last_inspection") else None,
-        "location": safe_get_attr("location"),
-        "automatic_mode": safe_get_attr("automatic_mode", False),
-        "mode": safe_get_attr("mode"),
-        "health": safe_get_attr("health"),
-        "beehive_type": safe_get_attr("beehive_type"),
-        "is_main": safe_get_attr("is_main", False)
+    builders = {
+        "id": lambda: group_id,
+        "name": lambda: safe_get_attr("name"),
+        "type": lambda: safe_get_attr("type"),
+        "description": lambda: safe_get_attr("description"),
+        "parentId": lambda: safe_get_attr("parent_id"),
+        "sensors": lambda: get_id_list("sensors"),
+        "rules": lambda: get_id_list("rules"),
+        "ruleSets": lambda: get_id_list("rule_sets"),
+        "tags": lambda: get_id_list("tags"),
+        "subgroups": lambda: subgroup_ids, # From the map
+        "inspectionDate": lambda: safe_get_attr("last_inspection").isoformat() if safe_get_attr("last_inspection") else None,
+        "location": lambda: safe_get_attr("location"),
+        "automatic_mode": lambda: safe_get_attr("automatic_mode", False),
+        "mode": lambda: safe_get_attr("mode"),
+        "health": lambda: safe_get_attr("health"),
+        "beehive_type": lambda: safe_get_attr("beehive_type"),
+        "is_main": lambda: safe_get_attr("is_main", False),
     }
+    return {key: build() for key, build in builders.items() if fields is None or key in fields}
 
 # --- FORMATTER FOR DETAIL VIEW ---
 def _format_group_detail_response(group: Group, subgroup_map: dict | None = None) -> dict:
@@ -295,7 +300,8 @@ def _format_rule_detail(rule: Rule) -> dict:
         # 'tags' field name already matches FE expectation for appliesTo='tagged'
         "ruleSet": rule.rule_set_id or "none",
         "priority": rule.priority,
-
+        "holdSeconds": rule.hold_seconds,
+        "cooldownSeconds": rule.cooldown_seconds,
     }
 
 def _format_ruleset_detail(ruleset: RuleSet) -> dict:
@@ -0,0 +1,139 @@
+####################################
+# Keyset pagination and field selection
+# Last version of update: v0.95
+# app/helpers/pagination.py
+####################################
+
+# List routes accept (JSON body for POST, query string for GET):
+#   limit   - page size, pagination is off when neither limit nor cursor is sent
+#             (full list, as before)
+#   cursor  - nextCursor of previous page
+#   fields  - list or comma separated string of response keys to return
+#   withTotal - true to count all items (separate COUNT, only on first page)
+# Paginated responses carry "nextCursor" (None on last page) and "total"
+# (None unless withTotal was sent). Cached lists are paged in Python string
+# order, DB pages of the same lists have to be ordered with COLLATE "C".
+
+import json
+import base64
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set
+
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+
+class PageParams(NamedTuple):
+    limit: Optional[int]
+    cursor: Optional[List[Any]]
+    fields: Optional[Set[str]]
+    with_total: bool = False
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, parsers: Optional[Sequence[Callable[[Any], Any]]] = None) -> List[Any]:
+    """
+    Raises:
+        ValueError: cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or (parsers and len(values) != len(parsers)):
+        raise ValueError("Invalid cursor")
+    if parsers:
+        try:
+            values = [parse(value) for parse, value in zip(parsers, values)]
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+    return values
+
+
+def parse_page_params(source: Dict[str, Any], allowed_fields: Iterable[str],
+                      cursor_parsers: Optional[Sequence[Callable[[Any], Any]]] = None) -> PageParams:
+    """
+    Reads limit, cursor and fields from request data.
+
+    Raises:
+        ValueError: invalid limit, cursor or unknown field
+    """
+    limit = source.get("limit")
+    cursor = source.get("cursor")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (ValueError, TypeError):
+            raise ValueError("'limit' must be an integer.")
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_LIMIT}.")
+    elif cursor:
+        limit = DEFAULT_PAGE_LIMIT
+
+    fields = source.get("fields")
+    if fields:
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(fields) - set(allowed_fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+        fields = set(fields)
+    else:
+        fields = None
+
+    with_total = source.get("withTotal") in (True, 1, "1", "true", "True")
+    return PageParams(limit, decode_cursor(cursor, cursor_parsers) if cursor else None, fields, with_total)
+
+
+def paginate_query(query, sort_columns: Sequence[Any], params: PageParams,
+                   key: Callable[[Any], Sequence[Any]], descending: bool = False):
+    """
+    Applies keyset pagination on (sort_columns) row comparison, sort columns
+    must be NOT NULL and unique together (last one is usually primary key).
+
+    Returns:
+        tuple: (rows, next_cursor)
+    """
+    order = [column.desc() for column in sort_columns] if descending else list(sort_columns)
+    query = query.order_by(*order)
+    if not params.paginated:
+        return query.all(), None
+    if params.cursor is not None:
+        boundary = tuple_(*sort_columns)
+        query = query.filter(boundary < tuple_(*params.cursor) if descending else boundary > tuple_(*params.cursor))
+    rows = query.limit(params.limit + 1).all()
+    if len(rows) <= params.limit:
+        return rows, None
+    rows = rows[:params.limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def paginate_list(items: List[Any], params: PageParams, key: Callable[[Any], Sequence[Any]]):
+    """Keyset pagination of list (cached lists), items are sorted by key in Python string order."""
+    if not params.paginated:
+        return items, None
+    items = sorted(items, key=lambda item: list(key(item)))
+    if params.cursor is not None:
+        boundary = list(params.cursor)
+        items = [item for item in items if list(key(item)) > boundary]
+    if len(items) <= params.limit:
+        return items, None
+    page = items[:params.limit]
+    return page, encode_cursor(key(page[-1]))
+
+
+def pick_fields(item: Dict[str, Any], fields: Optional[Set[str]]) -> Dict[str, Any]:
+    """Drops keys which were not requested."""
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
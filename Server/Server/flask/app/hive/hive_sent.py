@@ -12,7 +12,10 @@ from typing import List, Optional, Dict, Any
 import redis
 
 from app.db_man.pqsql.read import get_hub_id_from_session
+from app.cache.last_value_index import update_last_value_index
 from app.hive.after_phase import fetch_latest_from_influx, update_denormalized_data_in_postgres
+from app.cache.hub_sessions import get_cached_session
+from app.cache.group_state import update_group_state
 
 import logging
 
@@ -20,7 +23,8 @@ def run_processing_pipeline(db: Session, rc: Optional[redis.Redis], session_id:
     """Runs the full data processing and writing pipeline."""
     logging.info(f"Starting processing pipeline for session_id: {session_id}")
     try:
-        client_id = get_hub_id_from_session(db, session_id)
+        cached_session = get_cached_session(rc, session_id)
+        client_id = cached_session["client_id"] if cached_session else get_hub_id_from_session(db, session_id)
         logging.info(f"Client id: {client_id}")
     except Exception as err:
         logging.error(f"Getting client id from session id failed: {err}")
@@ -33,16 +37,21 @@ def run_processing_pipeline(db: Session, rc: Optional[redis.Redis], session_id:
         logging.debug("Database session created.")
 
         # 1. Process data (convert, validate, create points)
+        last_values = []
         points_to_write = process_data_for_influx(
             db=db,
             rc=rc,
             client_id=client_id,
-            incoming_data=data
+            incoming_data=data,
+            last_values=last_values
         )
 
-        # 2. Write valid points to InfluxDB
+        # 2. Write valid points to InfluxDB, then refresh last value index
         if points_to_write:
             write_points_to_influxdb(points_to_write)
+            update_last_value_index(rc, client_id, last_values)
+            # Readings evaluated by measurement rules were applied already, this adds the rest
+            update_group_state(rc, last_values)
         else:
             logging.info("No valid points generated from processing.")
         # 3. Refresh postgres entries
@@ -51,6 +60,7 @@ def run_processing_pipeline(db: Session, rc: Optional[redis.Redis], session_id:
         sensor_readings, hub_times = fetch_latest_from_influx()
         if sensor_readings or hub_times:
             logging.info("Found sensors readings")
+            # /sapi/beehives snapshot is not dropped, its TTL bounds staleness of readings
             update_denormalized_data_in_postgres(sensor_readings, hub_times, db)
         logging.info(f"Update finished...")
     except Exception as e:
@@ -279,11 +279,16 @@ def process_data_for_influx(
     rc: Optional[redis.Redis],
     client_id: str,  # Hub ID
     incoming_data: list[Dict[str, Any]],
+    last_values: Optional[List[Dict[str, Any]]] = None,
 ) -> list[Point]:
     """
     Processes sensor data: handles new sensors/types, converts/validates units
     (with alias handling), CALLS RULE ENGINE based on sensor group,
     prepares InfluxDB Points.
+
+    If last_values list is passed, every accepted reading is appended to it
+    (sensor_id, group_id, measurement_type, value, unit, timestamp_dt) so the caller can
+    update the last value index and group measurement state once the points are written.
     """
     # --- 1. Get Hub/Server Configs & Sensor->Group Map ---
     logging.debug(f"Starting processing for hub {client_id}")
@@ -628,6 +633,15 @@ def process_data_for_influx(
 
             influx_points.append(point)
             valid_points_count += 1
+            if last_values is not None:
+                last_values.append({
+                    "sensor_id": sensor_id,
+                    "group_id": group_id,
+                    "measurement_type": measurement_type,
+                    "value": value_for_influx,
+                    "unit": final_unit_for_influx,
+                    "timestamp_dt": timestamp_dt,
+                })
 
         except Exception as e:
             logging.error(
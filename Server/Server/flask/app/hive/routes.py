@@ -57,7 +57,7 @@ def authenticate(username: str, password: str):
     try:
         logging.info("Session authentication in process")
         db = DbRequestSession() 
-        result = session_entry_valid(db, username, password)
+        result = session_entry_valid(db, username, password, current_app.redis_client)
         logging.debug(f"Authentication_status: {result}")
         return result
     except:
@@ -173,7 +173,7 @@ def handle_session_request():
     
     db = DbRequestSession() 
     try:
-        newsession = new_session_request(db, json_data)
+        newsession = new_session_request(db, json_data, current_app.redis_client)
     except Exception as err:
         logging.error(f"New session error: {err}")
         return "SERVER_ERROR", 500
@@ -6,7 +6,6 @@
 ####################################
 
 import logging
-import re
 from datetime import datetime, timezone
 from decimal import Decimal
 from collections import defaultdict # Import defaultdict
@@ -21,6 +20,8 @@ from app.db_man.pqsql.models import Group, Sensor, GroupEvent
 
 # Import the request-scoped session factory
 from app import DbRequestSession
+from app.db_man.pqsql.replica import read_replica
+from app.cache.database_caching import get_beehives_snapshot, set_beehives_snapshot
 
 # --- InfluxDB Client ---
 try:
@@ -34,6 +35,7 @@ try:
     INFLUX_CONFIGURED = all([INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET])
     if not INFLUX_CONFIGURED:
         logging.warning("InfluxDB environment variables not fully configured. Sensor history route will be unavailable.")
+    from app.db_man.influxdb.query_builder import run_query, range_start, validate_identifier, is_relative_range
 except ImportError:
     logging.warning("influxdb-client library not installed. Sensor history route will be unavailable.")
     InfluxDBClient = None # type: ignore
@@ -60,7 +62,7 @@ def _format_api_beehive(group: Group, latest_event_ts: datetime | None, subgroup
         "type": "beehive", # Explicitly set
         "location": getattr(group, 'location', ''),
         "health": getattr(group, 'health', 0),
-        "sensors": [{"id": sensor.id, "value": sensor.last_reading_value, "measurement": sensor.measurement, "last_update": sensor.last_reading_time.strftime("%H:%M:%S")} for sensor in getattr(group, 'sensors', []) if hasattr(sensor, 'id')],
+        "sensors": [{"id": sensor.id, "value": sensor.last_reading_value, "measurement": sensor.measurement, "last_update": sensor.last_reading_time.strftime("%H:%M:%S") if sensor.last_reading_time else None} for sensor in getattr(group, 'sensors', []) if hasattr(sensor, 'id')],
         "subgroups": subgroup_ids, # Use IDs fetched separately
         "tags": [{"tag_id": tag.id, "tag_name": tag.name, "tag_type": tag.type} for tag in getattr(group, 'tags', [])],
         "timestamp": latest_event_ts.isoformat() if latest_event_ts else datetime.now(timezone.utc).isoformat()
@@ -82,13 +84,20 @@ def _format_api_hive(group: Group) -> dict:
 # --- API Routes ---
 
 @bp.route('/beehives', methods=['GET'])
+@read_replica
 def get_public_beehives():
     """
     Provides a list of beehive groups and hive (subgroup) groups
     for the public schematic view.
     Workaround: Fetches subgroup IDs separately due to lazy='dynamic'.
+    Formatted response is kept as snapshot in redis, see invalidate_beehives_snapshot.
     """
     logging.info(f"GET Request received for {bp.name}.get_public_beehives")
+    rc = current_app.redis_client
+    snapshot = get_beehives_snapshot(rc)
+    if snapshot is not None:
+        return jsonify(snapshot), 200
+
     db: Session = DbRequestSession()
     beehives_list_formatted = []
     hives_list_formatted = []
@@ -126,17 +135,21 @@ def get_public_beehives():
                 if parent_id: # Ensure parent_id is not None
                     subgroup_map[parent_id].append(child_id)
 
-        # 4. Format beehives, PASSING THE SUBGROUP MAP
+        # 4. Latest event of every beehive in one query (DISTINCT ON group_id)
+        latest_events = {}
+        if beehives:
+            latest_rows = db.query(GroupEvent.group_id, GroupEvent.event_date) \
+                            .filter(GroupEvent.group_id.in_([group.id for group in beehives])) \
+                            .distinct(GroupEvent.group_id) \
+                            .order_by(GroupEvent.group_id, desc(GroupEvent.event_date)) \
+                            .all()
+            latest_events = {row.group_id: row.event_date for row in latest_rows}
+
+        # 5. Format beehives, PASSING THE SUBGROUP MAP
         for group in beehives:
-             # Simplified latest event fetching for now
-             latest_event = db.query(GroupEvent.event_date) \
-                              .filter(GroupEvent.group_id == group.id) \
-                              .order_by(desc(GroupEvent.event_date)) \
-                              .first()
-             latest_event_ts = latest_event[0] if latest_event else None
-             beehives_list_formatted.append(_format_api_beehive(group, latest_event_ts, subgroup_map))
-
-        # 5. Format hives (they don't need the map for *their* children in this view)
+             beehives_list_formatted.append(_format_api_beehive(group, latest_events.get(group.id), subgroup_map))
+
+        # 6. Format hives (they don't need the map for *their* children in this view)
         for group in hives:
             hives_list_formatted.append(_format_api_hive(group))
 
@@ -145,10 +158,12 @@ def get_public_beehives():
         logging.debug(({
             "beehives": beehives_list_formatted,
             "hives": hives_list_formatted}))
-        return jsonify({
+        response = {
             "beehives": beehives_list_formatted,
             "hives": hives_list_formatted
-        }), 200
+        }
+        set_beehives_snapshot(rc, response)
+        return jsonify(response), 200
 
     except SQLAlchemyError as e:
         logging.error(f"Database error listing public beehives/hives: {e}", exc_info=True)
@@ -171,11 +186,15 @@ def get_public_sensor_history():
 
     if not sensor_id:
         abort(400, description="Missing required query parameter: 'sensorId'.")
+    try:
+        sensor_id = validate_identifier(sensor_id, "sensorId")
+    except ValueError:
+        abort(400, description="Invalid query parameter: 'sensorId'.")
 
     influx_time_range: str | None = None
     allowed_ranges = {"hour": "-1h", "day": "-24h", "week": "-7d", "month": "-30d"}
     if time_range_input in allowed_ranges: influx_time_range = allowed_ranges[time_range_input]
-    elif re.match(r'^-\d+[mhdw]$', time_range_input): influx_time_range = time_range_input
+    elif is_relative_range(time_range_input): influx_time_range = time_range_input
     else: abort(400, description=f"Invalid timeRange format: '{time_range_input}'. Use 'hour', 'day', 'week', 'month' or Influx format (e.g., -1h, -7d).")
 
     logging.info(f"Public API query: sensor '{sensor_id}' history for input range '{time_range_input}', using Influx range '{influx_time_range}'")
@@ -183,23 +202,16 @@ def get_public_sensor_history():
     history_data = []
     
     try:
-        with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, timeout=20_000) as client:
-            query_api = client.query_api()
-            flux_query = f'''
-                from(bucket: "{INFLUX_BUCKET}")
-                |> range(start: {influx_time_range})
-                |> filter(fn: (r) => r._measurement == "sensor_measurement" and r.sensor_id == "{sensor_id}" and r._field == "value")
-                |> keep(columns: ["_time", "_value", "measurement_type"])
-                |> sort(columns: ["_time"], desc: false)
-                |> limit(n: 500)
-            '''
-            logging.debug(f"Executing public InfluxDB query:\n{flux_query}")
-            tables = query_api.query(query=flux_query, org=INFLUX_ORG)
-            for table in tables:
-                for record in table.records:
-                    timestamp = record.get_time(); value = record.get_value(); type = record.values.get('measurement_type')
-                    if timestamp is not None and isinstance(value, (int, float, Decimal)):
-                         history_data.append({"timestamp": timestamp.isoformat(), f'{str(type)}' : float(value)})
+        tables = run_query("sensor_history_limited", {
+            "sensor_id": sensor_id,
+            "start": range_start(influx_time_range),
+            "limit": 500,
+        })
+        for table in tables:
+            for record in table.records:
+                timestamp = record.get_time(); value = record.get_value(); type = record.values.get('measurement_type')
+                if timestamp is not None and isinstance(value, (int, float, Decimal)):
+                     history_data.append({"timestamp": timestamp.isoformat(), f'{str(type)}' : float(value)})
         logging.debug(history_data)
         logging.info(f"Public API: Returning {len(history_data)} history points for sensor '{sensor_id}'.")
         return jsonify({"history": history_data}), 200
@@ -0,0 +1,391 @@
+####################################
+# Rule backtest service
+# Last version of update: v0.95
+# app/services/backtest_service.py
+####################################
+
+# Replays historical sensor_measurement data of groups through their compiled
+# rules (or through chosen rules / rule set which are not applied yet) and
+# reports how often and when the rules would have fired. Actions are not run.
+# Jobs are created by the web tier (state kept in redis), the replay runs in
+# celery (app.background_worker.tasks.run_rule_backtest) on queue BACKTEST_QUEUE,
+# served by its own prefork worker (CPU bound, would block gevent workers).
+#
+# Replay follows the live engine: every reading of a group is a measurement
+# trigger for rules reacting to its measurement type, initiator on the reading's
+# type compares the group average with the reading, other measurement
+# initiators the group average of latest readings before it, tag initiators current tags of group, schedule
+# initiators the 10 s window. Conditions are evaluated over NumPy arrays of all
+# readings, the trigger state machine (hold, hysteresis, cooldown) is stepped
+# per run of holding readings instead of per reading. Schedule triggers are not
+# replayed.
+
+import json
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+import os
+import redis
+from sqlalchemy.orm import Session, selectinload
+
+from app.db_man.pqsql.models import Sensor, Rule, RuleSet, RuleInitiator
+from app.cache.database_caching import rule_to_dict, get_group_tag_ids_cached
+from app.engines.rules_engine.compiler import (
+    get_compiled_rules, compile_rules, relax_thresholds, CompiledRule, CompiledInitiator,
+    KIND_MEASUREMENT, KIND_TAG, KIND_SCHEDULE,
+)
+from app.engines.rules_engine.evaluator import window_seconds
+from app.services.export_service import export_available, time_partitions, fetch_partitions_in_order
+
+try:
+    import numpy as np  # type: ignore
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+except ImportError:
+    logging.warning("numpy/pyarrow library not installed. Rule backtest will be unavailable.")
+    np = None  # type: ignore
+    pa = None  # type: ignore
+    pc = None  # type: ignore
+
+
+BACKTEST_QUEUE = os.getenv("BACKTEST_QUEUE", "backtest")
+BACKTEST_CHUNK_HOURS = int(os.getenv("BACKTEST_CHUNK_HOURS", "24"))
+BACKTEST_JOB_TTL_SECONDS = int(os.getenv("BACKTEST_JOB_TTL_SECONDS", "86400"))
+BACKTEST_MAX_RANGE_DAYS = int(os.getenv("BACKTEST_MAX_RANGE_DAYS", "365"))
+# Trigger timestamps kept per rule and group in the result (counts are exact)
+BACKTEST_MAX_TIMESTAMPS = int(os.getenv("BACKTEST_MAX_TIMESTAMPS", "500"))
+# Share of progress taken by reading data, the rest is evaluation
+_FETCH_PROGRESS = 80
+
+JOB_KEY = "backtest:job:{}"
+
+
+def backtest_available() -> bool:
+    """Checks if backtest can run (numpy and pyarrow installed)."""
+    return np is not None and export_available()
+
+
+# --- Job state (redis hash) ---
+
+def _decode(raw: Dict[Any, Any]) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+
+
+def create_backtest_job(rc: redis.Redis, group_ids: List[str], start: datetime, stop: datetime,
+                        rule_ids: Optional[List[str]] = None, rule_set_id: Optional[str] = None) -> str:
+    """Registers new backtest job in redis and returns its id."""
+    job_id = uuid.uuid4().hex
+    key = JOB_KEY.format(job_id)
+    rc.hset(key, mapping={
+        "id": job_id,
+        "status": "queued",
+        "group_ids": json.dumps(group_ids),
+        "rule_ids": json.dumps(rule_ids or []),
+        "rule_set_id": rule_set_id or "",
+        "start": start.isoformat(),
+        "stop": stop.isoformat(),
+        "progress": "0",
+        "readings": "0",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    rc.expire(key, BACKTEST_JOB_TTL_SECONDS)
+    return job_id
+
+
+def get_backtest_job(rc: redis.Redis, job_id: str) -> Optional[Dict[str, Any]]:
+    """Returns job state (result decoded) or None if job doesn't exist (or expired)."""
+    raw = rc.hgetall(JOB_KEY.format(job_id))
+    if not raw:
+        return None
+    job: Dict[str, Any] = _decode(raw)
+    for field in ("group_ids", "rule_ids", "result"):
+        if job.get(field):
+            job[field] = json.loads(job[field])
+    return job
+
+
+def _update_job(rc: redis.Redis, job_id: str, **fields):
+    try:
+        rc.hset(JOB_KEY.format(job_id), mapping={k: str(v) for k, v in fields.items()})
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error updating backtest job {job_id}: {e}")
+
+
+# --- Vectorised rule evaluation ---
+
+_VECTOR_COMPARISONS: Dict[str, str] = {
+    '>': 'greater', 'gt': 'greater',
+    '>=': 'greater_equal', 'gte': 'greater_equal',
+    '<': 'less', 'lt': 'less',
+    '<=': 'less_equal', 'lte': 'less_equal',
+    '=': 'equal', '==': 'equal', 'eq': 'equal',
+    '!=': 'not_equal', 'ne': 'not_equal',
+}
+
+
+def vector_condition(operator: Optional[str], threshold1_str: Optional[str],
+                     threshold2_str: Optional[str] = None) -> Callable[[Any], Any]:
+    """Array version of compiler.compile_condition, missing values (NaN) never meet it."""
+    never = lambda values: np.zeros(len(values), dtype=bool)
+    if operator is None or threshold1_str is None:
+        return never
+    op_name = operator.lower().strip()
+    try:
+        threshold1 = float(threshold1_str)
+        threshold2 = float(threshold2_str) if threshold2_str is not None else None
+    except (TypeError, ValueError):
+        return never
+    if op_name in _VECTOR_COMPARISONS:
+        compare = getattr(np, _VECTOR_COMPARISONS[op_name])
+        return lambda values: compare(values, threshold1) & ~np.isnan(values)
+    if op_name in ('between', 'outside', 'not between') and threshold2 is not None:
+        low, high = min(threshold1, threshold2), max(threshold1, threshold2)
+        if op_name == 'between':
+            return lambda values: (values >= low) & (values <= high)
+        return lambda values: (values < low) | (values > high)
+    return never
+
+
+def _schedule_mask(initiator: Dict[str, Any], times_ns) -> Any:
+    """Array version of evaluator.evaluate_schedule over reading times (UTC ns)."""
+    schedule_type = initiator.get('schedule_type')
+    schedule_value = initiator.get('schedule_value') or ""
+    try:
+        date_part, time_str = schedule_value.split(',', 1) if ',' in schedule_value else (None, schedule_value)
+        hour, minute = map(int, time_str.split(':'))
+        day_seconds = (times_ns % (86400 * 10**9)) / 1e9
+        mask = (day_seconds >= hour * 3600 + minute * 60) & (day_seconds <= hour * 3600 + minute * 60 + window_seconds)
+        days = (times_ns // (86400 * 10**9)).astype('datetime64[D]')
+        if schedule_type == 'daily':
+            return mask
+        if schedule_type == 'weekly':
+            # 1970-01-01 was Thursday (weekday 3)
+            return mask & ((days.astype(np.int64) + 3) % 7 == int(date_part))
+        months = days.astype('datetime64[M]')
+        day_of_month = (days - months).astype(np.int64) + 1
+        if schedule_type == 'monthly':
+            return mask & (day_of_month == int(date_part))
+        if schedule_type == 'yearly':
+            day_str, month_str = date_part.split('/')
+            return mask & (day_of_month == int(day_str)) & (months.astype(np.int64) % 12 + 1 == int(month_str))
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return np.zeros(len(times_ns), dtype=bool)
+
+
+def _group_average_before(series: Tuple[Any, Any], times_ns, including: bool = False) -> Any:
+    """
+    Average of readings at the latest timestamp before each time (group state the live
+    engine sees before the reading is stored), NaN before the first reading. With
+    including, readings at the time itself count (state with the reading applied).
+    """
+    series_times, series_values = series
+    stamps, first = np.unique(series_times, return_index=True)
+    counts = np.diff(np.append(first, len(series_times)))
+    means = np.add.reduceat(series_values, first) / counts
+    position = np.searchsorted(stamps, times_ns, side='right' if including else 'left') - 1
+    return np.where(position >= 0, means[np.clip(position, 0, None)], np.nan)
+
+
+def simulate_trigger_state(times_ns, met, holds, hold_seconds: int = 0, cooldown_seconds: int = 0) -> Any:
+    """
+    Indices of readings at which trigger_state.py would fire. A rule fires at most once per run
+    of holding readings: after the first met reading (once armed) plus hold; it is armed again
+    cooldown after the reading which ends the run.
+    """
+    holds = holds | met
+    met_idx = np.flatnonzero(met)
+    clears = np.flatnonzero(~holds)
+    hold_ns = max(hold_seconds, 0) * 10**9
+    cooldown_ns = max(cooldown_seconds, 0) * 10**9
+    count = len(times_ns)
+    fires = []
+    search_from = 0
+    while True:
+        pos = np.searchsorted(met_idx, search_from)
+        if pos >= len(met_idx):
+            break
+        since = met_idx[pos]
+        clear_pos = np.searchsorted(clears, since)
+        run_end = clears[clear_pos] if clear_pos < len(clears) else count
+        fire = max(since, np.searchsorted(times_ns, times_ns[since] + hold_ns, side='left'))
+        if fire >= run_end:
+            # Condition didn't hold long enough, still armed
+            search_from = run_end
+            continue
+        fires.append(fire)
+        if run_end >= count:
+            break
+        search_from = max(run_end + 1, np.searchsorted(times_ns, times_ns[run_end] + cooldown_ns, side='left'))
+    return np.asarray(fires, dtype=np.int64)
+
+
+def _initiator_arrays(initiator: CompiledInitiator, series: Dict[str, Tuple[Any, Any]], group_tags,
+                      times_ns, values, types) -> Tuple[Any, Any]:
+    """met and holds arrays of one initiator over trigger readings of rule."""
+    if initiator.kind == KIND_TAG:
+        met = np.full(len(times_ns), initiator.tags <= group_tags)
+        return met, met
+    if initiator.kind == KIND_SCHEDULE:
+        met = _schedule_mask(initiator.raw, times_ns)
+        return met, met
+    own = types == initiator.match_key
+    if initiator.kind == KIND_MEASUREMENT and initiator.match_key in series:
+        initiator_values = np.where(own, _group_average_before(series[initiator.match_key], times_ns, including=True),
+                                    _group_average_before(series[initiator.match_key], times_ns))
+    else:
+        initiator_values = np.where(own, values, np.nan)
+    raw = initiator.raw
+    met = vector_condition(raw.get('operator'), raw.get('value'), raw.get('value2'))(initiator_values)
+    holds = vector_condition(raw.get('operator'), *relax_thresholds(
+        raw.get('operator'), raw.get('value'), raw.get('value2'), raw.get('hysteresis')))(initiator_values)
+    return met, holds
+
+
+def backtest_rule(rule: CompiledRule, series: Dict[str, Tuple[Any, Any]], group_tags) -> Tuple[int, Any]:
+    """
+    Replays readings of group (measurement type -> (times ns, values), time ordered) through rule.
+
+    Returns:
+        (number of evaluations, times in ns when the rule fired)
+    """
+    keys = [key for key in {initiator.match_key for initiator in rule.initiators} if key in series]
+    if not keys:
+        return 0, np.empty(0, dtype=np.int64)
+    times_ns = np.concatenate([series[key][0] for key in keys])
+    values = np.concatenate([series[key][1] for key in keys])
+    types = np.concatenate([np.full(len(series[key][0]), key, dtype=object) for key in keys])
+    order = np.argsort(times_ns, kind='stable')
+    times_ns, values, types = times_ns[order], values[order], types[order]
+
+    arrays = [_initiator_arrays(initiator, series, group_tags, times_ns, values, types) for initiator in rule.initiators]
+    reduce = np.logical_or.reduce if rule.combine is any else np.logical_and.reduce
+    met = reduce([met for met, _ in arrays])
+    holds = reduce([holds for _, holds in arrays])
+    fires = simulate_trigger_state(times_ns, met, holds, rule.hold_seconds, rule.cooldown_seconds)
+    return len(times_ns), times_ns[fires]
+
+
+# --- Data reading ---
+
+def _load_rules(db: Session, rule_ids: List[str], rule_set_id: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """RuleDicts of chosen rules / rule set (active or not), None = rules applied to each group."""
+    if not rule_ids and not rule_set_id:
+        return None
+    query = db.query(Rule).options(
+        selectinload(Rule.initiators).selectinload(RuleInitiator.tags),
+        selectinload(Rule.actions),
+    )
+    rules = {rule.id: rule for rule in query.filter(Rule.id.in_(rule_ids)).all()} if rule_ids else {}
+    if rule_set_id:
+        rules.update((rule.id, rule) for rule in query.join(Rule.rule_sets).filter(RuleSet.id == rule_set_id).all())
+    return sorted((rule_to_dict(rule) for rule in rules.values()), key=lambda rule: rule['priority'] or 0)
+
+
+def _read_group_series(db: Session, rc: redis.Redis, job_id: str, group_ids: List[str],
+                       start: datetime, stop: datetime) -> Tuple[Dict[str, Dict[str, Tuple[Any, Any]]], int]:
+    """Reads readings of sensors of groups, returns group -> measurement type -> (times ns, values) and count."""
+    sensors = db.query(Sensor.id, Sensor.group_id).filter(Sensor.group_id.in_(group_ids)).all()
+    chunks: Dict[str, Dict[str, List[Tuple[Any, Any]]]] = {group_id: {} for group_id in group_ids}
+    if not sensors:
+        return {group_id: {} for group_id in group_ids}, 0
+    sensor_ids = [sensor_id for sensor_id, _ in sensors]
+    group_order = list(group_ids)
+    group_pos = {group_id: pos for pos, group_id in enumerate(group_order)}
+    sensor_group = np.array([group_pos[group_id] for _, group_id in sensors], dtype=np.int64)
+    sensor_values = pa.array(sensor_ids)
+
+    partitions = time_partitions(start, stop, timedelta(hours=BACKTEST_CHUNK_HOURS))
+    readings = 0
+    for done, table in enumerate(fetch_partitions_in_order(partitions, sensor_ids), start=1):
+        if table.num_rows:
+            sensor_pos = pc.fill_null(pc.index_in(table.column("sensor_id"), value_set=sensor_values), -1).to_numpy()
+            types = table.column("measurement_type").combine_chunks().dictionary_encode()
+            type_idx = pc.fill_null(types.indices, -1).to_numpy(zero_copy_only=False)
+            type_names = types.dictionary.to_pylist()
+            known = (sensor_pos >= 0) & (type_idx >= 0)
+            times_ns = table.column("time").cast(pa.int64()).to_numpy()[known]
+            values = table.column("value").to_numpy()[known]
+            key = sensor_group[sensor_pos[known]] * len(type_names) + type_idx[known]
+            # Stable sort keeps time order inside every (group, type)
+            order = np.argsort(key, kind='stable')
+            key, times_ns, values = key[order], times_ns[order], values[order]
+            unique_keys, first = np.unique(key, return_index=True)
+            for unique_key, part_times, part_values in zip(unique_keys, np.split(times_ns, first[1:]), np.split(values, first[1:])):
+                group_id = group_order[unique_key // len(type_names)]
+                chunks[group_id].setdefault(type_names[unique_key % len(type_names)], []).append((part_times, part_values))
+            readings += len(key)
+        _update_job(rc, job_id, progress=int(done * _FETCH_PROGRESS / len(partitions)), readings=readings)
+
+    series = {
+        group_id: {
+            measurement: (np.concatenate([c[0] for c in parts]), np.concatenate([c[1] for c in parts]))
+            for measurement, parts in by_type.items()
+        }
+        for group_id, by_type in chunks.items()
+    }
+    return series, readings
+
+
+def _iso(time_ns: int) -> str:
+    return datetime.fromtimestamp(time_ns / 1e9, tz=timezone.utc).isoformat()
+
+
+def run_backtest(db: Session, rc: redis.Redis, job_id: str) -> Dict[str, Any]:
+    """
+    Runs backtest job and stores its result in job state.
+
+    Returns:
+        dict: final job state
+    """
+    job = get_backtest_job(rc, job_id)
+    if not job:
+        raise ValueError(f"Backtest job {job_id} not found")
+    if not backtest_available():
+        _update_job(rc, job_id, status="failed", error="numpy/pyarrow is not installed")
+        return get_backtest_job(rc, job_id) or {}
+
+    group_ids = job["group_ids"]
+    start = datetime.fromisoformat(job["start"])
+    stop = datetime.fromisoformat(job["stop"])
+    _update_job(rc, job_id, status="running")
+    started = time.perf_counter()
+    try:
+        chosen_rules = _load_rules(db, job.get("rule_ids") or [], job.get("rule_set_id") or None)
+        series, readings = _read_group_series(db, rc, job_id, group_ids, start, stop)
+
+        result: Dict[str, Any] = {"groups": {}, "totals": {"evaluations": 0, "triggers": 0}}
+        for done, group_id in enumerate(group_ids, start=1):
+            rule_set = compile_rules(group_id, chosen_rules) if chosen_rules is not None else get_compiled_rules(db, rc, group_id)
+            group_tags = get_group_tag_ids_cached(db, rc, group_id)
+            group_result = {"readings": int(sum(len(times) for times, _ in series[group_id].values())), "rules": []}
+            for rule in rule_set.rules:
+                evaluations, fire_times = backtest_rule(rule, series[group_id], group_tags)
+                group_result["rules"].append({
+                    "ruleId": rule.id,
+                    "name": rule.rule.get('name'),
+                    "evaluations": evaluations,
+                    "triggers": len(fire_times),
+                    "timestamps": [_iso(t) for t in fire_times[:BACKTEST_MAX_TIMESTAMPS]],
+                    "truncated": len(fire_times) > BACKTEST_MAX_TIMESTAMPS,
+                })
+                result["totals"]["evaluations"] += evaluations
+                result["totals"]["triggers"] += len(fire_times)
+            result["groups"][group_id] = group_result
+            _update_job(rc, job_id, progress=_FETCH_PROGRESS + int(done * (100 - _FETCH_PROGRESS) / len(group_ids)))
+    except Exception as e:
+        logging.error(f"Backtest {job_id} failed: {e}", exc_info=True)
+        _update_job(rc, job_id, status="failed", error=str(e))
+        return get_backtest_job(rc, job_id) or {}
+
+    _update_job(rc, job_id, status="finished", progress=100, readings=readings, result=json.dumps(result),
+                finished_at=datetime.now(timezone.utc).isoformat())
+    logging.info(f"Backtest {job_id} finished: {readings} readings, {result['totals']['triggers']} triggers "
+                 f"in {time.perf_counter() - started:.1f} s")
+    return get_backtest_job(rc, job_id) or {}
@@ -0,0 +1,263 @@
+####################################
+# Export service
+# Last version of update: v0.95
+# app/services/export_service.py
+####################################
+
+# Bulk export of sensor_measurement data into Parquet / Arrow IPC files.
+# Jobs are created by the web tier (status kept in redis), the export itself
+# runs in celery (app.background_worker.tasks.run_data_export).
+
+import os
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+import redis
+from sqlalchemy.orm import Session
+
+from app.db_man.pqsql.models import Group, Sensor
+from app.db_man.influxdb.query_builder import stream_query
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+    import pyarrow.ipc as pa_ipc  # type: ignore
+except ImportError:
+    logging.warning("pyarrow library not installed. Data export will be unavailable.")
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+    pa_ipc = None  # type: ignore
+
+
+EXPORT_STORAGE_DIR = os.getenv("EXPORT_STORAGE_DIR", "/app/app/export_storage")
+EXPORT_CHUNK_HOURS = int(os.getenv("EXPORT_CHUNK_HOURS", "24"))
+EXPORT_PARALLEL_QUERIES = int(os.getenv("EXPORT_PARALLEL_QUERIES", "4"))
+EXPORT_JOB_TTL_SECONDS = int(os.getenv("EXPORT_JOB_TTL_SECONDS", "86400"))
+EXPORT_MAX_RANGE_DAYS = int(os.getenv("EXPORT_MAX_RANGE_DAYS", "730"))
+# Streamed rows are converted into arrow record batches of this size
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+JOB_KEY = "export:job:{}"
+
+if pa is not None:
+    EXPORT_SCHEMA = pa.schema([
+        ("time", pa.timestamp("ns", tz="UTC")),
+        ("client_id", pa.string()),
+        ("sensor_id", pa.string()),
+        ("measurement_type", pa.string()),
+        ("unit", pa.string()),
+        ("value", pa.float64()),
+    ])
+else:
+    EXPORT_SCHEMA = None
+
+
+def export_available() -> bool:
+    """Checks if export can run (pyarrow installed)."""
+    return pa is not None
+
+
+# --- Job state (redis hash) ---
+
+def _decode(raw: Dict[Any, Any]) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+
+
+def create_export_job(rc: redis.Redis, start: datetime, stop: datetime,
+                      export_format: str, group_id: Optional[str] = None) -> str:
+    """Registers new export job in redis and returns its id."""
+    job_id = uuid.uuid4().hex
+    key = JOB_KEY.format(job_id)
+    rc.hset(key, mapping={
+        "id": job_id,
+        "status": "queued",
+        "format": export_format,
+        "group_id": group_id or "",
+        "start": start.isoformat(),
+        "stop": stop.isoformat(),
+        "progress": "0",
+        "rows": "0",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    rc.expire(key, EXPORT_JOB_TTL_SECONDS)
+    return job_id
+
+
+def get_export_job(rc: redis.Redis, job_id: str) -> Optional[Dict[str, str]]:
+    """Returns job state or None if job doesn't exist (or expired)."""
+    raw = rc.hgetall(JOB_KEY.format(job_id))
+    return _decode(raw) if raw else None
+
+
+def _update_job(rc: redis.Redis, job_id: str, **fields):
+    try:
+        rc.hset(JOB_KEY.format(job_id), mapping={k: str(v) for k, v in fields.items()})
+    except redis.exceptions.RedisError as e:
+        logging.error(f"Redis error updating export job {job_id}: {e}")
+
+
+def export_file_path(job_id: str, export_format: str) -> str:
+    return os.path.join(EXPORT_STORAGE_DIR, f"export_{job_id}{EXPORT_FORMATS[export_format]}")
+
+
+def cleanup_expired_exports():
+    """Deletes export files older than job TTL."""
+    if not os.path.isdir(EXPORT_STORAGE_DIR):
+        return
+    threshold = time.time() - EXPORT_JOB_TTL_SECONDS
+    for name in os.listdir(EXPORT_STORAGE_DIR):
+        path = os.path.join(EXPORT_STORAGE_DIR, name)
+        try:
+            if name.startswith("export_") and os.path.getmtime(path) < threshold:
+                os.remove(path)
+                logging.info(f"Removed expired export file {name}")
+        except OSError as e:
+            logging.warning(f"Could not remove expired export file {name}: {e}")
+
+
+# --- Data reading ---
+
+def get_group_sensor_ids(db: Session, group_id: str) -> List[str]:
+    """Returns ids of sensors of group and all its subgroups."""
+    group_ids = [group_id]
+    frontier = [group_id]
+    while frontier:
+        children = [row.id for row in db.query(Group.id).filter(Group.parent_id.in_(frontier)).all()]
+        frontier = [child for child in children if child not in group_ids]
+        group_ids.extend(frontier)
+    return [row.id for row in db.query(Sensor.id).filter(Sensor.group_id.in_(group_ids)).all()]
+
+
+def time_partitions(start: datetime, stop: datetime, chunk: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Splits [start, stop) into consecutive partitions of chunk length."""
+    partitions = []
+    current = start
+    while current < stop:
+        partition_stop = min(current + chunk, stop)
+        partitions.append((current, partition_stop))
+        current = partition_stop
+    return partitions
+
+
+def _record_batch(columns: Dict[str, list]):
+    return pa.RecordBatch.from_pydict(columns, schema=EXPORT_SCHEMA)
+
+
+def _fetch_partition(partition: Tuple[datetime, datetime], sensor_ids: Optional[List[str]]):
+    """
+    Reads one time partition from influx into arrow table. Records are streamed
+    and converted into record batches of EXPORT_BATCH_ROWS as they arrive.
+    """
+    start, stop = partition
+    params: Dict[str, Any] = {"start": start, "stop": stop}
+    if sensor_ids is None:
+        records = stream_query("export_chunk", params)
+    else:
+        params["sensor_ids"] = sensor_ids
+        records = stream_query("export_chunk_sensors", params)
+
+    batches = []
+    columns: Dict[str, list] = {name: [] for name in EXPORT_SCHEMA.names}
+    for record in records:
+        value = record.get_value()
+        if value is None:
+            continue
+        columns["time"].append(record.get_time())
+        columns["client_id"].append(record.values.get("client_id"))
+        columns["sensor_id"].append(record.values.get("sensor_id"))
+        columns["measurement_type"].append(record.values.get("measurement_type"))
+        columns["unit"].append(record.values.get("standard_unit"))
+        columns["value"].append(float(value))
+        if len(columns["value"]) >= EXPORT_BATCH_ROWS:
+            batches.append(_record_batch(columns))
+            columns = {name: [] for name in EXPORT_SCHEMA.names}
+    if columns["value"]:
+        batches.append(_record_batch(columns))
+    arrow_table = pa.Table.from_batches(batches, schema=EXPORT_SCHEMA)
+    if arrow_table.num_rows:
+        arrow_table = arrow_table.sort_by([("time", "ascending")])
+    return arrow_table
+
+
+def fetch_partitions_in_order(partitions: List[Tuple[datetime, datetime]], sensor_ids: Optional[List[str]]) -> Iterator[Any]:
+    """
+    Fetches partitions (arrow tables of EXPORT_SCHEMA, sensor_ids None = all sensors) in
+    parallel but yields them in time order, at most EXPORT_PARALLEL_QUERIES partitions are held in memory.
+    """
+    workers = max(1, EXPORT_PARALLEL_QUERIES)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for partition in partitions:
+            pending.append(executor.submit(_fetch_partition, partition, sensor_ids))
+            if len(pending) >= workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def run_export(db: Session, rc: redis.Redis, job_id: str) -> Dict[str, str]:
+    """
+    Runs export job, writes file into EXPORT_STORAGE_DIR and updates job state.
+
+    Returns:
+        dict: final job state
+    """
+    job = get_export_job(rc, job_id)
+    if not job:
+        raise ValueError(f"Export job {job_id} not found")
+    if pa is None:
+        _update_job(rc, job_id, status="failed", error="pyarrow is not installed")
+        return get_export_job(rc, job_id) or {}
+
+    export_format = job["format"]
+    start = datetime.fromisoformat(job["start"])
+    stop = datetime.fromisoformat(job["stop"])
+    sensor_ids = get_group_sensor_ids(db, job["group_id"]) if job.get("group_id") else None
+
+    os.makedirs(EXPORT_STORAGE_DIR, exist_ok=True)
+    cleanup_expired_exports()
+    final_path = export_file_path(job_id, export_format)
+    tmp_path = final_path + ".part"
+
+    partitions = time_partitions(start, stop, timedelta(hours=EXPORT_CHUNK_HOURS))
+    _update_job(rc, job_id, status="running", partitions=len(partitions))
+    logging.info(f"Export {job_id}: {len(partitions)} partitions, format {export_format}, "
+                 f"sensors: {'all' if sensor_ids is None else len(sensor_ids)}")
+
+    rows = 0
+    started = time.perf_counter()
+    try:
+        if export_format == "parquet":
+            writer = pq.ParquetWriter(tmp_path, EXPORT_SCHEMA, compression="zstd")
+        else:
+            writer = pa_ipc.new_file(tmp_path, EXPORT_SCHEMA)
+        try:
+            if sensor_ids is None or sensor_ids:
+                for done, arrow_table in enumerate(fetch_partitions_in_order(partitions, sensor_ids), start=1):
+                    if arrow_table.num_rows:
+                        writer.write_table(arrow_table)
+                        rows += arrow_table.num_rows
+                    _update_job(rc, job_id, progress=int(done * 100 / len(partitions)), rows=rows)
+        finally:
+            writer.close()
+        os.replace(tmp_path, final_path)
+    except Exception as e:
+        logging.error(f"Export {job_id} failed: {e}", exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        _update_job(rc, job_id, status="failed", error=str(e))
+        return get_export_job(rc, job_id) or {}
+
+    _update_job(rc, job_id, status="finished", progress=100, rows=rows,
+                size_bytes=os.path.getsize(final_path),
+                finished_at=datetime.now(timezone.utc).isoformat())
+    logging.info(f"Export {job_id} finished: {rows} rows in {time.perf_counter() - started:.1f} s")
+    return get_export_job(rc, job_id) or {}
@@ -7,7 +7,7 @@
 
 import logging
 import json
-from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm import Session, joinedload, selectinload, load_only
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 import redis # type: ignore
@@ -15,6 +15,7 @@ from typing import Dict, Any, Optional, List
 import humanize # For relative time formatting
 from datetime import datetime, timezone
 from app.dep_lib import convert_units
+from app.helpers.pagination import PageParams, paginate_list, encode_cursor
 
 # Adjust import path based on your project structure
 try:
@@ -56,18 +57,29 @@ def _format_relative_time(dt_object: Optional[datetime]) -> str:
 
 # --- Internal Fetch Functions (Database Interaction) ---
 
-def _fetch_sensors_from_db(db: Session) -> List[Dict[str, Any]]:
+def _fetch_sensors_from_db(db: Session, after_id: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Fetches and formats sensor list directly from PostgreSQL,
     including denormalized last reading data and hub info.
+    With limit only one keyset page (sensors with id > after_id) is fetched.
     """
     logging.debug("Fetching sensors list directly from database.")
     sensors_list = []
     try:
 
-        sensors_orm = db.query(Sensor).options(
-            joinedload(Sensor.client_system)
-        ).order_by(Sensor.id).all()
+        query = db.query(Sensor).options(
+            load_only(Sensor.id, Sensor.measurement, Sensor.last_reading_value,
+                      Sensor.last_reading_unit, Sensor.last_reading_time, Sensor.client_id),
+            joinedload(Sensor.client_system).load_only(AvailableSensorsDatabase.client_id, AvailableSensorsDatabase.client_name)
+        )
+        # Byte order ("C"), same as Python string order used to page the cached list
+        sensor_id = Sensor.id.collate("C")
+        if after_id is not None:
+            query = query.filter(sensor_id > after_id)
+        query = query.order_by(sensor_id)
+        if limit is not None:
+            query = query.limit(limit)
+        sensors_orm = query.all()
 
         for sensor in sensors_orm:
             hub_name = sensor.client_system.client_name if sensor.client_system else "Unknown Hub"
@@ -212,6 +224,47 @@ def get_sensors(db: Session, rc: Optional[redis.Redis], force_refresh: bool = Fa
     return sensors_data
 
 
+def get_sensors_page(db: Session, rc: Optional[redis.Redis], page: PageParams, force_refresh: bool = False) -> tuple:
+    """
+    Gets one keyset page of sensor list (sorted by id).
+    Cached full list is paged in memory, on cache miss only the page is read from DB.
+    With force_refresh the full list is read from DB (and cached again) and paged.
+
+    Returns:
+        tuple: (sensors, next_cursor, total), total only on first page when requested (withTotal)
+    """
+    cached: Optional[List[Dict[str, Any]]] = None
+    if force_refresh:
+        cached = get_sensors(db=db, rc=rc, force_refresh=True)
+    elif rc:
+        try:
+            cached_data_str = rc.get("inventory:sensors:all")
+            if cached_data_str:
+                cached = json.loads(cached_data_str)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis GET error for 'inventory:sensors:all': {e}. Falling back to DB.")
+        except json.JSONDecodeError as e:
+            logging.error(f"Redis cache data corrupted for 'inventory:sensors:all': {e}. Falling back to DB.")
+
+    if isinstance(cached, list):
+        sensors, next_cursor = paginate_list(cached, page, key=lambda sensor: (sensor["id"],))
+        return sensors, next_cursor, len(cached) if page.with_total and page.cursor is None else None
+
+    after_id = page.cursor[0] if page.cursor else None
+    sensors = _fetch_sensors_from_db(db, after_id=after_id, limit=page.limit + 1)
+    next_cursor = None
+    if len(sensors) > page.limit:
+        sensors = sensors[:page.limit]
+        next_cursor = encode_cursor((sensors[-1]["id"],))
+    total = None
+    if page.with_total and page.cursor is None:
+        try:
+            total = db.query(func.count(Sensor.id)).scalar()
+        except SQLAlchemyError as e:
+            logging.error(f"Database error counting sensors: {e}", exc_info=True)
+    return sensors, next_cursor, total
+
+
 def get_hubs(db: Session, rc: Optional[redis.Redis], force_refresh: bool = False) -> List[Dict[str, Any]]:
     """
     Gets the list of all hubs with sensor counts, utilizing Redis cache.
@@ -27,8 +27,9 @@ import app.db_man.pqsql.createupdate as crud_cr
 from app.db_man.pqsql.models import Group, Tag, Sensor # Import models you might interact with
 from app.db_man.pqsql.database import SessionLocal, create_db_and_tables
 from app.dep_lib import available_options
+from app.cache.hub_sessions import cache_session, get_cached_session
 
-def new_session_request(db: Session, data):
+def new_session_request(db: Session, data, rc: Optional[redis.Redis] = None):
     """
     Check if secret_key is valid and generates new session, returns session_key, session_uuid
 
@@ -37,6 +38,7 @@ def new_session_request(db: Session, data):
         (dict): .system_id
                 .key
         - checked via json_schemas
+        rc (redis.Redis): live session is cached when given
 
     Using:
         os, logging, tracemalloc, json, flask
@@ -90,7 +92,7 @@ def new_session_request(db: Session, data):
         return "INVALID_CONFIG", 401
     logging.debug("Step 2 - creating new session")
     try:
-        credentials_status, session_id, session_key = create_new_session(db, hub_id, hub_config)
+        credentials_status, session_id, session_key = create_new_session(db, hub_id, hub_config, rc)
     except Exception as err:
         logging.warning("--- Creating New session failed ----")
         logging.error(f"error: {err}", exc_info=True)
@@ -108,7 +110,7 @@ def new_session_request(db: Session, data):
 
 
 
-def create_new_session(db: Session, hub_id, hub_config):
+def create_new_session(db: Session, hub_id, hub_config, rc: Optional[redis.Redis] = None):
     logging.info("---- Creating new session ----")
     session_uuid = str(uuid.uuid4())
     session_key = secrets.token_hex(64)
@@ -149,6 +151,7 @@ def create_new_session(db: Session, hub_id, hub_config):
         try:        
             crud_cr.create_or_update_session(db, str(session_uuid), str(hub_id), str(session_key_hash), session_end_aware, str(available[:-1]), "behdata")
             crud_cr.create_or_update_config(db, hub_id, config)
+            cache_session(rc, str(session_uuid), str(hub_id), str(session_key_hash), session_end_aware)
 
         except SQLAlchemyError as e:
             db.rollback() # Rollback on any database error during the demo
@@ -169,13 +172,14 @@ def create_new_session(db: Session, hub_id, hub_config):
         return None
     
 
-def session_entry_valid(db: Session, session_id, provided_key):
+def session_entry_valid(db: Session, session_id, provided_key, rc: Optional[redis.Redis] = None):
     """
     Check if session exists and returns boolean
     
     Args:
         session_id (str): searched session_id
         key (str): validated key
+        rc (redis.Redis): live sessions are read from redis first
     
     Using:
         os, logging, bcrypt, time
@@ -188,15 +192,21 @@ def session_entry_valid(db: Session, session_id, provided_key):
     logging.info("--- Checking session status ---")
 
     try:
-        # Assuming this returns a SessionAuth object or None
-        session_object = crud_read.get_valid_session(db, session_id=session_id)
-
-        if session_object:
+        session_object = None
+        cached = get_cached_session(rc, session_id)
+        if cached:
+            hashed_key = cached["session_key_hash"]
+        else:
+            # Assuming this returns a SessionAuth object or None
+            session_object = crud_read.get_valid_session(db, session_id=session_id)
+            hashed_key = session_object.session_key_hash if session_object else None
+            if session_object:
+                cache_session(rc, session_object.session_id, session_object.client_id,
+                              session_object.session_key_hash, session_object.session_end)
+
+        if cached or session_object:
             logging.debug(" Session found ")
 
-    
-            hashed_key = session_object.session_key_hash # Use attribute access
-
             # Add check if hash exists
             if not hashed_key:
                  logging.error(f"Session {session_id} found, but session_key_hash is missing.")
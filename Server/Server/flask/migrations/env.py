@@ -0,0 +1,70 @@
+####################################
+# Alembic environment
+# Last version of update: v0.95
+# migrations/env.py
+####################################
+
+# Tables of clients_system are owned by the postgres superuser (postgres/create_databases.sql),
+# client_modifier can't create indexes, so migrations connect with their own credentials:
+#   MIGRATIONS_DATABASE_URL                       - full url, or
+#   MIGRATIONS_DB_USER / MIGRATIONS_DB_PASS       - user (default postgres) and password on POSTGRES_HOST:POSTGRES_PORT
+
+import os
+import logging
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+from sqlalchemy.engine import URL
+from dotenv import load_dotenv
+
+from app.db_man.pqsql.models import Base
+
+load_dotenv()
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def get_url():
+    url = os.getenv("MIGRATIONS_DATABASE_URL")
+    if url:
+        return url
+    return URL.create(
+        "postgresql+psycopg",
+        username=os.getenv("MIGRATIONS_DB_USER", "postgres"),
+        password=os.getenv("MIGRATIONS_DB_PASS"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=int(os.getenv("POSTGRES_PORT", "5432")),
+        database="clients_system",
+    )
+
+
+def run_migrations_offline():
+    """Prints SQL of migrations instead of running them (alembic upgrade head --sql)."""
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connectable = create_engine(get_url(), poolclass=pool.NullPool)
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+    logging.getLogger("alembic").info("Migrations finished.")
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
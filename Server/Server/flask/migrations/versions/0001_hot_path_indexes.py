@@ -0,0 +1,64 @@
+"""Hot path indexes of sensors, group_events and session_auth
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Indexes are built with CREATE INDEX CONCURRENTLY, so the tables stay writable
+while the migration runs. Databases created by postgres/create_databases.sql
+already have some of them, IF NOT EXISTS skips those.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# name -> (table, columns)
+INDEXES = {
+    # get_sensor_group_map_cached, fetch of existing sensors at ingest
+    "idx_sensors_client_id": ("sensors", "client_id"),
+    # evaluate_measurement: latest reading of measurement in group
+    "idx_sensors_group_measurement_time": ("sensors", "group_id, measurement, last_reading_time"),
+    # events of group ordered by date, latest event of beehive
+    "idx_group_events_group_id_date": ("group_events", "group_id, event_date, event_table_id"),
+    # cleanup and validation of hub sessions
+    "idx_session_auth_session_end": ("session_auth", "session_end"),
+}
+
+
+def _drop_if_invalid(name: str):
+    """Interrupted CONCURRENTLY build leaves INVALID index, IF NOT EXISTS would keep it."""
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).scalar()
+    if invalid:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _is_partitioned(table: str) -> bool:
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+    ), {"table": table}).scalar())
+
+
+def upgrade():
+    # CONCURRENTLY can't run inside transaction
+    with op.get_context().autocommit_block():
+        for name, (table, columns) in INDEXES.items():
+            _drop_if_invalid(name)
+            # Partitioned tables (group_events on fresh installs) don't support CONCURRENTLY
+            concurrently = "" if _is_partitioned(table) else "CONCURRENTLY "
+            op.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade():
+    # client_id and session_end indexes are part of base schema (create_databases.sql)
+    with op.get_context().autocommit_block():
+        for name in ("idx_sensors_group_measurement_time", "idx_group_events_group_id_date"):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,160 @@
+"""Partition group_events by month of event_date
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+group_events is recreated as RANGE partitioned table with monthly partitions
+(group_events_pYYYYMM) and a default partition, existing rows are copied.
+The copy holds lock on group_events, run it in a quiet period.
+Primary key becomes (event_table_id, event_date), partition key has to be part of it.
+Table is handed to partition_maintainer (created when missing, password
+POSTGRES_MAINTENANCE_PASS), the role of the celery maintenance task
+(app/db_man/pqsql/partitions.py) creating and detaching partitions.
+client_modifier keeps reading and writing rows only.
+"""
+import os
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+APP_ROLE = "client_modifier"
+MAINTENANCE_ROLE = "partition_maintainer"
+PREMAKE_MONTHS = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(bind) -> bool:
+    return bool(bind.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('group_events')"
+    )).scalar())
+
+
+def _create_upcoming_partitions(bind):
+    """
+    Current month and PREMAKE_MONTHS ahead (partitioned table of fresh installs has only default),
+    rows of the month already in the default partition are moved into the new one.
+    """
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    for offset in range(PREMAKE_MONTHS + 1):
+        month = _add_months(current, offset)
+        name = f"group_events_p{month.year:04d}{month.month:02d}"
+        if bind.execute(sa.text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            continue
+        bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        where = f"event_date >= '{month.isoformat()}' AND event_date < '{_add_months(month, 1).isoformat()}'"
+        in_default = bind.execute(sa.text(f"SELECT 1 FROM group_events_default WHERE {where} LIMIT 1")).scalar()
+        if in_default:
+            op.execute("ALTER TABLE group_events DETACH PARTITION group_events_default")
+        op.execute(f"CREATE TABLE {name} PARTITION OF group_events {bounds}")
+        if in_default:
+            op.execute(
+                f"WITH moved AS (DELETE FROM group_events_default WHERE {where} RETURNING *) "
+                f"INSERT INTO {name} SELECT event_table_id, group_id, event_ref_id, event_date, event_type, description FROM moved"
+            )
+            op.execute("ALTER TABLE group_events ATTACH PARTITION group_events_default DEFAULT")
+        op.execute(f"ALTER TABLE {name} OWNER TO {MAINTENANCE_ROLE}")
+
+
+def _ensure_maintenance_role(bind):
+    if bind.execute(sa.text("SELECT 1 FROM pg_roles WHERE rolname = :role"), {"role": MAINTENANCE_ROLE}).scalar():
+        return
+    password = os.getenv("POSTGRES_MAINTENANCE_PASS")
+    if not password:
+        raise RuntimeError(f"POSTGRES_MAINTENANCE_PASS is required to create role {MAINTENANCE_ROLE}")
+    quoted = password.replace("'", "''")
+    op.execute(f"CREATE ROLE {MAINTENANCE_ROLE} LOGIN PASSWORD '{quoted}'")
+
+
+def _grant_maintenance(partitions):
+    """Hands group_events to the maintenance role, the app role keeps DML only."""
+    op.execute(f"GRANT USAGE, CREATE ON SCHEMA public TO {MAINTENANCE_ROLE}")
+    op.execute(f"GRANT REFERENCES ON groups TO {MAINTENANCE_ROLE}")
+    # Owner of table owns its sequence too, partitions have to be changed one by one
+    op.execute(f"ALTER TABLE group_events OWNER TO {MAINTENANCE_ROLE}")
+    for name in partitions:
+        op.execute(f"ALTER TABLE {name} OWNER TO {MAINTENANCE_ROLE}")
+    op.execute(f"GRANT SELECT, INSERT, UPDATE, DELETE ON group_events, {', '.join(partitions)} TO {APP_ROLE}")
+    op.execute(f"GRANT USAGE, SELECT ON SEQUENCE group_events_event_table_id_seq TO {APP_ROLE}")
+    op.execute(f"ALTER DEFAULT PRIVILEGES FOR ROLE {MAINTENANCE_ROLE} IN SCHEMA public "
+               f"GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO {APP_ROLE}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    _ensure_maintenance_role(bind)
+    if _is_partitioned(bind):
+        # Fresh installs, create_databases.sql creates partitioned table already
+        _create_upcoming_partitions(bind)
+        return
+
+    op.execute("ALTER TABLE group_events RENAME TO group_events_legacy")
+    op.execute("ALTER TABLE group_events_legacy RENAME CONSTRAINT group_events_pkey TO group_events_legacy_pkey")
+    op.execute("ALTER SEQUENCE group_events_event_table_id_seq OWNED BY NONE")
+    op.execute("DROP INDEX IF EXISTS idx_group_events_group_id")
+    op.execute("DROP INDEX IF EXISTS idx_group_events_group_id_date")
+    op.execute("""
+        CREATE TABLE group_events (
+            event_table_id INTEGER NOT NULL DEFAULT nextval('group_events_event_table_id_seq'),
+            group_id TEXT NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+            event_ref_id TEXT,
+            event_date DATE NOT NULL,
+            event_type TEXT,
+            description TEXT,
+            PRIMARY KEY (event_table_id, event_date)
+        ) PARTITION BY RANGE (event_date)
+    """)
+    op.execute("ALTER SEQUENCE group_events_event_table_id_seq OWNED BY group_events.event_table_id")
+    op.execute("CREATE TABLE group_events_default PARTITION OF group_events DEFAULT")
+    partitions = ["group_events_default"]
+
+    first = bind.execute(sa.text("SELECT min(event_date) FROM group_events_legacy")).scalar()
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = first.replace(day=1) if first and first < current else current
+    last = _add_months(current, PREMAKE_MONTHS)
+    while month <= last:
+        name = f"group_events_p{month.year:04d}{month.month:02d}"
+        op.execute(
+            f"CREATE TABLE {name} PARTITION OF group_events "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        partitions.append(name)
+        month = _add_months(month, 1)
+
+    op.execute("INSERT INTO group_events SELECT event_table_id, group_id, event_ref_id, event_date, event_type, description FROM group_events_legacy")
+    op.execute("DROP TABLE group_events_legacy")
+    op.execute("CREATE INDEX idx_group_events_group_id_date ON group_events (group_id, event_date, event_table_id)")
+
+    _grant_maintenance(partitions)
+
+
+def downgrade():
+    op.execute("ALTER TABLE group_events RENAME TO group_events_partitioned")
+    op.execute("ALTER SEQUENCE group_events_event_table_id_seq OWNED BY NONE")
+    op.execute("DROP INDEX IF EXISTS idx_group_events_group_id_date")
+    op.execute("""
+        CREATE TABLE group_events (
+            event_table_id INTEGER PRIMARY KEY DEFAULT nextval('group_events_event_table_id_seq'),
+            group_id TEXT NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+            event_ref_id TEXT,
+            event_date DATE NOT NULL,
+            event_type TEXT,
+            description TEXT
+        )
+    """)
+    op.execute("ALTER SEQUENCE group_events_event_table_id_seq OWNED BY group_events.event_table_id")
+    op.execute("INSERT INTO group_events SELECT event_table_id, group_id, event_ref_id, event_date, event_type, description FROM group_events_partitioned")
+    op.execute("DROP TABLE group_events_partitioned")
+    op.execute("CREATE INDEX idx_group_events_group_id ON group_events (group_id)")
+    op.execute("CREATE INDEX idx_group_events_group_id_date ON group_events (group_id, event_date, event_table_id)")
@@ -0,0 +1,37 @@
+"""Expiry of jwt_blocklist rows
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+expires_at holds exp of the revoked token, celery task prune_jwt_blocklist
+deletes rows after it. Existing rows get created_at + the longest token
+lifetime (refresh token, 30 days), so revoked refresh tokens stay revoked.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Longest lifetime of issued tokens (flask-jwt-extended refresh token default)
+LEGACY_TOKEN_LIFETIME_DAYS = 30
+
+
+def upgrade():
+    op.execute("ALTER TABLE jwt_blocklist ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ")
+    op.execute(
+        "UPDATE jwt_blocklist "
+        f"SET expires_at = COALESCE(created_at, now()) + interval '{LEGACY_TOKEN_LIFETIME_DAYS} days' "
+        "WHERE expires_at IS NULL"
+    )
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jwt_blocklist_expires_at ON jwt_blocklist (expires_at)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_jwt_blocklist_expires_at")
+    op.execute("ALTER TABLE jwt_blocklist DROP COLUMN IF EXISTS expires_at")
@@ -0,0 +1,31 @@
+"""Trigger state settings of rules
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+Measurement rules are de-duplicated by a state machine per (rule, group)
+in Redis (app/engines/rules_engine/trigger_state.py). hold_seconds and
+cooldown_seconds of rules and hysteresis of initiators configure it,
+existing rows keep the previous edge triggered behaviour (all zero/NULL).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE rules ADD COLUMN IF NOT EXISTS hold_seconds INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE rules ADD COLUMN IF NOT EXISTS cooldown_seconds INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE rule_initiators ADD COLUMN IF NOT EXISTS hysteresis NUMERIC")
+
+
+def downgrade():
+    op.execute("ALTER TABLE rule_initiators DROP COLUMN IF EXISTS hysteresis")
+    op.execute("ALTER TABLE rules DROP COLUMN IF EXISTS cooldown_seconds")
+    op.execute("ALTER TABLE rules DROP COLUMN IF EXISTS hold_seconds")
@@ -25,10 +25,19 @@ if __name__ == "__main__":
 
 
 
+# psycopg picks its wait function at import (init imports it first),
+# under gevent it has to wait through the patched select, see app/db_man/pqsql/database.py
+import os
+try:
+    from gevent import monkey
+    if monkey.is_module_patched("select"):
+        os.environ.setdefault("PSYCOPG_WAIT_FUNC", "wait_select")
+except ImportError:
+    pass
+
 # Start logging, diagnostics and test function of postgres
 print("Starting init")
 import init
-import os
 init.start()
 
 
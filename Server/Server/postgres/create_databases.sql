@@ -24,6 +24,8 @@ CREATE DATABASE testing;
 CREATE USER client_modifier WITH ENCRYPTED PASSWORD '${POSTGRES_USERS_ACCESS_PASS}';
 CREATE USER audio_modifier WITH ENCRYPTED PASSWORD '${POSTGRES_AUDIO_ACCESS_PASS}';
 CREATE USER connection_testing WITH ENCRYPTED PASSWORD '${POSTGRES_TEST_PASS}';
+-- Owner of group_events partitions (celery maintenance task), the app role has no DDL rights
+CREATE USER partition_maintainer WITH ENCRYPTED PASSWORD '${POSTGRES_MAINTENANCE_PASS}';
 
 -- #############################################################################
 -- #                       CLIENTS_SYSTEM Database Objects                     #
@@ -90,14 +92,19 @@ CREATE TABLE schedule_conditions (
     group_id TEXT REFERENCES groups(id) ON DELETE SET NULL
 );
 
+-- Partitioned by month (group_events_pYYYYMM), partitions are created and
+-- archived by celery task maintain_group_event_partitions
 CREATE TABLE group_events (
-    event_table_id SERIAL PRIMARY KEY,
+    event_table_id SERIAL,
     group_id TEXT NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
     event_ref_id TEXT,
     event_date DATE NOT NULL,
     event_type TEXT,
-    description TEXT
-);
+    description TEXT,
+    PRIMARY KEY (event_table_id, event_date)
+) PARTITION BY RANGE (event_date);
+
+CREATE TABLE group_events_default PARTITION OF group_events DEFAULT;
 
 -- ========= AUTHENTICATION, CONFIGURATION & CLIENT/SENSORS SYSTEMS ============
 
@@ -162,7 +169,8 @@ CREATE TABLE server_config (
 CREATE TABLE jwt_blocklist (
     id SERIAL PRIMARY KEY,
     jti TEXT UNIQUE NOT NULL,
-    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMPTZ
 );
 
 -- ========= RULES ENGINE ============
@@ -182,7 +190,9 @@ CREATE TABLE rules (
     is_active BOOLEAN NOT NULL DEFAULT TRUE,
     applies_to TEXT NOT NULL DEFAULT 'all',
     rule_set_id TEXT REFERENCES rule_sets(id) ON DELETE SET NULL,
-    priority INTEGER NOT NULL DEFAULT 5
+    priority INTEGER NOT NULL DEFAULT 5,
+    hold_seconds INTEGER NOT NULL DEFAULT 0,
+    cooldown_seconds INTEGER NOT NULL DEFAULT 0
     -- Removed respects_tag_overrides BOOLEAN NOT NULL DEFAULT TRUE; not in model
 );
 
@@ -194,6 +204,7 @@ CREATE TABLE rule_initiators (
     operator TEXT DEFAULT '',
     value NUMERIC DEFAULT 0,
     value2 NUMERIC,
+    hysteresis NUMERIC,
     schedule_type TEXT,
     schedule_value TEXT
 );
@@ -253,7 +264,7 @@ CREATE TABLE group_tags (
 CREATE INDEX idx_groups_parent_id ON groups(parent_id);
 CREATE INDEX idx_schedule_conditions_schedule_id ON schedule_conditions(schedule_id);
 CREATE INDEX idx_schedule_conditions_group_id ON schedule_conditions(group_id);
-CREATE INDEX idx_group_events_group_id ON group_events(group_id);
+CREATE INDEX idx_group_events_group_id_date ON group_events(group_id, event_date, event_table_id);
 CREATE INDEX idx_rules_rule_set_id ON rules(rule_set_id);
 CREATE INDEX idx_rule_initiators_rule_id ON rule_initiators(rule_id);
 CREATE INDEX idx_rule_actions_rule_id ON rule_actions(rule_id);
@@ -261,6 +272,7 @@ CREATE INDEX idx_session_auth_client_id ON session_auth(client_id);
 CREATE INDEX idx_session_auth_session_end ON session_auth(session_end);
 CREATE INDEX idx_sensors_client_id ON sensors(client_id);
 CREATE INDEX idx_sensors_group_id ON sensors(group_id);
+CREATE INDEX idx_sensors_group_measurement_time ON sensors(group_id, measurement, last_reading_time);
 CREATE INDEX idx_schedule_assigned_groups_group_id ON schedule_assigned_groups(group_id);
 CREATE INDEX idx_ruleset_rules_rule_id ON ruleset_rules(rule_id);
 -- Removed idx_rule_specific_groups_group_id as table is removed
@@ -278,6 +290,7 @@ CREATE INDEX idx_rules_is_active ON rules(is_active);
 CREATE INDEX idx_rule_actions_action_type ON rule_actions(action_type);
 CREATE INDEX idx_rule_initiators_type ON rule_initiators(type);
 CREATE INDEX idx_jwt_blocklist_jti ON jwt_blocklist(jti);
+CREATE INDEX idx_jwt_blocklist_expires_at ON jwt_blocklist(expires_at);
 
 
 -- ========= PRIVILEGES for client_modifier in clients_system =========
@@ -288,6 +301,36 @@ GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO client_modifier;
 ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL PRIVILEGES ON TABLES TO client_modifier;
 ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL PRIVILEGES ON SEQUENCES TO client_modifier;
 
+-- ========= PRIVILEGES for partition_maintainer in clients_system =========
+-- partition_maintainer owns group_events and creates, detaches and drops its partitions,
+-- client_modifier keeps reading and writing rows
+GRANT USAGE, CREATE ON SCHEMA public TO partition_maintainer;
+GRANT REFERENCES ON groups TO partition_maintainer;
+ALTER TABLE group_events OWNER TO partition_maintainer;
+ALTER TABLE group_events_default OWNER TO partition_maintainer;
+GRANT SELECT, INSERT, UPDATE, DELETE ON group_events, group_events_default TO client_modifier;
+GRANT USAGE, SELECT ON SEQUENCE group_events_event_table_id_seq TO client_modifier;
+ALTER DEFAULT PRIVILEGES FOR ROLE partition_maintainer IN SCHEMA public
+    GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO client_modifier;
+
+-- Partitions of current month and GROUP_EVENTS_PREMAKE_MONTHS (3) ahead, later ones
+-- are created by the celery maintenance task
+DO $$
+DECLARE
+    month DATE;
+    name TEXT;
+BEGIN
+    FOR month IN SELECT generate_series(date_trunc('month', now() AT TIME ZONE 'UTC'),
+                                        date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+                                        interval '1 month')::date
+    LOOP
+        name := 'group_events_p' || to_char(month, 'YYYYMM');
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF group_events FOR VALUES FROM (%L) TO (%L)',
+                       name, month, (month + interval '1 month')::date);
+        EXECUTE format('ALTER TABLE %I OWNER TO partition_maintainer', name);
+    END LOOP;
+END $$;
+
 
 -- #############################################################################
 -- #                       AUDIO_SYSTEM Database Objects                       #